@@ -1,22 +1,59 @@
-from fastapi import FastAPI, Query, UploadFile, Body
+from fastapi import FastAPI, Query, UploadFile, Body, Request, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-
-from typing import Any
-
-from api.config import DEFAULT_MANMAN
-from ontology import Graph
+from fastapi.responses import StreamingResponse
+
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+import asyncio
+import json
+import os
+import traceback
+
+from api.config import ManMan, StartupStep, get_manman
+from api.disconnect import cancel_on_disconnect
+from ontology import Graph, OntologyManager
+from sparql_client import paginate_query
 from explorative.exp_model import (
     SparqlQuery,
+    SparqlStreamFormat,
     Topic,
 )
 from api.router.classes import classes_router
 from api.router.nlp_helper import nlp_router
 
 
-
-manman = DEFAULT_MANMAN
-
-app = FastAPI(title="Ontology Provenance API", version="0.1.0")
+async def start_llm_workers(manman: ManMan):
+    try:
+        await manman.aget("llm_workers")
+    except Exception as e:
+        print(traceback.format_exc())
+        print("Failed to start the LLM workers", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # services are created on first use; PRELOAD_SERVICES ("all" or a comma
+    # separated list of service names) warms them up in the background instead
+    manman = get_manman()
+    preload = os.getenv("PRELOAD_SERVICES", "")
+    warmup = None
+    if preload != "":
+        names = None if preload == "all" else [n.strip() for n in preload.split(",")]
+        warmup = asyncio.create_task(asyncio.to_thread(manman.preload, names))
+    # started with the app, so jobs queued before a restart are picked up without
+    # waiting for the next query
+    workers = None
+    if manman.db_config.llm_workers > 0:
+        workers = asyncio.create_task(start_llm_workers(manman))
+    yield
+    for task in [warmup, workers]:
+        if task is not None and not task.done():
+            task.cancel()
+    await manman.aclose()
+
+
+app = FastAPI(title="Ontology Provenance API", version="0.1.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -27,35 +64,122 @@ app.add_middleware(
 
 
 @app.get("/")
-def read_root():
+async def read_root():
     return "Welcome to the Ontology Provenance API"
 
 
+@app.get("/management/startup")
+async def get_startup_report(
+    manman: ManMan = Depends(get_manman),
+) -> list[StartupStep]:
+    return manman.startup_report
+
+
 @app.post("/sparql")
-def sparql_query(query: SparqlQuery = Body(...)) -> list[dict[str, Any]]:
-    return manman.ontology_manager.q_to_df_values(query.query).to_dict(orient="records")
+async def sparql_query(
+    request: Request,
+    query: SparqlQuery = Body(...),
+    manman: ManMan = Depends(get_manman),
+) -> list[dict[str, Any]]:
+    oman = await manman.aget("ontology_manager")
+    df = await cancel_on_disconnect(
+        request,
+        oman.aq_to_df_values(paginate_query(query.query, query.limit, query.skip)),
+    )
+    return df.to_dict(orient="records")
 
 
 @app.get("/sparql")
-def sparql_query_get(query: str = Query(...)) -> dict[str, Any]:
-    data = manman.ontology_manager.q_to_df_values(query).to_dict(orient="records")
-    return {"results": {"bindings": data}}
+async def sparql_query_get(
+    request: Request, query: str = Query(...), manman: ManMan = Depends(get_manman)
+) -> dict[str, Any]:
+    oman = await manman.aget("ontology_manager")
+    df = await cancel_on_disconnect(request, oman.aq_to_df_values(query))
+    return {"results": {"bindings": df.to_dict(orient="records")}}
+
+
+def json_records(df) -> list[str]:
+    # unbound numeric cells are NaN in the frame, which is not valid JSON
+    rows = df.astype(object).where(df.notna(), None).to_dict(orient="records")
+    return [json.dumps(row, default=str) for row in rows]
+
+
+async def stream_bindings(
+    oman: OntologyManager, query: str, format: SparqlStreamFormat
+) -> AsyncIterator[str]:
+    frames = oman.astream_df_values(query)
+    if format == SparqlStreamFormat.NDJSON:
+        async for df in frames:
+            yield "".join(row + "\n" for row in json_records(df))
+        return
+    # same envelope as GET /sparql, with the bindings written as they arrive
+    df = await anext(frames)
+    head = json.dumps({"vars": list(df.columns)})
+    yield f'{{"head": {head}, "results": {{"bindings": ['
+    separator = ""
+    while df is not None:
+        rows = json_records(df)
+        if len(rows) > 0:
+            yield separator + ", ".join(rows)
+            separator = ", "
+        df = await anext(frames, None)
+    yield "]}}"
+
+
+STREAM_MEDIA_TYPES = {
+    SparqlStreamFormat.NDJSON: "application/x-ndjson",
+    SparqlStreamFormat.SPARQL_JSON: "application/sparql-results+json",
+}
+
+
+@app.post("/sparql/stream")
+async def sparql_query_stream(
+    query: SparqlQuery = Body(...),
+    format: SparqlStreamFormat = Query(SparqlStreamFormat.NDJSON),
+    manman: ManMan = Depends(get_manman),
+) -> StreamingResponse:
+    oman = await manman.aget("ontology_manager")
+    # the response is cancelled by starlette when the client disconnects
+    return StreamingResponse(
+        stream_bindings(
+            oman, paginate_query(query.query, query.limit, query.skip), format
+        ),
+        media_type=STREAM_MEDIA_TYPES[format],
+    )
+
+
+@app.get("/sparql/stream")
+async def sparql_query_stream_get(
+    query: str = Query(...),
+    format: SparqlStreamFormat = Query(SparqlStreamFormat.SPARQL_JSON),
+    manman: ManMan = Depends(get_manman),
+) -> StreamingResponse:
+    oman = await manman.aget("ontology_manager")
+    return StreamingResponse(
+        stream_bindings(oman, query, format), media_type=STREAM_MEDIA_TYPES[format]
+    )
 
 
 @app.post("/management/ontology")
-def load_ontology(
+async def load_ontology(
     ontology: UploadFile,
+    manman: ManMan = Depends(get_manman),
 ):
-    brainteaser_graph = Graph().parse(ontology.file, format="turtle")
+    brainteaser_graph = await run_in_threadpool(
+        Graph().parse, ontology.file, format="turtle"
+    )
     for prefix in manman.db_config.ttl_prefixes:
         brainteaser_graph.bind(prefix.ttl_prefix, prefix.uri)
     return {"ontology": ontology.filename, "prefixes": manman.db_config.ttl_prefixes}
 
 
 @app.get("/topics/root")
-def get_topics_root(force_initialize: bool = Query(False)) -> Topic:
+async def get_topics_root(
+    force_initialize: bool = Query(False), manman: ManMan = Depends(get_manman)
+) -> Topic:
+    guidance_man = await manman.aget("guidance_man")
     # guidance_man.initialize_topics(force_initialize)
-    return manman.guidance_man.get_topic_tree()
+    return await run_in_threadpool(guidance_man.get_topic_tree)
 
 app.include_router(classes_router)
 app.include_router(nlp_router)
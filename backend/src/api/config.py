@@ -1,19 +1,19 @@
-from fastapi.middleware.cors import CORSMiddleware
+from __future__ import annotations
 
-from typing import Any
+from functools import wraps
+from typing import TYPE_CHECKING, Any, Callable
+import asyncio
+import threading
+import time
+import traceback
+import os
+
+from pydantic import BaseModel, Field
 from rdflib.plugins.stores.sparqlstore import SPARQLStore
 
-from ontology import OntologyManager, OntologyConfig, Graph, InstanceQuery
-from datasetmatcher import DatasetManager
-from explorative.explorative_support import GuidanceManager
-from explorative.exp_model import (
-    SparqlQuery,
-    Topic,
-    SubjectLinkDB,
-    FuzzyQuery,
-    FuzzyQueryResults,
-)
-from explorative.llm_query import LLMQuery, QueryProgress, EnrichedEntitiesRelations
+from ontology import OntologyManager, OntologyConfig, Graph
+from ontology_cache import OntologyCache
+from sparql_client import AsyncSparqlClient
 from eval_config import (
     BTO_CONFIGS,
     DBPEDIA_CONFIGS,
@@ -21,28 +21,85 @@ from eval_config import (
     DNB_CONFIGS,
     GUTBRAINIE_CONFIGS,
     ALL_CONFIG_MAP,
+    EmbeddingBackend,
 )
-from initiator import InitatorManager
-from assistant.model import QueryGraph, Operations
-from assistant.iterative_assistant import IterativeAssistant
 from redis_cache import RedisCache
-from sqlalchemy.orm import Session
 
-from sklearn.manifold import TSNE, MDS
-from sklearn.decomposition import PCA
-import numpy as np
-import os
+if TYPE_CHECKING:
+    # these pull in torch, sentence-transformers and llama.cpp, so they are only
+    # imported once the service is first used
+    from datasetmatcher import DatasetManager
+    from explorative.explorative_support import GuidanceManager
+    from explorative.llm_query import LLMQuery
+    from job_queue import JobWorkers
+    from initiator import InitatorManager
+    from assistant.iterative_assistant import IterativeAssistant
 
 
 base_path = "../../data"
 onto_path = f"{base_path}/hero-ontology/hereditary_clinical.ttl"
 
 
+class StartupStep(BaseModel):
+    service: str = Field(..., description="Name of the initialised service")
+    seconds: float = Field(
+        ..., description="Time to initialise, including services it depends on"
+    )
+    ok: bool = Field(True)
+    error: str | None = Field(None)
+
+
+def service(fn: Callable) -> property:
+    """
+    Declares a lazily created service of `ManMan`.
+    The service is built on first access (once, also under concurrent access) and
+    its initialisation time is added to the startup report.
+    """
+    name = fn.__name__
+
+    @wraps(fn)
+    def getter(self: ManMan):
+        if name in self.services:
+            return self.services[name]
+        with self.services_lock:
+            if name not in self.services:
+                start = time.perf_counter()
+                try:
+                    self.services[name] = fn(self)
+                except Exception as e:
+                    self.startup_report.append(
+                        StartupStep(
+                            service=name,
+                            seconds=time.perf_counter() - start,
+                            ok=False,
+                            error=str(e),
+                        )
+                    )
+                    raise
+                self.startup_report.append(
+                    StartupStep(service=name, seconds=time.perf_counter() - start)
+                )
+        return self.services[name]
+
+    getter.is_service = True
+    return property(getter)
+
+
 class ManMan:
+    """
+    Service container of the API.
+    Constructing it only reads the configuration; every service is created on
+    first use, so a worker boots without reaching the SPARQL endpoint, Postgres,
+    Redis or loading models.
+    """
+
     def __init__(self, config_name: str = "dbpedia", idx: int = -2):
         self.db_config = None
         self.config_name = config_name
         self.idx = idx
+        self.services: dict[str, object] = {}
+        self.services_lock = threading.RLock()
+        self.startup_report: list[StartupStep] = []
 
         db_config = ALL_CONFIG_MAP["gutbrainie"][-2]
         # db_config = GUTBRAINIE_CONFIGS[1]
@@ -56,17 +113,66 @@ class ManMan:
         db_config.redis_cache_url = os.getenv(
             "REDIS_CACHE_URL", db_config.redis_cache_url
         )
+        db_config.embedding_cache_shared = (
+            os.getenv("EMBEDDING_CACHE_SHARED", "1") == "1"
+        )
+        db_config.grammar_cache_shared = os.getenv("GRAMMAR_CACHE_SHARED", "1") == "1"
+        db_config.embedding_backend = EmbeddingBackend(
+            os.getenv("EMBEDDING_BACKEND", db_config.embedding_backend)
+        )
+        # 0 for API workers that only queue, with the queries run elsewhere
+        db_config.llm_workers = int(os.getenv("LLM_WORKERS", db_config.llm_workers))
         print("Using DB config:", db_config)
         self.db_config = db_config
-        
+
         self.base_path = base_path
         self.onto_path = onto_path
-        self.start_systems()
+
+    @classmethod
+    def service_names(cls) -> list[str]:
+        return [
+            name
+            for name, attr in vars(cls).items()
+            if isinstance(attr, property) and getattr(attr.fget, "is_service", False)
+        ]
+
+    def preload(self, names: list[str] | None = None):
+        """Initialises the given services (all if None) and prints the report."""
+        for name in names if names is not None else self.service_names():
+            try:
+                getattr(self, name)
+            except Exception as e:
+                print(traceback.format_exc())
+                print("Failed to initialise", name, e)
+        for step in self.startup_report:
+            print(
+                f"{step.service}: {step.seconds:.2f}s",
+                "" if step.ok else f"failed ({step.error})",
+            )
 
     def start_systems(self):
-        db_config = self.db_config
-        self.store = SPARQLStore(
-            db_config.sparql_endpoint,
+        self.preload()
+
+    async def aget(self, name: str) -> Any:
+        """Service by name, built in a worker thread if it does not exist yet."""
+        if name in self.services:
+            return self.services[name]
+        return await asyncio.to_thread(getattr, self, name)
+
+    async def aclose(self):
+        if "llm_workers" in self.services:
+            await asyncio.to_thread(self.llm_workers.close, 5.0)
+        if "llm_query" in self.services:
+            await self.llm_query.events.aclose()
+        if "sparql_client" in self.services:
+            await self.sparql_client.aclose()
+        if "guidance_man" in self.services:
+            self.guidance_man.embedder.close()
+
+    @service
+    def store(self) -> SPARQLStore:
+        return SPARQLStore(
+            self.db_config.sparql_endpoint,
             method="POST_FORM",
             params={"infer": False, "sameAs": False},
             timeout=300,
@@ -79,37 +185,121 @@ class ManMan:
         #         "Authorization": "GDB eyJ1c2VybmFtZSI6ImJlbmVkaWt0LmthbnR6IiwiYXV0aGVudGljYXRlZEF0IjoxNzMzODMxOTk3NTIzfQ==.QqebiiJt752/OThRujrJyNg0XXKrrteU7MhNPUCoSBI="
         #     },
         # )
-        self.graph = Graph(store=self.store)
 
-        self.config = OntologyConfig()
+    @service
+    def graph(self) -> Graph:
+        return Graph(store=self.store)
+
+    @service
+    def sparql_client(self) -> AsyncSparqlClient:
+        return AsyncSparqlClient(
+            self.db_config.sparql_endpoint,
+            namespace_manager=self.graph.namespace_manager,
+            params={"infer": False, "sameAs": False},
+            timeout=float(os.getenv("SPARQL_TIMEOUT", 300)),
+            max_connections=int(os.getenv("SPARQL_MAX_CONNECTIONS", 64)),
+            max_keepalive_connections=int(os.getenv("SPARQL_MAX_KEEPALIVE", 16)),
+            retries=int(os.getenv("SPARQL_RETRIES", 3)),
+        )
+
+    @service
+    def config(self) -> OntologyConfig:
+        return OntologyConfig(
+            snapshot_dir=os.getenv("CLASS_TREE_SNAPSHOT_DIR", f"{base_path}/snapshots")
+        )
+
+    @service
+    def ontology_cache(self) -> OntologyCache:
+        return OntologyCache(
+            max_items=int(os.getenv("ONTOLOGY_CACHE_ITEMS", 100_000)),
+            max_bytes=int(os.getenv("ONTOLOGY_CACHE_BYTES", 256 * 1024 * 1024)),
+            ttl=float(os.getenv("ONTOLOGY_CACHE_TTL", 24 * 60 * 60)),
+            redis_cache=(
+                RedisCache(redis_url=self.db_config.redis_cache_url)
+                if os.getenv("ONTOLOGY_CACHE_SHARED", "1") == "1"
+                else None
+            ),
+        )
+
+    @service
+    def ontology_manager(self) -> OntologyManager:
+        ontology_manager = OntologyManager(
+            self.config,
+            self.graph,
+            cache=self.ontology_cache,
+            sparql_client=self.sparql_client,
+        )
+        # the ontology hash is a SPARQL query, resolved here instead of on the event
+        # loop by the first cached lookup
+        ontology_manager.identifier
+        return ontology_manager
 
-        self.ontology_manager = OntologyManager(self.config, self.graph)
-        self.dataset_manager = DatasetManager(self.ontology_manager)
+    @service
+    def dataset_manager(self) -> DatasetManager:
+        from datasetmatcher import DatasetManager
+
+        return DatasetManager(self.ontology_manager)
         # dataset_manager.initialise(glob_path="data/datasets/ALS/**/*.csv")
 
-        # ontology_manager.load_full_graph()
+    @service
+    def guidance_man(self) -> GuidanceManager:
+        from explorative.explorative_support import GuidanceManager
 
-        self.guidance_man = GuidanceManager(
+        # ontology_manager.load_full_graph()
+        return GuidanceManager(
             self.ontology_manager,
-            conn_str=db_config.conn_str,
-            llm_model_id=db_config.model_id,
+            conn_str=self.db_config.conn_str,
+            llm_model_id=self.db_config.model_id,
+            search_config=self.db_config,
         )
         # topic_man.initialize_topics(force=False)
 
-        self.llm_query = LLMQuery(
-            topic=self.guidance_man, redis_url=db_config.redis_cache_url
+    @service
+    def llm_query(self) -> LLMQuery:
+        from explorative.llm_query import LLMQuery
+
+        return LLMQuery(
+            topic=self.guidance_man, redis_url=self.db_config.redis_cache_url
+        )
+
+    @service
+    def llm_workers(self) -> JobWorkers:
+        from job_queue import JobWorkers
+
+        workers = JobWorkers(
+            self.llm_query.jobs, self.llm_query.run_job, size=self.db_config.llm_workers
         )
+        workers.start()
+        return workers
 
-        self.initatior = InitatorManager()
-        self.initatior.register(self.guidance_man)
-        self.initatior.register(self.llm_query)
+    @service
+    def initatior(self) -> InitatorManager:
+        from initiator import InitatorManager
 
-        self.iterative_assistant = IterativeAssistant(guidance=self.guidance_man)
+        initatior = InitatorManager()
+        initatior.register(self.guidance_man)
+        initatior.register(self.llm_query)
+        return initatior
 
-        self.assistant_cache = RedisCache(
-            redis_url=db_config.redis_cache_url,
+    @service
+    def iterative_assistant(self) -> IterativeAssistant:
+        from assistant.iterative_assistant import IterativeAssistant
+
+        return IterativeAssistant(guidance=self.guidance_man)
+
+    @service
+    def assistant_cache(self) -> RedisCache:
+        from assistant.model import Operations
+
+        return RedisCache(
+            redis_url=self.db_config.redis_cache_url,
             model=Operations,
         )
 
 
 DEFAULT_MANMAN = ManMan()
+
+
+def get_manman() -> ManMan:
+    """FastAPI dependency for the service container."""
+    return DEFAULT_MANMAN
@@ -2,48 +2,66 @@ from fastapi import (
     APIRouter,
     Query,
     Body,
-    BackgroundTasks,
+    Depends,
+    Header,
+    Request,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator
+import json
+
+
+from api.config import ManMan, get_manman
+from api.disconnect import cancel_on_disconnect
+from model import (
+    GeneralizationQuery,
+    GraphLoadProgress,
+    Instance,
+    Property,
+    SparseOutLinks,
+    Subject,
+    SubjectLink,
 )
-
-
-from api.config import DEFAULT_MANMAN
-from model import GeneralizationQuery, Instance, Property, SparseOutLinks, Subject, SubjectLink
 from ontology import InstanceQuery
 from explorative.exp_model import (
     SubjectLinkDB,
     FuzzyQuery,
     FuzzyQueryResults,
 )
-from explorative.llm_query import QueryProgress, EnrichedEntitiesRelations
+# the models live in llm_query_gen, importing them from llm_query would load llama.cpp
+from explorative.llm_query_gen import QueryProgress, EnrichedEntitiesRelations
+from job_queue import JobLane, JobStatus
 from assistant.model import QueryGraph, Operations
 from sqlalchemy.orm import Session
 
-
-manman = DEFAULT_MANMAN
-
 classes_router = APIRouter(prefix="/classes")
 
 
 @classes_router.get("/outlinks")
-def get_outlinks(subject_id: str = Query()) -> SparseOutLinks:
-    if not hasattr(manman.dataset_manager, "engine"):
-        manman.dataset_manager.initialise(
-            glob_path=f"{manman.base_path}/datasets/ALS/**/*.csv"
+async def get_outlinks(
+    subject_id: str = Query(), manman: ManMan = Depends(get_manman)
+) -> SparseOutLinks:
+    dataset_manager = await manman.aget("dataset_manager")
+    if not hasattr(dataset_manager, "engine"):
+        await run_in_threadpool(
+            dataset_manager.initialise,
+            glob_path=f"{manman.base_path}/datasets/ALS/**/*.csv",
         )
-    return manman.dataset_manager.target_outlinks(subject_id)
+    return await run_in_threadpool(dataset_manager.target_outlinks, subject_id)
 
 
 @classes_router.get("/subjects")
-def get_subject(
+async def get_subject(
+    request: Request,
     subject_id: str = Query(),
+    manman: ManMan = Depends(get_manman),
 ) -> Subject | None:
-    return manman.ontology_manager.enrich_subject(subject_id)
+    oman = await manman.aget("ontology_manager")
+    return await cancel_on_disconnect(request, oman.aenrich_subject(subject_id))
 
 
-@classes_router.get("/links")
-def get_link(
-    link_id: str = Query(),
-) -> SubjectLink | None:
+def _get_link(manman: ManMan, link_id: str) -> SubjectLink | None:
     with Session(manman.guidance_man.engine) as session:
         link = (
             session.query(SubjectLinkDB)
@@ -55,47 +73,122 @@ def get_link(
         return link.from_db(oman=manman.ontology_manager)
 
 
+@classes_router.get("/links")
+async def get_link(
+    link_id: str = Query(),
+    manman: ManMan = Depends(get_manman),
+) -> SubjectLink | None:
+    return await run_in_threadpool(_get_link, manman, link_id)
+
+
 @classes_router.post("/search")
-def search_classes(
+async def search_classes(
     q: FuzzyQuery = Body(FuzzyQuery()),
+    manman: ManMan = Depends(get_manman),
 ) -> FuzzyQueryResults:
-    return manman.guidance_man.search_fuzzy(q)
+    guidance_man = await manman.aget("guidance_man")
+    return await run_in_threadpool(guidance_man.search_fuzzy, q)
 
 
 @classes_router.get("/relations")
-def get_relations(
+async def get_relations(
     q: str | None = Query(None),
     from_id: str | None = Query(None),
     to_id: str | None = Query(None),
+    manman: ManMan = Depends(get_manman),
 ) -> list[SubjectLink]:
-    return manman.guidance_man.search_links(q, from_id, to_id)
+    guidance_man = await manman.aget("guidance_man")
+    return await run_in_threadpool(guidance_man.search_links, q, from_id, to_id)
 
 
 @classes_router.get("/search/llm")
-def get_llm_results(
-    background_tasks: BackgroundTasks,
+async def get_llm_results(
     q: str = Query("working field of person"),
+    lane: JobLane = Query(JobLane.INTERACTIVE),
+    manman: ManMan = Depends(get_manman),
 ) -> QueryProgress:
-    return manman.llm_query.start_query(q, background_tasks)
+    llm_query = await manman.aget("llm_query")
+    # the workers of this process, others may also pick the query up
+    await manman.aget("llm_workers")
+    return await run_in_threadpool(llm_query.start_query, q, lane)
 
 
 @classes_router.get("/search/llm/running")
-def get_llm_results_running(
+async def get_llm_results_running(
     query_id: str = Query(),
+    manman: ManMan = Depends(get_manman),
 ) -> QueryProgress | None:
-    return manman.llm_query.query_progress(query_id)
+    llm_query = await manman.aget("llm_query")
+    return await run_in_threadpool(llm_query.query_progress, query_id)
+
+
+FINISHED_STATUSES = {JobStatus.DONE, JobStatus.FAILED, JobStatus.CANCELLED}
+
+
+async def stream_progress(
+    llm_query: Any, query_id: str, last_event_id: str
+) -> AsyncIterator[str]:
+    while True:
+        events = await llm_query.events.aread(query_id, last_event_id)
+        if len(events) == 0:
+            # a job can also end without its status event, e.g. an expired lease
+            job = await run_in_threadpool(llm_query.jobs.get, query_id)
+            if job is None:
+                data = json.dumps({"status": "unknown", "message": "No such query"})
+                yield f"event: status\ndata: {data}\n\n"
+                return
+            if job.status in FINISHED_STATUSES:
+                data = json.dumps(
+                    {"status": job.status.value, "message": job.error or ""}
+                )
+                yield f"event: status\ndata: {data}\n\n"
+                return
+            yield ": keepalive\n\n"
+            continue
+        for event_id, event, data in events:
+            yield f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+            last_event_id = event_id
+            if event == "status":
+                return
+
+
+@classes_router.get("/search/llm/stream")
+async def stream_llm_results(
+    query_id: str = Query(),
+    last_event_id: str | None = Header(None),
+    manman: ManMan = Depends(get_manman),
+) -> StreamingResponse:
+    """
+    Server-sent events of a query: "progress" headers, each "step" once with its
+    index in `relations_steps`, the LLM "token"s and a final "status".
+    A reconnecting EventSource sends Last-Event-ID and resumes after it.
+    """
+    llm_query = await manman.aget("llm_query")
+    return StreamingResponse(
+        stream_progress(llm_query, query_id, last_event_id or "0"),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@classes_router.delete("/search/llm/running")
+async def cancel_llm_results_running(
+    query_id: str = Query(),
+    manman: ManMan = Depends(get_manman),
+) -> QueryProgress | None:
+    llm_query = await manman.aget("llm_query")
+    return await run_in_threadpool(llm_query.cancel_query, query_id)
 
 
 @classes_router.get("/search/llm/examples")
-def get_llm_examples() -> list[EnrichedEntitiesRelations]:
-    return manman.llm_query.get_examples()
+async def get_llm_examples(
+    manman: ManMan = Depends(get_manman),
+) -> list[EnrichedEntitiesRelations]:
+    llm_query = await manman.aget("llm_query")
+    return await run_in_threadpool(llm_query.get_examples)
 
 
-@classes_router.post("/search/assistant")
-def get_assistant_results(
-    q: str = Query("working field of person"),
-    graph: QueryGraph = Body(...),
-) -> Operations:
+def _get_assistant_results(manman: ManMan, q: str, graph: QueryGraph) -> Operations:
     key = f"{q}_{graph.model_dump_json()}"
     cache = manman.assistant_cache[key]
     if cache:
@@ -106,44 +199,84 @@ def get_assistant_results(
         return operations
 
 
+@classes_router.post("/search/assistant")
+async def get_assistant_results(
+    q: str = Query("working field of person"),
+    graph: QueryGraph = Body(...),
+    manman: ManMan = Depends(get_manman),
+) -> Operations:
+    return await run_in_threadpool(_get_assistant_results, manman, q, graph)
+
+
 @classes_router.get("/full")
-def get_full_classes() -> list[Subject]:
-    roots = manman.ontology_manager.get_full_classes()
+async def get_full_classes(manman: ManMan = Depends(get_manman)) -> list[Subject]:
+    oman = await manman.aget("ontology_manager")
+    roots = await run_in_threadpool(oman.get_full_classes)
     return roots
 
 
+@classes_router.get("/full/progress")
+async def get_full_classes_progress(
+    manman: ManMan = Depends(get_manman),
+) -> GraphLoadProgress:
+    oman = await manman.aget("ontology_manager")
+    return oman.load_progress
+
+
 @classes_router.get("/roots")
-def get_root_classes() -> list[Subject]:
-    return manman.ontology_manager.get_root_classes()
+async def get_root_classes(manman: ManMan = Depends(get_manman)) -> list[Subject]:
+    oman = await manman.aget("ontology_manager")
+    return await run_in_threadpool(oman.get_root_classes)
 
 
 @classes_router.get("/subclasses")
-def get_class(cls: str = Query()) -> list[Subject]:
-    return manman.ontology_manager.get_subclasses(cls)
+async def get_class(
+    request: Request, cls: str = Query(), manman: ManMan = Depends(get_manman)
+) -> list[Subject]:
+    oman = await manman.aget("ontology_manager")
+    return await cancel_on_disconnect(request, oman.aget_subclasses(cls))
 
 
 @classes_router.post("/subclasses/search")
-def get_class_search(q: FuzzyQuery = Body(FuzzyQuery())) -> FuzzyQueryResults:
-    return manman.guidance_man.search_subclasses(q)
+async def get_class_search(
+    q: FuzzyQuery = Body(FuzzyQuery()), manman: ManMan = Depends(get_manman)
+) -> FuzzyQueryResults:
+    guidance_man = await manman.aget("guidance_man")
+    return await run_in_threadpool(guidance_man.search_subclasses, q)
 
 
 @classes_router.post("/parents/most_generic")
-def get_most_generics(
+async def get_most_generics(
     q: GeneralizationQuery = Body(GeneralizationQuery()),
+    manman: ManMan = Depends(get_manman),
 ) -> Subject:
-    return manman.ontology_manager.get_most_generic_classes(q)
+    oman = await manman.aget("ontology_manager")
+    return await run_in_threadpool(oman.get_most_generic_classes, q)
 
 
 @classes_router.get("/instances")
-def get_named_instance(cls: str = Query()) -> list[Subject]:
-    return manman.ontology_manager.get_named_individuals(cls)
+async def get_named_instance(
+    request: Request, cls: str = Query(), manman: ManMan = Depends(get_manman)
+) -> list[Subject]:
+    oman = await manman.aget("ontology_manager")
+    return await cancel_on_disconnect(request, oman.aget_named_individuals(cls))
 
 
 @classes_router.get("/instances/search")
-def get_named_instance_search(query: InstanceQuery = Query()) -> list[Instance]:
-    return manman.ontology_manager.get_instances(query)
+async def get_named_instance_search(
+    request: Request,
+    query: InstanceQuery = Query(),
+    manman: ManMan = Depends(get_manman),
+) -> list[Instance]:
+    oman = await manman.aget("ontology_manager")
+    return await cancel_on_disconnect(request, oman.aget_instances(query))
 
 
 @classes_router.get("/instances/properties")
-def get_named_instance_properties(instance_id: str = Query()) -> dict[str, Property]:
-    return manman.ontology_manager.outgoing_edges_for(instance_id)
+async def get_named_instance_properties(
+    request: Request,
+    instance_id: str = Query(),
+    manman: ManMan = Depends(get_manman),
+) -> dict[str, Property]:
+    oman = await manman.aget("ontology_manager")
+    return await cancel_on_disconnect(request, oman.aoutgoing_edges_for(instance_id))
@@ -1,26 +1,28 @@
 import enum
 from typing import Any
-from fastapi import APIRouter, Body, Query
+from fastapi import APIRouter, Body, Depends, Query
 from pydantic import BaseModel
-from sklearn.base import BaseEstimator
-from sklearn.decomposition import PCA
-from sklearn.metrics import pairwise_distances
-from sklearn.manifold import MDS, TSNE, smacof
 import numpy as np
 
-from api.config import DEFAULT_MANMAN
-
-manman = DEFAULT_MANMAN
+from api.config import ManMan, get_manman
+from explorative.embedding_service import EmbeddingMetrics
 
 nlp_router = APIRouter(prefix="/nlp")
 
 
 @nlp_router.get("/embeddings")
-def nlp_embeddings(query: str = Query(...)) -> dict[str, Any]:
-    data = manman.guidance_man.embedding_model.encode([query]).squeeze().tolist()
+def nlp_embeddings(
+    query: str = Query(...), manman: ManMan = Depends(get_manman)
+) -> dict[str, Any]:
+    data = manman.guidance_man.embedder.encode([query]).squeeze().tolist()
     return {"embedding": data}
 
 
+@nlp_router.get("/embeddings/metrics")
+def nlp_embeddings_metrics(manman: ManMan = Depends(get_manman)) -> EmbeddingMetrics:
+    return manman.guidance_man.embedder.metrics()
+
+
 class ManifoldAlg(str, enum.Enum):
     TSNE = "TSNE"
     MDS = "MDS"
@@ -47,12 +49,15 @@ class ClosestResponse(BaseModel):
 
 
 @nlp_router.post("/embeddings/closest")
-def nlp_embeddings_closest(request: ClosestRequest) -> list[ClosestResponse]:
+def nlp_embeddings_closest(
+    request: ClosestRequest, manman: ManMan = Depends(get_manman)
+) -> list[ClosestResponse]:
+    # sklearn takes about a second to import, so it is loaded on first use
+    from sklearn.metrics import pairwise_distances
+
     if request.query is not None:
         embedding = (
-            manman.guidance_man.embedding_model.encode([request.query])
-            .squeeze()
-            .tolist()
+            manman.guidance_man.embedder.encode([request.query]).squeeze().tolist()
         )
     elif request.embedding is not None:
         embedding = request.embedding
@@ -76,7 +81,7 @@ def nlp_embeddings_closest(request: ClosestRequest) -> list[ClosestResponse]:
     return closest
 
 
-class SMACOF(BaseEstimator):
+class SMACOF:
     def __init__(
         self, n_components=2, n_init=1, dissimilarity="precomputed", random_state=None
     ):
@@ -94,6 +99,8 @@ class SMACOF(BaseEstimator):
             for i in range(X.shape[0]):
                 rs = np.random.RandomState(seed=i)
                 init_pos[i, :] = rs.rand(self.n_components)
+        from sklearn.manifold import smacof
+
         return smacof(
             X,
             n_components=self.n_components,
@@ -104,6 +111,10 @@ class SMACOF(BaseEstimator):
 
 @nlp_router.post("/embeddings/manifold")
 def nlp_embeddings_manifold(request: ManifoldRequest = Body(...)) -> list[list[float]]:
+    from sklearn.decomposition import PCA
+    from sklearn.manifold import MDS, TSNE
+    from sklearn.metrics import pairwise_distances
+
     embeddings = request.embeddings
     n_out = request.n_out
     alg = request.alg
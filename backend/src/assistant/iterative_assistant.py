@@ -1,4 +1,5 @@
 from explorative.explorative_support import GuidanceManager
+from explorative.grammar_cache import GrammarCache
 from assistant.model import (
     QueryGraph,
     Operation,
@@ -16,11 +17,8 @@ from assistant.model import (
     DateSubQuery,
 )
 from pydantic import create_model, Field, BaseModel
-from llama_cpp.llama import Llama, LlamaGrammar, ChatCompletionMessage
+from llama_cpp.llama import Llama, ChatCompletionMessage
 
-from llama_cpp_agent.gbnf_grammar_generator.gbnf_grammar_from_pydantic_models import (
-    generate_gbnf_grammar_from_pydantic_models,
-)
 from explorative.exp_model import (
     FuzzyQuery,
     RETURN_TYPE,
@@ -102,16 +100,12 @@ class IterativeAssistant:
         {graph.model_dump_json()}
         {query}
         """
-        grammar_constrained = LlamaGrammar.from_string(
-            generate_gbnf_grammar_from_pydantic_models(
-                [Operations],
-                "Operations",
-                add_inner_thoughts=False,
-            )
+        _, grammar_constrained = self.guidance.grammars.get(
+            GrammarCache.signature("Operations"), lambda: Operations
         )
         messages = self.few_shot_messages
         messages.append({"role": "user", "content": full_query})
-        response = self.guidance.llama_model.create_chat_completion(
+        response = self.guidance.chat_completion(
             grammar=grammar_constrained,
             messages=messages,
             max_tokens=self.max_tokens,
@@ -381,7 +375,7 @@ class IterativeAssistant:
                 data_model = data_model | subject_model
         return data_model
 
-    def __build_constrained_model_from_graph(self, graph: QueryGraph):
+    def __allowed_ids_from_graph(self, graph: QueryGraph):
         # Build the model based on the candidate operations
         allowed_subject_ids: set[str] = set()
         allowed_link_ids: set[tuple[str, str, str]] = set()
@@ -399,14 +393,14 @@ class IterativeAssistant:
                 )
             )
 
-        return self.__build_constrained_model_from_allowed_ids(
+        return dict(
             allowed_subject_ids=allowed_subject_ids,
             allowed_link_ids=allowed_link_ids,
             allowed_subquery_ids=allowed_subquery_ids,
             allowed_internal_ids=allowed_internal_ids,
         )
 
-    def __build_constrained_model(self, candidate_ops: Operations, graph: QueryGraph):
+    def __allowed_ids(self, candidate_ops: Operations, graph: QueryGraph):
         print(candidate_ops)
         # Build the model based on the candidate operations
         allowed_subject_ids: set[str] = set()
@@ -432,16 +426,24 @@ class IterativeAssistant:
                         candidate_op.data.field,
                     )
                 )
-        # Generate the grammar based on the allowed operations
-        data_model = self.__build_constrained_model_from_allowed_ids(
+        if (
+            len(allowed_subject_ids) == 0
+            and len(allowed_link_ids) == 0
+            and len(allowed_subquery_ids) == 0
+        ):
+            # without candidates, we constrain on the existing graph
+            print("Constraining on the existing graph...")
+            return self.__allowed_ids_from_graph(graph)
+        return dict(
             allowed_subject_ids=allowed_subject_ids,
             allowed_link_ids=allowed_link_ids,
             allowed_subquery_ids=allowed_subquery_ids,
+            allowed_internal_ids=None,
         )
-        if data_model is None:
-            # if the data model is None, we constrain on the existing graph
-            print("Constraining on the existing graph...")
-            data_model = self.__build_constrained_model_from_graph(graph)
+
+    def __build_constrained_model(self, allowed_ids: dict):
+        # Generate the grammar based on the allowed operations
+        data_model = self.__build_constrained_model_from_allowed_ids(**allowed_ids)
         constrained_operation_model = create_model(
             "ConstrainedOperation",
             **{
@@ -518,14 +520,11 @@ class IterativeAssistant:
     def __constrained_ops(
         self, query: str, graph: QueryGraph, candidate_ops: Operations
     ):
-        ConstrainedOperations = self.__build_constrained_model(candidate_ops, graph)
-        grammar_gbnf = generate_gbnf_grammar_from_pydantic_models(
-            [ConstrainedOperations],
-            "ConstrainedOperations",
-            add_inner_thoughts=False,
+        allowed_ids = self.__allowed_ids(candidate_ops, graph)
+        ConstrainedOperations, grammar_constrained = self.guidance.grammars.get(
+            GrammarCache.signature("ConstrainedOperations", **allowed_ids),
+            lambda: self.__build_constrained_model(allowed_ids),
         )
-        # print(grammar_gbnf)
-        grammar_constrained = LlamaGrammar.from_string(grammar_gbnf)
         full_query = f"""
         {graph.model_dump_json()}
         {query}
@@ -534,7 +533,7 @@ class IterativeAssistant:
         messages = self.few_shot_messages
         messages.append({"role": "user", "content": full_query})
 
-        response = self.guidance.llama_model.create_chat_completion(
+        response = self.guidance.chat_completion(
             grammar=grammar_constrained,
             messages=messages,
             max_tokens=self.max_tokens,
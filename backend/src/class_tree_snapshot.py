@@ -0,0 +1,166 @@
+import mmap
+import os
+import threading
+
+import msgpack
+
+from model import Subject
+
+SNAPSHOT_VERSION = 1
+RELATIONS = ["subClass", "namedIndividual"]
+
+
+class ClassTreeSnapshot:
+    """
+    On-disk copy of the full class tree of one ontology.
+    The tree is stored as an adjacency table (subject, parent node, relation) in
+    msgpack, with every distinct subject stored once. The file is memory-mapped
+    and decoded on first use.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__data: dict | None = None
+        self.__children: list[list[int]] | None = None
+        self.__node_for_subject: dict[str, int] | None = None
+
+    @staticmethod
+    def for_ontology(directory: str, identifier: str) -> "ClassTreeSnapshot":
+        return ClassTreeSnapshot(
+            os.path.join(directory, f"class_tree_{identifier}.msgpack")
+        )
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def save(self, roots: list[Subject]):
+        subjects: list[dict] = []
+        subject_idx: dict[tuple[str, str], int] = {}
+        node_subject: list[int] = []
+        node_parent: list[int] = []
+        node_relation: list[int] = []
+        node_expanded: list[bool] = []
+
+        level = [(root, -1, -1) for root in roots]
+        while len(level) > 0:
+            next_level = []
+            for subject, parent, relation in level:
+                key = (subject.subject_id, subject.subject_type)
+                if key not in subject_idx:
+                    subject_idx[key] = len(subjects)
+                    subjects.append(
+                        subject.model_dump(
+                            mode="json", exclude={"descendants", "total_descendants"}
+                        )
+                    )
+                node = len(node_subject)
+                node_subject.append(subject_idx[key])
+                node_parent.append(parent)
+                node_relation.append(relation)
+                node_expanded.append(len(subject.descendants) > 0)
+                for relation_name, descendants in subject.descendants.items():
+                    next_level.extend(
+                        (d, node, RELATIONS.index(relation_name)) for d in descendants
+                    )
+            level = next_level
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            msgpack.pack(
+                {
+                    "version": SNAPSHOT_VERSION,
+                    "subjects": subjects,
+                    "node_subject": node_subject,
+                    "node_parent": node_parent,
+                    "node_relation": node_relation,
+                    "node_expanded": node_expanded,
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
+        with self.__lock:
+            self.__data = None
+
+    def __load(self) -> dict | None:
+        with self.__lock:
+            if self.__data is not None:
+                return self.__data
+            if not self.exists():
+                return None
+            with open(self.path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    data = msgpack.unpackb(mapped, raw=False)
+            if data.get("version") != SNAPSHOT_VERSION:
+                print("Ignoring class tree snapshot with version", data.get("version"))
+                return None
+            children: list[list[int]] = [[] for _ in data["node_subject"]]
+            node_for_subject: dict[str, int] = {}
+            for node, (subject, parent) in enumerate(
+                zip(data["node_subject"], data["node_parent"])
+            ):
+                if parent >= 0:
+                    children[parent].append(node)
+                node_for_subject.setdefault(
+                    data["subjects"][subject]["subject_id"], node
+                )
+            self.__children = children
+            self.__node_for_subject = node_for_subject
+            self.__data = data
+            return data
+
+    def __subject(self, node: int, load_properties=True) -> Subject:
+        subject = Subject.model_validate(
+            self.__data["subjects"][self.__data["node_subject"][node]]
+        )
+        if not load_properties:
+            subject.properties = {}
+        return subject
+
+    def __tree(self, node: int) -> Subject:
+        subject = self.__subject(node)
+        subject.total_descendants = 1  # self
+        children = self.__children[node]
+        if self.__data["node_expanded"][node]:
+            subject.descendants = {
+                relation: [
+                    self.__tree(child)
+                    for child in children
+                    if RELATIONS[self.__data["node_relation"][child]] == relation
+                ]
+                for relation in RELATIONS
+            }
+        return subject
+
+    def __root_nodes(self) -> list[int]:
+        return [
+            node
+            for node, parent in enumerate(self.__data["node_parent"])
+            if parent < 0
+        ]
+
+    def full_tree(self) -> list[Subject] | None:
+        if self.__load() is None:
+            return None
+        return [self.__tree(node) for node in self.__root_nodes()]
+
+    def roots(self, load_properties=False) -> list[Subject] | None:
+        if self.__load() is None:
+            return None
+        return [
+            self.__subject(node, load_properties) for node in self.__root_nodes()
+        ]
+
+    def subclasses(self, cls: str, load_properties=False) -> list[Subject] | None:
+        """Direct subclasses of `cls`, or None if the snapshot does not contain it."""
+        if self.__load() is None or cls not in self.__node_for_subject:
+            return None
+        node = self.__node_for_subject[cls]
+        if not self.__data["node_expanded"][node]:
+            return None
+        return [
+            self.__subject(child, load_properties)
+            for child in self.__children[node]
+            if RELATIONS[self.__data["node_relation"][child]] == "subClass"
+        ]
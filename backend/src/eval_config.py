@@ -7,6 +7,23 @@ class SelectionDistribution(str, Enum):
     UNIFORM = "uniform"
 
 
+class VectorIndexMethod(str, Enum):
+    HNSW = "hnsw"
+    IVFFLAT = "ivfflat"
+
+
+class EmbeddingReduction(str, Enum):
+    TRUNCATE = "truncate"  # leading dimensions, stella is Matryoshka trained
+    PCA = "pca"
+
+
+class EmbeddingBackend(str, Enum):
+    TORCH = "torch"
+    TORCH_INT8 = "torch-int8"
+    ONNX = "onnx"
+    ONNX_INT8 = "onnx-int8"
+
+
 class EvalConfig(BaseModel):
     model_id: str = Field(
         "NousResearch/Hermes-3-Llama-3.1-8B-GGUF"
@@ -17,6 +34,35 @@ class EvalConfig(BaseModel):
     selection_distribution: SelectionDistribution = SelectionDistribution.INSTANCES
     model_quant: str = "*.Q8_0.gguf"
     redis_cache_url: str = "redis://localhost:6379/1"
+    # ANN indexes on the embedding columns, None for exact search
+    vector_index: VectorIndexMethod | None = VectorIndexMethod.HNSW
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 64
+    hnsw_ef_search: int = 100  # candidates per search, >= the result limit
+    # "relaxed_order" lets filtered searches fill their limit (pgvector >= 0.8)
+    hnsw_iterative_scan: str | None = None
+    ivfflat_lists: int | None = None  # derived from the row count if None
+    ivfflat_probes: int = 10
+    # embedding micro-batching, see explorative.embedding_service
+    embedding_max_batch_size: int = 32
+    embedding_max_wait_ms: float = 5.0
+    embedding_threads: int | None = None  # torch default if None
+    embedding_cache_items: int = 10_000
+    embedding_cache_shared: bool = False  # float16 copies in redis_cache_url
+    # int8 and ONNX backends run on the CPU, see explorative.embedding_backend
+    embedding_backend: EmbeddingBackend = EmbeddingBackend.TORCH
+    embedding_export_dir: str = "../../data/onnx"
+    embedding_quantization: str = "avx2"  # arm64, avx2, avx512 or avx512_vnni
+    # reduced halfvec copies of the subject and link embeddings, None to search
+    # the full vectors; see explorative.embedding_projection
+    embedding_dims: int | None = None
+    embedding_reduction: EmbeddingReduction = EmbeddingReduction.TRUNCATE
+    embedding_rerank: int | None = 4  # candidates per result re-ranked on full vectors
+    # constrained LLM grammars, see explorative.grammar_cache
+    grammar_cache_items: int = 128
+    grammar_cache_shared: bool = False  # GBNF text in redis_cache_url
+    # LLM query jobs run concurrently per process, generations still take turns
+    llm_workers: int = 1
 
 
 DBPEDIA_CONFIGS = [
@@ -0,0 +1,126 @@
+from contextlib import contextmanager
+from typing import Iterable
+import traceback
+
+from pgvector.psycopg import register_vector
+from psycopg import Connection, Cursor, sql
+from sqlalchemy import Engine
+from sqlalchemy.dialects import postgresql
+
+from explorative.exp_model import BasePostgres
+
+
+class BulkLoader:
+    """
+    Writes rows with binary `COPY` (psycopg) instead of through the ORM.
+    `replace` streams the rows of one ontology into a temporary staging table and
+    swaps them in within one transaction, so readers see either the old or the
+    new rows. `append` copies straight into the table, e.g. for resumable batches.
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+
+    @contextmanager
+    def __connection(self):
+        connection = self.engine.raw_connection()
+        try:
+            driver: Connection = connection.driver_connection
+            register_vector(driver)
+            yield driver
+            driver.commit()
+        except Exception:
+            print(traceback.format_exc())
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+    @staticmethod
+    def __types(model: type[BasePostgres], columns: list[str]) -> list[str]:
+        # type names without modifiers, e.g. vector instead of VECTOR(1024)
+        return [
+            model.__table__.c[column]
+            .type.compile(dialect=postgresql.dialect())
+            .split("(")[0]
+            .lower()
+            for column in columns
+        ]
+
+    @staticmethod
+    def __prepare(cursor: Cursor, replica: bool):
+        cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+        if replica:
+            # skips the (non deferrable) foreign key triggers, like the ORM path
+            cursor.execute("SET LOCAL session_replication_role = replica")
+
+    def __copy(
+        self,
+        cursor: Cursor,
+        table: str,
+        model: type[BasePostgres],
+        columns: list[str],
+        rows: Iterable[dict],
+    ) -> int:
+        statement = sql.SQL("COPY {} ({}) FROM STDIN (FORMAT BINARY)").format(
+            sql.Identifier(table), sql.SQL(", ").join(map(sql.Identifier, columns))
+        )
+        count = 0
+        with cursor.copy(statement) as copy:
+            copy.set_types(self.__types(model, columns))
+            for row in rows:
+                copy.write_row([row.get(column) for column in columns])
+                count += 1
+        return count
+
+    def append(
+        self,
+        model: type[BasePostgres],
+        rows: Iterable[dict],
+        columns: list[str],
+        replica=False,
+    ) -> int:
+        """Copies the rows into the table and commits, returns the row count."""
+        with self.__connection() as connection, connection.cursor() as cursor:
+            self.__prepare(cursor, replica)
+            return self.__copy(cursor, model.__tablename__, model, columns, rows)
+
+    def replace(
+        self,
+        model: type[BasePostgres],
+        onto_hash: str,
+        rows: Iterable[dict],
+        columns: list[str],
+        replica=False,
+    ) -> int:
+        """Atomically replaces the rows of `onto_hash` with `rows`."""
+        table = model.__tablename__
+        staging = f"{table}_staging"
+        if "onto_hash" not in columns:
+            columns = columns + ["onto_hash"]
+        rows = ({**row, "onto_hash": onto_hash} for row in rows)
+        column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+        with self.__connection() as connection, connection.cursor() as cursor:
+            self.__prepare(cursor, replica)
+            cursor.execute(
+                sql.SQL(
+                    "CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP"
+                ).format(sql.Identifier(staging), sql.Identifier(table))
+            )
+            count = self.__copy(cursor, staging, model, columns, rows)
+            cursor.execute(
+                sql.SQL("DELETE FROM {} WHERE onto_hash = %s").format(
+                    sql.Identifier(table)
+                ),
+                [onto_hash],
+            )
+            cursor.execute(
+                sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {}").format(
+                    sql.Identifier(table),
+                    column_list,
+                    column_list,
+                    sql.Identifier(staging),
+                )
+            )
+        print("Replaced", count, table, "rows of", onto_hash)
+        return count
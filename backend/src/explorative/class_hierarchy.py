@@ -0,0 +1,291 @@
+from bisect import bisect_right
+from collections import deque
+import traceback
+
+from sqlalchemy import Engine, delete, insert, select
+from sqlalchemy.orm import Session
+
+from ontology import OntologyManager
+from explorative.exp_model import SubjectClosureDB
+
+CLASSES_QUERY = """
+SELECT ?cls WHERE {
+    ?cls rdf:type owl:Class .
+    FILTER(isIRI(?cls))
+}"""
+EDGES_QUERY = """
+SELECT ?cls ?parent WHERE {
+    ?cls rdfs:subClassOf ?parent .
+    FILTER(isIRI(?cls) && isIRI(?parent))
+}"""
+
+
+def _merge(intervals: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(intervals):
+        if len(merged) > 0 and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _components(children: dict[str, list[str]]) -> dict[str, int]:
+    """Strongly connected components (Tarjan), numbered children first."""
+    index: dict[str, int] = {}
+    lowlink: dict[str, int] = {}
+    on_stack: set[str] = set()
+    stack: list[str] = []
+    component: dict[str, int] = {}
+    count = 0
+    for root in sorted(children):
+        if root in index:
+            continue
+        work = [(root, iter(children[root]))]
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while len(work) > 0:
+            node, node_children = work[-1]
+            child = next(node_children, None)
+            if child is not None:
+                if child not in index:
+                    index[child] = lowlink[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(children[child])))
+                elif child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+                continue
+            work.pop()
+            if len(work) > 0:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component[member] = count
+                    if member == node:
+                        break
+                count += 1
+    return component
+
+
+class ClassHierarchy:
+    """
+    Transitive closure of `rdfs:subClassOf` for one ontology.
+    The closure (with the shortest depth) is stored in `subject_closure` for SQL
+    lookups. In memory every node (classes in a cycle share one) gets a post-order
+    number on a spanning tree and the merged post-order intervals of its
+    descendants, so subclass tests are a lookup in (usually) a single interval.
+    """
+
+    def __init__(self, oman: OntologyManager, engine: Engine, identifier: str):
+        self.oman = oman
+        self.engine = engine
+        self.identifier = identifier
+        self.__classes: set[str] = set()
+        self.__parents: dict[str, list[str]] = {}
+        self.__component: dict[str, int] = {}
+        self.__members: list[list[str]] = []
+        self.__post: list[int] = []
+        self.__by_post: list[int] = []
+        self.__intervals: list[list[tuple[int, int]]] | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.__intervals is not None
+
+    def __key(self, cls: str) -> str:
+        # prefixed name as used for the stored subjects, also for full IRIs
+        term = self.oman.term_for(cls)
+        return self.oman.converter.n3(term) if term is not None else cls
+
+    def __index(self, classes: set[str], edges: list[tuple[str, str]]):
+        parents: dict[str, list[str]] = {cls: [] for cls in classes}
+        children: dict[str, list[str]] = {cls: [] for cls in classes}
+        for cls, parent in edges:
+            if cls == parent:
+                continue
+            parents.setdefault(cls, []).append(parent)
+            parents.setdefault(parent, [])
+            children.setdefault(parent, []).append(cls)
+            children.setdefault(cls, [])
+
+        # classes that are subclasses of each other (a cycle) share one number
+        component = _components(children)
+        members: list[list[str]] = [
+            [] for _ in range(max(component.values(), default=-1) + 1)
+        ]
+        for node in sorted(component):
+            members[component[node]].append(node)
+        component_children: list[list[int]] = [[] for _ in members]
+        has_parent = [False for _ in members]
+        for parent, parent_children in children.items():
+            for child in parent_children:
+                if component[parent] != component[child]:
+                    component_children[component[parent]].append(component[child])
+                    has_parent[component[child]] = True
+
+        # depth first over all edges: children finish before their parents, and
+        # the first visit of a component defines the spanning tree, whose subtrees
+        # are numbered contiguously from `start`
+        start: dict[int, int] = {}
+        post: list[int] = [0 for _ in members]
+        by_post: list[int] = []
+        roots = [c for c in range(len(members)) if not has_parent[c]]
+        for root in roots + list(range(len(members))):
+            if root in start:
+                continue
+            start[root] = len(by_post)
+            stack = [(root, iter(component_children[root]))]
+            while len(stack) > 0:
+                current, current_children = stack[-1]
+                child = next(current_children, None)
+                if child is None:
+                    stack.pop()
+                    post[current] = len(by_post)
+                    by_post.append(current)
+                elif child not in start:
+                    start[child] = len(by_post)
+                    stack.append((child, iter(component_children[child])))
+
+        intervals: list[list[tuple[int, int]]] = [[] for _ in members]
+        for current in by_post:
+            current_intervals = [(start[current], post[current])]
+            for child in component_children[current]:
+                current_intervals.extend(intervals[child])
+            intervals[current] = _merge(current_intervals)
+
+        self.__classes = classes
+        self.__parents = parents
+        self.__component = component
+        self.__members = members
+        self.__post = post
+        self.__by_post = by_post
+        self.__intervals = intervals
+
+    def __closure_rows(self) -> list[dict]:
+        rows = []
+        for node in sorted(self.__component):
+            for ancestor, depth in self.__ancestors(node):
+                # reflexive rows only for classes, they mark the class set
+                if depth == 0 and node not in self.__classes:
+                    continue
+                rows.append(
+                    {
+                        "onto_hash": self.identifier,
+                        "ancestor_id": ancestor,
+                        "descendant_id": node,
+                        "depth": depth,
+                    }
+                )
+        return rows
+
+    def build(self):
+        """Reads the hierarchy from the ontology and replaces the stored closure."""
+        classes = set(self.oman.q_to_df_values(CLASSES_QUERY).get("cls", []))
+        edges_df = self.oman.q_to_df_values(EDGES_QUERY)
+        edges = (
+            list(zip(edges_df["cls"], edges_df["parent"])) if len(edges_df) > 0 else []
+        )
+        self.__index(classes, edges)
+        rows = self.__closure_rows()
+        with Session(self.engine) as session:
+            session.execute(
+                delete(SubjectClosureDB).where(
+                    SubjectClosureDB.onto_hash == self.identifier
+                )
+            )
+            for i in range(0, len(rows), 10_000):
+                session.execute(insert(SubjectClosureDB), rows[i : i + 10_000])
+            session.commit()
+        print(
+            "Built class hierarchy with",
+            len(self.__component),
+            "nodes and",
+            len(rows),
+            "closure rows",
+        )
+
+    def load(self) -> bool:
+        """Restores the hierarchy from the stored closure, False if there is none."""
+        try:
+            with Session(self.engine) as session:
+                rows = session.execute(
+                    select(
+                        SubjectClosureDB.ancestor_id,
+                        SubjectClosureDB.descendant_id,
+                        SubjectClosureDB.depth,
+                    ).where(
+                        SubjectClosureDB.onto_hash == self.identifier,
+                        SubjectClosureDB.depth <= 1,
+                    )
+                ).all()
+        except Exception as e:
+            print(traceback.format_exc())
+            print("Failed to load class hierarchy", e)
+            return False
+        if len(rows) == 0:
+            return False
+        classes = {descendant for _, descendant, depth in rows if depth == 0}
+        edges = [
+            (descendant, ancestor) for ancestor, descendant, depth in rows if depth == 1
+        ]
+        self.__index(classes, edges)
+        return True
+
+    def __ancestors(self, node: str) -> list[tuple[str, int]]:
+        depths = {node: 0}
+        queue = deque([node])
+        while len(queue) > 0:
+            current = queue.popleft()
+            for parent in self.__parents.get(current, []):
+                if parent not in depths:
+                    depths[parent] = depths[current] + 1
+                    queue.append(parent)
+        return list(depths.items())
+
+    def is_subclass(self, cls: str, ancestor: str) -> bool:
+        """True if `cls` is `ancestor` or (transitively) a subclass of it."""
+        component = self.__component.get(self.__key(cls))
+        ancestor_component = self.__component.get(self.__key(ancestor))
+        if component is None or ancestor_component is None:
+            return False
+        post = self.__post[component]
+        intervals = self.__intervals[ancestor_component]
+        i = bisect_right(intervals, (post, len(self.__by_post))) - 1
+        return i >= 0 and intervals[i][0] <= post <= intervals[i][1]
+
+    def ancestors(self, cls: str) -> list[tuple[str, int]] | None:
+        """Classes `cls` is a subclass of, with their depth, nearest first."""
+        key = self.__key(cls)
+        if key not in self.__component:
+            return None
+        return [
+            (ancestor, depth)
+            for ancestor, depth in self.__ancestors(key)
+            if ancestor in self.__classes
+        ]
+
+    def parents(self, cls: str) -> list[str] | None:
+        """Like `rdfs:subClassOf*` restricted to classes, None for unknown classes."""
+        ancestors = self.ancestors(cls)
+        if ancestors is None:
+            return None
+        return [ancestor for ancestor, _ in ancestors]
+
+    def subclasses(self, cls: str) -> list[str] | None:
+        """Classes that are `cls` or a (transitive) subclass of it."""
+        component = self.__component.get(self.__key(cls))
+        if component is None:
+            return None
+        return [
+            node
+            for start, end in self.__intervals[component]
+            for i in range(start, end + 1)
+            for node in self.__members[self.__by_post[i]]
+            if node in self.__classes
+        ]
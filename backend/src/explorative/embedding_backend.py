@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING
+import traceback
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from eval_config import EmbeddingBackend
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+EMBEDDING_MODEL_ID = "dunzhang/stella_en_400M_v5"
+# problematic merge, wrong dimensionality
+EMBEDDING_MODEL_REVISION = "eb1ce34a33908596b61c83a88903b5f5f30beaa9"
+# cached embeddings are only valid for the model that produced them
+EMBEDDING_MODEL_KEY = f"{EMBEDDING_MODEL_ID}@{EMBEDDING_MODEL_REVISION[:12]}"
+MODEL_KWARGS = {
+    "trust_remote_code": True,
+    # the memory efficient attention of stella needs xformers on a GPU
+    "config_kwargs": {
+        "use_memory_efficient_attention": False,
+        "unpad_inputs": False,
+    },
+}
+PARITY_THRESHOLD = 0.99
+PARITY_TEXTS = [
+    "A person",
+    "A person born in a city",
+    "Films directed by someone who was also an actor",
+    "Proteins that are part of a membrane complex",
+    "Tissue of the central nervous system",
+    "Book: A written work published by a publisher",
+    "birthPlace: Person -> Place",
+    "A disease caused by a bacterial infection",
+]
+
+
+class ParityReport(BaseModel):
+    backend: EmbeddingBackend
+    texts: int
+    min_cosine: float = Field(..., description="Lowest cosine to the fp32 embedding")
+    mean_cosine: float
+    passed: bool = Field(..., description=f"min_cosine >= {PARITY_THRESHOLD}")
+
+
+def load_reference(device: str) -> SentenceTransformer:
+    """The pinned fp32 PyTorch model."""
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(
+        EMBEDDING_MODEL_ID,
+        revision=EMBEDDING_MODEL_REVISION,
+        device=device,
+        **MODEL_KWARGS,
+    )
+
+
+def _onnx_file(backend: EmbeddingBackend, quantization: str) -> str:
+    if backend == EmbeddingBackend.ONNX_INT8:
+        return f"onnx/model_qint8_{quantization}.onnx"
+    return "onnx/model.onnx"
+
+
+def _model_dir(export_dir: str) -> Path:
+    return Path(export_dir) / EMBEDDING_MODEL_KEY.replace("/", "--")
+
+
+def export_onnx(export_dir: str, quantization: str = "avx2") -> Path:
+    """
+    Exports the pinned revision to ONNX (fp32 and dynamically quantised int8)
+    once, in a directory named after the model key.
+    """
+    from sentence_transformers import (
+        SentenceTransformer,
+        export_dynamic_quantized_onnx_model,
+    )
+
+    path = _model_dir(export_dir)
+    if (path / _onnx_file(EmbeddingBackend.ONNX, quantization)).exists() and (
+        path / _onnx_file(EmbeddingBackend.ONNX_INT8, quantization)
+    ).exists():
+        return path
+    print("Exporting", EMBEDDING_MODEL_KEY, "to ONNX in", path)
+    model = SentenceTransformer(
+        EMBEDDING_MODEL_ID,
+        revision=EMBEDDING_MODEL_REVISION,
+        device="cpu",
+        backend="onnx",
+        **MODEL_KWARGS,
+    )
+    model.save_pretrained(str(path))
+    export_dynamic_quantized_onnx_model(model, quantization, str(path))
+    return path
+
+
+def parity(
+    reference: SentenceTransformer,
+    candidate: SentenceTransformer,
+    backend: EmbeddingBackend,
+    texts: list[str] = PARITY_TEXTS,
+    prompt_name: str | None = "s2p_query",
+) -> ParityReport:
+    """Cosine similarity of the candidate's embeddings to the fp32 reference."""
+    expected = reference.encode(texts, prompt_name=prompt_name)
+    actual = candidate.encode(texts, prompt_name=prompt_name)
+    cosines = np.sum(expected * actual, axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+    )
+    return ParityReport(
+        backend=backend,
+        texts=len(texts),
+        min_cosine=float(np.min(cosines)),
+        mean_cosine=float(np.mean(cosines)),
+        passed=bool(np.min(cosines) >= PARITY_THRESHOLD),
+    )
+
+
+def load_backend(
+    backend: EmbeddingBackend,
+    export_dir: str = "../../data/onnx",
+    quantization: str = "avx2",
+) -> SentenceTransformer:
+    """The model on a CPU backend, without a parity check or fallback."""
+    from sentence_transformers import SentenceTransformer
+
+    if backend == EmbeddingBackend.TORCH:
+        return load_reference("cpu")
+    if backend == EmbeddingBackend.TORCH_INT8:
+        import torch
+
+        return torch.ao.quantization.quantize_dynamic(
+            load_reference("cpu"), {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return SentenceTransformer(
+        str(export_onnx(export_dir, quantization)),
+        device="cpu",
+        backend="onnx",
+        model_kwargs={"file_name": _onnx_file(backend, quantization)},
+        **MODEL_KWARGS,
+    )
+
+
+def load_embedding_model(
+    backend: EmbeddingBackend,
+    device: str,
+    export_dir: str = "../../data/onnx",
+    quantization: str = "avx2",
+) -> SentenceTransformer:
+    """
+    The embedding model on the requested backend.
+    A backend is checked against the fp32 model the first time it is used (the
+    result is kept next to the ONNX export), and the fp32 model is returned if it
+    fails the parity check or cannot be loaded.
+    """
+    if backend == EmbeddingBackend.TORCH:
+        return load_reference(device)
+    try:
+        model = load_backend(backend, export_dir, quantization)
+        path = _model_dir(export_dir)
+        path.mkdir(parents=True, exist_ok=True)
+        suffix = f"_{quantization}" if backend == EmbeddingBackend.ONNX_INT8 else ""
+        report_path = path / f"parity_{backend.value}{suffix}.json"
+        if report_path.exists():
+            report = ParityReport.model_validate_json(report_path.read_text())
+        else:
+            report = parity(load_reference("cpu"), model, backend)
+            report_path.write_text(report.model_dump_json())
+        print("Embedding backend parity:", report)
+        if report.passed:
+            return model
+        print("Embedding backend", backend.value, "failed the parity check")
+    except Exception as e:
+        print(traceback.format_exc())
+        print("Failed to load embedding backend", backend.value, e)
+    return load_reference(device)
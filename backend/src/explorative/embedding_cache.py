@@ -0,0 +1,83 @@
+from hashlib import sha1
+import threading
+import traceback
+
+from cachetools import LRUCache
+import numpy as np
+import regex as re
+
+from redis_cache import RedisCache
+
+
+def normalise(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU of embeddings keyed on (prompt name, normalised text).
+    The optional shared tier keeps float16 bytes in Redis, so other workers and
+    restarts reuse them; `model_key` is part of every key, so a different model
+    or backend never gets another one's vectors.
+    """
+
+    def __init__(
+        self,
+        model_key: str,
+        max_items: int = 10_000,
+        ttl: float = 7 * 24 * 60 * 60,
+        redis_cache: RedisCache | None = None,
+        prefix: str = "emb",
+    ):
+        self.model_key = model_key
+        self.ttl = ttl
+        self.prefix = prefix
+        self.local: LRUCache[str, np.ndarray] = LRUCache(maxsize=max_items)
+        self.shared = redis_cache
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text: str, prompt_name: str | None) -> str:
+        digest = sha1(f"{prompt_name or ''}\x00{text}".encode()).hexdigest()
+        return f"{self.prefix}:{self.model_key}:{digest}"
+
+    def get(self, text: str, prompt_name: str | None) -> np.ndarray | None:
+        key = self.key(text, prompt_name)
+        with self.lock:
+            embedding = self.local.get(key)
+        if embedding is None and self.shared is not None:
+            try:
+                data = self.shared.get_raw(key)
+            except Exception as e:
+                print(traceback.format_exc())
+                print("Failed to read shared embedding cache", e)
+                data = None
+            if data is not None:
+                embedding = np.frombuffer(data, dtype=np.float16).astype(np.float32)
+                with self.lock:
+                    self.local[key] = embedding
+        with self.lock:
+            if embedding is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return embedding.copy() if embedding is not None else None
+
+    def set(self, text: str, prompt_name: str | None, embedding: np.ndarray):
+        key = self.key(text, prompt_name)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self.lock:
+            self.local[key] = embedding.copy()
+        if self.shared is not None:
+            try:
+                self.shared.set_raw(
+                    key, embedding.astype(np.float16).tobytes(), ttl=int(self.ttl)
+                )
+            except Exception as e:
+                print(traceback.format_exc())
+                print("Failed to write shared embedding cache", e)
+
+    def clear(self):
+        with self.lock:
+            self.local.clear()
@@ -0,0 +1,251 @@
+import time
+import traceback
+
+import numpy as np
+from pgvector.sqlalchemy import HALFVEC
+from pydantic import BaseModel, Field
+from sqlalchemy import Engine, cast, delete, select, text, update
+from sqlalchemy.orm import Session
+
+from eval_config import EmbeddingReduction, EvalConfig
+from explorative.exp_model import EmbeddingProjectionDB, SubjectInDB, SubjectLinkDB
+
+# tables with a reduced embedding column and their key
+PROJECTED_TABLES = {
+    "subjects": (SubjectInDB, SubjectInDB.subject_id),
+    "subject_links": (SubjectLinkDB, SubjectLinkDB.link_id),
+}
+
+
+class ProjectionReport(BaseModel):
+    table: str
+    dims: int
+    method: EmbeddingReduction
+    rerank: int | None
+    k: int
+    queries: int
+    recall: float = Field(..., description="Mean overlap with the full-vector top k")
+    full_ms: float
+    reduced_ms: float
+
+
+class EmbeddingProjection:
+    """
+    Reduced (`embedding_dims`) halfvec copies of the subject and link embeddings
+    of one ontology, either the leading dimensions or a PCA projection fitted on
+    the ontology's own vectors. Searches rank on these and re-rank the best
+    candidates on the full vectors.
+    """
+
+    def __init__(self, engine: Engine, identifier: str, config: EvalConfig):
+        self.engine = engine
+        self.identifier = identifier
+        self.config = config
+        self.dims: int | None = None
+        self.method: EmbeddingReduction | None = None
+        self.__mean: np.ndarray | None = None
+        self.__components: np.ndarray | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.dims is not None
+
+    def project(self, embeddings: np.ndarray) -> np.ndarray:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if self.method == EmbeddingReduction.PCA:
+            return (embeddings - self.__mean) @ self.__components.T
+        return embeddings[..., : self.dims]
+
+    def distance(self, model, query_embedding: np.ndarray):
+        # the cast matches the expression the vector index is built on
+        return cast(model.embedding_short, HALFVEC(self.dims)).cosine_distance(
+            self.project(query_embedding)
+        )
+
+    def candidates(self, limit: int) -> int:
+        """Rows to fetch from the reduced vectors for `limit` results."""
+        if not self.loaded or self.config.embedding_rerank is None:
+            return limit
+        return limit * self.config.embedding_rerank
+
+    def __fit_pca(self, session: Session, dims: int, sample_size: int):
+        embeddings = []
+        for model, _ in PROJECTED_TABLES.values():
+            embeddings.extend(
+                session.execute(
+                    select(model.embedding)
+                    .where(model.onto_hash == self.identifier, model.embedding != None)
+                    .order_by(text("random()"))
+                    .limit(sample_size)
+                )
+                .scalars()
+                .all()
+            )
+        embeddings = np.array(embeddings, dtype=np.float32)
+        mean = embeddings.mean(axis=0)
+        _, _, vt = np.linalg.svd(embeddings - mean, full_matrices=False)
+        return mean, vt[:dims]
+
+    def build(self, sample_size: int = 20_000, batch_size: int = 2_000):
+        """Fits the projection (for PCA) and fills `embedding_short` of the ontology."""
+        dims = self.config.embedding_dims
+        method = self.config.embedding_reduction
+        with Session(self.engine) as session:
+            stored = session.execute(
+                select(EmbeddingProjectionDB.onto_hash).where(
+                    EmbeddingProjectionDB.onto_hash == self.identifier
+                )
+            ).first()
+            if dims is None and stored is None:
+                # disabled and nothing to clear
+                self.dims = None
+                return
+            if dims is not None:
+                for table in PROJECTED_TABLES:
+                    # databases created before the column existed
+                    session.execute(
+                        text(
+                            f"ALTER TABLE {table} "
+                            "ADD COLUMN IF NOT EXISTS embedding_short halfvec"
+                        )
+                    )
+            if stored is not None:
+                session.execute(
+                    delete(EmbeddingProjectionDB).where(
+                        EmbeddingProjectionDB.onto_hash == self.identifier
+                    )
+                )
+                for model, _ in PROJECTED_TABLES.values():
+                    session.execute(
+                        update(model)
+                        .where(model.onto_hash == self.identifier)
+                        .values(embedding_short=None)
+                    )
+            if dims is None:
+                session.commit()
+                self.dims = None
+                return
+
+            mean, components = None, None
+            if method == EmbeddingReduction.PCA:
+                mean, components = self.__fit_pca(session, dims, sample_size)
+            session.add(
+                EmbeddingProjectionDB(
+                    onto_hash=self.identifier,
+                    method=method.value,
+                    dims=dims,
+                    mean=mean.tobytes() if mean is not None else None,
+                    components=components.tobytes() if components is not None else None,
+                )
+            )
+            self.dims, self.method = dims, method
+            self.__mean, self.__components = mean, components
+
+            for table, (model, key) in PROJECTED_TABLES.items():
+                if method == EmbeddingReduction.TRUNCATE:
+                    session.execute(
+                        text(
+                            f"UPDATE {table} SET embedding_short = "
+                            "subvector(embedding, 1, :dims)::halfvec "
+                            "WHERE onto_hash = :onto_hash AND embedding IS NOT NULL"
+                        ),
+                        {"dims": dims, "onto_hash": self.identifier},
+                    )
+                    continue
+                rows = session.execute(
+                    select(key, model.embedding).where(
+                        model.onto_hash == self.identifier, model.embedding != None
+                    )
+                ).all()
+                for i in range(0, len(rows), batch_size):
+                    batch = rows[i : i + batch_size]
+                    projected = self.project(np.array([row[1] for row in batch]))
+                    session.execute(
+                        update(model),
+                        [
+                            {key.key: row[0], "embedding_short": embedding}
+                            for row, embedding in zip(batch, projected)
+                        ],
+                    )
+            session.commit()
+        print("Built", method.value, "embedding projection with", dims, "dimensions")
+
+    def load(self) -> bool:
+        """Restores the stored projection, False if the ontology has none."""
+        try:
+            with Session(self.engine) as session:
+                projection = session.execute(
+                    select(EmbeddingProjectionDB).where(
+                        EmbeddingProjectionDB.onto_hash == self.identifier
+                    )
+                ).scalar_one_or_none()
+        except Exception as e:
+            print(traceback.format_exc())
+            print("Failed to load embedding projection", e)
+            return False
+        if projection is None:
+            return False
+        self.dims = projection.dims
+        self.method = EmbeddingReduction(projection.method)
+        if projection.mean is not None:
+            self.__mean = np.frombuffer(projection.mean, dtype=np.float32)
+            self.__components = np.frombuffer(
+                projection.components, dtype=np.float32
+            ).reshape(projection.dims, -1)
+        return True
+
+    def __nearest(
+        self, table: str, embedding: np.ndarray, k: int, reduced: bool
+    ) -> tuple[list, float]:
+        model, key = PROJECTED_TABLES[table]
+        full_distance = model.embedding.cosine_distance(embedding)
+        query = select(key).where(model.onto_hash == self.identifier)
+        with Session(self.engine) as session:
+            # exact scans on both sides, so only the reduction is measured
+            session.execute(text("SET LOCAL enable_indexscan = off"))
+            start = time.perf_counter()
+            if reduced:
+                candidates = (
+                    query.add_columns(full_distance.label("distance"))
+                    .order_by(self.distance(model, embedding))
+                    .limit(self.candidates(k))
+                    .subquery()
+                )
+                query = select(candidates.c[key.key]).order_by(candidates.c.distance)
+            else:
+                query = query.order_by(full_distance)
+            keys = session.execute(query.limit(k)).scalars().all()
+            return keys, time.perf_counter() - start
+
+    def report(
+        self, embeddings: list[np.ndarray], k: int = 25
+    ) -> list[ProjectionReport]:
+        """Recall of the reduced (and re-ranked) search against the full vectors."""
+        if not self.loaded:
+            return []
+        reports = []
+        for table in PROJECTED_TABLES:
+            recalls, full_times, reduced_times = [], [], []
+            for embedding in embeddings:
+                full, full_time = self.__nearest(table, embedding, k, reduced=False)
+                reduced, reduced_time = self.__nearest(
+                    table, embedding, k, reduced=True
+                )
+                if len(full) > 0:
+                    recalls.append(len(set(full) & set(reduced)) / len(full))
+                full_times.append(full_time)
+                reduced_times.append(reduced_time)
+            reports.append(
+                ProjectionReport(
+                    table=table,
+                    dims=self.dims,
+                    method=self.method,
+                    rerank=self.config.embedding_rerank,
+                    k=k,
+                    queries=len(embeddings),
+                    recall=float(np.mean(recalls)) if len(recalls) > 0 else 1.0,
+                    full_ms=float(np.mean(full_times)) * 1000,
+                    reduced_ms=float(np.mean(reduced_times)) * 1000,
+                )
+            )
+        return reports
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable
+import queue
+import threading
+import time
+import traceback
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from explorative.embedding_cache import EmbeddingCache, normalise
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+
+class EmbeddingMetrics(BaseModel):
+    requests: int = Field(0, description="Encode requests received")
+    texts: int = Field(0, description="Texts encoded")
+    batches: int = Field(0, description="Model calls")
+    queue_depth: int = Field(0, description="Texts waiting to be encoded")
+    mean_batch_size: float = Field(0.0, description="Texts per model call")
+    mean_queue_ms: float = Field(0.0, description="Time a request waits to be batched")
+    mean_encode_ms: float = Field(0.0, description="Time per model call")
+    texts_per_second: float = Field(0.0, description="Encode throughput")
+    cache_hits: int = Field(0, description="Texts served from the embedding cache")
+    cache_misses: int = Field(0, description="Cache lookups that needed the model")
+
+
+@dataclass
+class _Request:
+    texts: list[str]
+    prompt_name: str | None
+    future: Future = field(default_factory=Future)
+    enqueued: float = field(default_factory=time.perf_counter)
+
+
+class EmbeddingService:
+    """
+    Encodes texts on one worker thread that owns the embedding model.
+    Requests are queued and collected into micro-batches (up to `max_batch_size`
+    texts, waiting at most `max_wait_ms` after the first one), so concurrent
+    requests share model calls instead of serialising on the model.
+    """
+
+    def __init__(
+        self,
+        model_loader: Callable[[], SentenceTransformer],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        num_threads: int | None = None,
+        cache: EmbeddingCache | None = None,
+    ):
+        self.model_loader = model_loader
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.num_threads = num_threads
+        self.__queue: queue.Queue[_Request | None] = queue.Queue()
+        self.__worker: threading.Thread | None = None
+        self.__worker_lock = threading.Lock()
+        self.__metrics_lock = threading.Lock()
+        self.__queued_texts = 0
+        self.__requests = 0
+        self.__texts = 0
+        self.__batches = 0
+        self.__queue_seconds = 0.0
+        self.__encode_seconds = 0.0
+
+    def __start(self):
+        with self.__worker_lock:
+            if self.__worker is None or not self.__worker.is_alive():
+                self.__worker = threading.Thread(
+                    target=self.__run, name="embedding-service", daemon=True
+                )
+                self.__worker.start()
+
+    def submit(self, texts: list[str], prompt_name: str | None = None) -> Future:
+        """Queues the texts, the future resolves to their embeddings (one row each)."""
+        request = _Request(list(texts), prompt_name)
+        with self.__metrics_lock:
+            self.__requests += 1
+            self.__queued_texts += len(request.texts)
+        self.__start()
+        self.__queue.put(request)
+        return request.future
+
+    def encode(
+        self,
+        sentences: str | list[str],
+        prompt_name: str | None = None,
+        timeout: float | None = None,
+        use_cache: bool = True,
+    ) -> np.ndarray:
+        """
+        Blocking drop-in for `SentenceTransformer.encode`.
+        With a cache, only the texts not cached (keyed on their normalised form) are
+        encoded; bulk encodes of one-off texts should pass `use_cache=False`.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if self.cache is None or not use_cache:
+            embeddings = self.submit(texts, prompt_name).result(timeout)
+            return embeddings[0] if single else embeddings
+
+        keys = [normalise(text) for text in texts]
+        cached = [self.cache.get(key, prompt_name) for key in keys]
+        # the model sees the original text, the first one of each missing key
+        missing: dict[str, str] = {}
+        for key, text, embedding in zip(keys, texts, cached):
+            if embedding is None and key not in missing:
+                missing[key] = text
+        if len(missing) > 0:
+            encoded = self.submit(list(missing.values()), prompt_name).result(timeout)
+            by_key = dict(zip(missing, encoded))
+            for key, embedding in by_key.items():
+                self.cache.set(key, prompt_name, embedding)
+            cached = [e if e is not None else by_key[k] for k, e in zip(keys, cached)]
+        return cached[0] if single else np.stack(cached)
+
+    def close(self):
+        if self.__worker is not None and self.__worker.is_alive():
+            self.__queue.put(None)
+
+    def __collect(self, first: _Request) -> tuple[list[_Request], bool]:
+        batch = [first]
+        size = len(first.texts)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self.__queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+            size += len(request.texts)
+        return batch, False
+
+    def __encode_batch(self, model: SentenceTransformer, batch: list[_Request]):
+        # one prompt per model call
+        by_prompt: dict[str | None, list[_Request]] = {}
+        for request in batch:
+            by_prompt.setdefault(request.prompt_name, []).append(request)
+        for prompt_name, requests in by_prompt.items():
+            texts = [text for request in requests for text in request.texts]
+            start = time.perf_counter()
+            try:
+                if len(texts) > 0:
+                    embeddings = model.encode(
+                        texts,
+                        prompt_name=prompt_name,
+                        batch_size=self.max_batch_size,
+                    )
+                else:
+                    embeddings = np.empty((0, 0), dtype=np.float32)
+            except Exception as e:
+                print(traceback.format_exc())
+                for request in requests:
+                    request.future.set_exception(e)
+                continue
+            finally:
+                with self.__metrics_lock:
+                    self.__queued_texts -= len(texts)
+            end = time.perf_counter()
+            offset = 0
+            for request in requests:
+                request.future.set_result(
+                    embeddings[offset : offset + len(request.texts)]
+                )
+                offset += len(request.texts)
+            with self.__metrics_lock:
+                self.__batches += 1
+                self.__texts += len(texts)
+                self.__encode_seconds += end - start
+                self.__queue_seconds += sum(start - r.enqueued for r in requests)
+
+    def __run(self):
+        model = None
+        while True:
+            first = self.__queue.get()
+            if first is None:
+                return
+            batch, stop = self.__collect(first)
+            if model is None:
+                try:
+                    if self.num_threads is not None:
+                        import torch
+
+                        torch.set_num_threads(self.num_threads)
+                    model = self.model_loader()
+                except Exception as e:
+                    print(traceback.format_exc())
+                    for request in batch:
+                        request.future.set_exception(e)
+                    with self.__metrics_lock:
+                        self.__queued_texts -= sum(len(r.texts) for r in batch)
+                    continue
+            self.__encode_batch(model, batch)
+            if stop:
+                return
+
+    def metrics(self) -> EmbeddingMetrics:
+        with self.__metrics_lock:
+            return EmbeddingMetrics(
+                requests=self.__requests,
+                texts=self.__texts,
+                batches=self.__batches,
+                queue_depth=self.__queued_texts,
+                mean_batch_size=self.__texts / max(self.__batches, 1),
+                mean_queue_ms=self.__queue_seconds / max(self.__requests, 1) * 1000,
+                mean_encode_ms=self.__encode_seconds / max(self.__batches, 1) * 1000,
+                texts_per_second=(
+                    self.__texts / self.__encode_seconds
+                    if self.__encode_seconds > 0
+                    else 0.0
+                ),
+                cache_hits=self.cache.hits if self.cache is not None else 0,
+                cache_misses=self.cache.misses if self.cache is not None else 0,
+            )
@@ -1,11 +1,11 @@
 from __future__ import annotations
-from sqlalchemy import ForeignKey
+from sqlalchemy import BigInteger, ForeignKey, Index, LargeBinary
 from sqlalchemy.orm import relationship, DeclarativeBase, Mapped, mapped_column
 
 from pydantic import Field, BaseModel
 
 from model import Subject, SubjectLink
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import HALFVEC, Vector
 from enum import Enum
 from ontology import OntologyManager
 
@@ -135,6 +135,8 @@ class SubjectInDB(BasePostgres):
     instance_count: Mapped[int] = mapped_column(default=0)
 
     embedding: Mapped[Vector] = mapped_column(Vector(N_EMBEDDINGS))
+    # reduced copy, the dimension depends on the ontology
+    embedding_short: Mapped[HALFVEC | None] = mapped_column(HALFVEC(), deferred=True)
     onto_hash: Mapped[str | None] = mapped_column()
 
     sub_classes: Mapped[list[SubjectInDB]] = relationship(
@@ -188,6 +190,7 @@ class SubjectLinkDB(BasePostgres):
 
     description: Mapped[str | None] = mapped_column()
     embedding: Mapped[Vector | None] = mapped_column(Vector(N_EMBEDDINGS))
+    embedding_short: Mapped[HALFVEC | None] = mapped_column(HALFVEC(), deferred=True)
 
     onto_hash: Mapped[str | None] = mapped_column()
 
@@ -209,21 +212,74 @@ class SubjectLinkDB(BasePostgres):
     )
 
     def from_db(self, oman: OntologyManager):
-        return SubjectLink(
-            label=self.label,
-            link_id=self.link_id,
-            from_id=self.from_id,
-            link_type=self.link_type,
-            to_id=self.to_id,
-            to_proptype=self.to_proptype,
-            property_id=self.property_id,
-            from_subject=oman.enrich_subject(self.from_id),
-            to_subject=(
-                oman.enrich_subject(self.to_id) if self.to_id is not None else None
-            ),
-            instance_count=self.instance_count,
+        return SubjectLinkDB.from_db_many([self], oman)[0]
+
+    @staticmethod
+    def from_db_many(links: list[SubjectLinkDB], oman: OntologyManager):
+        subjects = oman.enrich_subjects(
+            [link.from_id for link in links] + [link.to_id for link in links]
+        )
+        return SubjectLinkDB.with_subjects(
+            links, subjects[: len(links)], subjects[len(links) :]
         )
 
+    @staticmethod
+    def with_subjects(
+        links: list[SubjectLinkDB],
+        from_subjects: list[Subject | None],
+        to_subjects: list[Subject | None],
+    ):
+        """Builds the links from rows with the link columns and their enriched ends."""
+        return [
+            SubjectLink(
+                label=link.label,
+                link_id=link.link_id,
+                from_id=link.from_id,
+                link_type=link.link_type,
+                to_id=link.to_id,
+                to_proptype=link.to_proptype,
+                property_id=link.property_id,
+                from_subject=from_subject,
+                to_subject=to_subject,
+                instance_count=link.instance_count,
+            )
+            for link, from_subject, to_subject in zip(
+                links, from_subjects, to_subjects
+            )
+        ]
+
+
+class OntologyStatisticDB(BasePostgres):
+    __tablename__ = "ontology_statistics"
+    onto_hash: Mapped[str] = mapped_column(primary_key=True)
+    # "class" (instances of the class) or "property" (triples using the predicate)
+    kind: Mapped[str] = mapped_column(primary_key=True)
+    # full IRI
+    entity_id: Mapped[str] = mapped_column(primary_key=True)
+    count: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class SubjectClosureDB(BasePostgres):
+    __tablename__ = "subject_closure"
+    __table_args__ = (
+        Index("ix_subject_closure_descendant", "onto_hash", "descendant_id"),
+    )
+    onto_hash: Mapped[str] = mapped_column(primary_key=True)
+    ancestor_id: Mapped[str] = mapped_column(primary_key=True)
+    descendant_id: Mapped[str] = mapped_column(primary_key=True)
+    # shortest number of rdfs:subClassOf steps, 0 for the class itself
+    depth: Mapped[int] = mapped_column(default=0)
+
+
+class EmbeddingProjectionDB(BasePostgres):
+    __tablename__ = "embedding_projections"
+    onto_hash: Mapped[str] = mapped_column(primary_key=True)
+    method: Mapped[str] = mapped_column()
+    dims: Mapped[int] = mapped_column()
+    # float32 bytes of the PCA mean and (dims x N_EMBEDDINGS) components
+    mean: Mapped[bytes | None] = mapped_column(LargeBinary)
+    components: Mapped[bytes | None] = mapped_column(LargeBinary)
+
 
 class RETURN_TYPE(str, Enum):
     SUBJECT = "subject"
@@ -285,5 +341,10 @@ class FuzzyQueryResults(BaseModel):
 
 class SparqlQuery(BaseModel):
     query: str = Field()
-    limit: int | None = Field(25)
+    limit: int | None = Field(None)
     skip: int | None = Field(0)
+
+
+class SparqlStreamFormat(str, Enum):
+    NDJSON = "ndjson"
+    SPARQL_JSON = "sparql-json"
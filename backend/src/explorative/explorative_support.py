@@ -1,14 +1,28 @@
 from __future__ import annotations
-from sentence_transformers import SentenceTransformer
-import torch
-from langchain_core.language_models import LLM
-from llama_cpp import Llama
-from hashlib import sha256
+from typing import TYPE_CHECKING, Callable
+import threading
 import regex as re
-from sqlalchemy import text, inspect, create_engine, select, delete, or_
-from sqlalchemy.orm import Session
+from sqlalchemy import (
+    String,
+    cast,
+    column,
+    create_engine,
+    delete,
+    func,
+    inspect,
+    literal,
+    null,
+    or_,
+    select,
+    text,
+    union,
+    union_all,
+    values,
+)
+from sqlalchemy.orm import Session, aliased
 from tqdm import tqdm
 import pandas as pd
+import numpy as np
 
 from model import SubjectLink
 from ontology import OntologyManager
@@ -18,6 +32,7 @@ from explorative.exp_model import (
     TopicDB,
     SubjectLinkDB,
     SubjectInDB,
+    SubjectClosureDB,
     FuzzyQueryResult,
     FuzzyQuery,
     N_EMBEDDINGS,
@@ -27,6 +42,34 @@ from explorative.exp_model import (
     FuzzyQueryResults,
     Topic,
 )
+from explorative.embedding_backend import EMBEDDING_MODEL_KEY, load_embedding_model
+from explorative.embedding_cache import EmbeddingCache
+from explorative.embedding_projection import EmbeddingProjection, ProjectionReport
+from explorative.embedding_service import EmbeddingService
+from explorative.grammar_cache import GrammarCache
+from explorative.statistics import OntologyStatistics
+from explorative.class_hierarchy import ClassHierarchy
+from explorative.vector_index import VectorIndex, VectorIndexReport
+from eval_config import EmbeddingBackend, EvalConfig
+from redis_cache import RedisCache
+
+# link columns returned by the fuzzy search, null for subject results
+FUZZY_LINK_COLUMNS = [
+    SubjectLinkDB.link_id,
+    SubjectLinkDB.label,
+    SubjectLinkDB.from_id,
+    SubjectLinkDB.link_type,
+    SubjectLinkDB.to_id,
+    SubjectLinkDB.to_proptype,
+    SubjectLinkDB.property_id,
+    SubjectLinkDB.instance_count,
+]
+THING = "owl:Thing"
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import LLM
+    from llama_cpp import Llama
+    from sentence_transformers import SentenceTransformer
 
 
 class GuidanceManager:
@@ -39,17 +82,10 @@ class GuidanceManager:
         llm_quant_model: str = "*.Q8_0.gguf",
         langchain_model: LLM = None,
         ctx_size=10000,
+        search_config: EvalConfig | None = None,
     ) -> None:
         self.oman = oman
-        if device is None:
-            if torch.cuda.is_available():
-                device = "cuda"
-            elif torch.mps.is_available():
-                device = "mps"
-            else:
-                device = "cpu"
-        print("Using device", device)
-        self.device = device
+        self.__device = device
         # This model supports two prompts: "s2p_query" and "s2s_query" for sentence-to-passage and sentence-to-sentence tasks, respectively.
         # They are defined in `config_sentence_transformers.json`
         self.query_prompt_name = "s2p_query"
@@ -58,20 +94,68 @@ class GuidanceManager:
         self.langchain_model = langchain_model
         self.ctx_size = ctx_size
         self.engine = create_engine(conn_str)
-        identifier_results = self.oman.onto.query(
-            "SELECT ?s  ?p ?o WHERE {?s ?o ?p.} LIMIT 25"
+        self.identifier = self.oman.identifier
+        self.statistics = OntologyStatistics(self.oman, self.engine, self.identifier)
+        if self.statistics.load():
+            self.oman.statistics = self.statistics
+        self.hierarchy = ClassHierarchy(self.oman, self.engine, self.identifier)
+        if self.hierarchy.load():
+            self.oman.hierarchy = self.hierarchy
+        search_config = search_config if search_config is not None else EvalConfig()
+        self.search_config = search_config
+        self.projection = EmbeddingProjection(
+            self.engine, self.identifier, search_config
         )
-        if len(identifier_results) == 1:
-            raise ValueError(
-                "Ontology is empty or SPARQL endpoint is not reachable",
-                identifier_results,
-            )
-        self.identifier = sha256(
-            ".".join([str(e) for e in identifier_results]).encode()
-        ).hexdigest()
+        self.projection.load()
+        self.vector_index = VectorIndex(
+            self.engine, self.identifier, search_config, projection=self.projection
+        )
+        # all encoding goes through the embedder, so concurrent requests share
+        # model calls
+        self.embedder = EmbeddingService(
+            lambda: self.embedding_model,
+            max_batch_size=search_config.embedding_max_batch_size,
+            max_wait_ms=search_config.embedding_max_wait_ms,
+            num_threads=search_config.embedding_threads,
+            cache=EmbeddingCache(
+                f"{EMBEDDING_MODEL_KEY}:{search_config.embedding_backend.value}",
+                max_items=search_config.embedding_cache_items,
+                redis_cache=(
+                    RedisCache(redis_url=search_config.redis_cache_url)
+                    if search_config.embedding_cache_shared
+                    else None
+                ),
+            ),
+        )
+        # shared by the LLM query and the assistant
+        self.grammars = GrammarCache(
+            max_items=search_config.grammar_cache_items,
+            redis_cache=(
+                RedisCache(redis_url=search_config.redis_cache_url)
+                if search_config.grammar_cache_shared
+                else None
+            ),
+        )
+        # llama.cpp contexts are not thread safe, generations take turns
+        self.llama_lock = threading.Lock()
         self.__lama_model = None
         self.__embedding_model = None
 
+    @property
+    def device(self) -> str:
+        # torch is only imported once a model is loaded
+        if self.__device is None:
+            import torch
+
+            if torch.cuda.is_available():
+                self.__device = "cuda"
+            elif torch.mps.is_available():
+                self.__device = "mps"
+            else:
+                self.__device = "cpu"
+            print("Using device", self.__device)
+        return self.__device
+
     @property
     def llama_model(self) -> Llama:
         if self.__lama_model is not None:
@@ -83,6 +167,8 @@ class GuidanceManager:
         if self.langchain_model is not None:
             self.__lama_model = self.langchain_model
         elif self.llm_model_id is not None:
+            from llama_cpp import Llama
+
             self.__lama_model = Llama.from_pretrained(
                 repo_id=self.llm_model_id,
                 filename=self.llm_quant_model,
@@ -96,19 +182,36 @@ class GuidanceManager:
             )
         return self.__lama_model
 
+    def chat_completion(self, on_token: Callable[[str], None] | None = None, **kwargs):
+        """
+        `create_chat_completion` on the LLM, one generation at a time.
+        With `on_token` the completion is streamed and every text chunk passed to
+        it; the response has the same shape either way.
+        """
+        with self.llama_lock:
+            if on_token is None:
+                return self.llama_model.create_chat_completion(**kwargs)
+            content = []
+            for chunk in self.llama_model.create_chat_completion(stream=True, **kwargs):
+                token = chunk["choices"][0]["delta"].get("content")
+                if token:
+                    content.append(token)
+                    on_token(token)
+        return {
+            "choices": [{"message": {"role": "assistant", "content": "".join(content)}}]
+        }
+
     @property
-    def embedding_model(self):
+    def embedding_model(self) -> SentenceTransformer:
         if self.__embedding_model is not None:
             return self.__embedding_model
-        self.__embedding_model = SentenceTransformer(
-            "dunzhang/stella_en_400M_v5",
-            trust_remote_code=True,
-            config_kwargs={
-                "use_memory_efficient_attention": False,
-                "unpad_inputs": False,
-            },
-            revision="eb1ce34a33908596b61c83a88903b5f5f30beaa9",  # problematic merge, wrong dimensionality,
-            device=self.device,
+        backend = self.search_config.embedding_backend
+        self.__embedding_model = load_embedding_model(
+            backend,
+            # int8 and ONNX run on the CPU, no need to probe for a GPU
+            self.device if backend == EmbeddingBackend.TORCH else "cpu",
+            export_dir=self.search_config.embedding_export_dir,
+            quantization=self.search_config.embedding_quantization,
         )
         # self.embedding_model = SentenceTransformer(
         #     "paraphrase-MiniLM-L6-v2",
@@ -147,24 +250,33 @@ class GuidanceManager:
         query: str,
         limit=25,
     ):
-        query_embedding = self.embedding_model.encode(query)
+        query_embedding = self.embedder.encode(query)
         with Session(self.engine) as session:
+            self.vector_index.configure(session, self.projection.candidates(limit))
             subjects = session.execute(
-                select(SubjectInDB)
-                .where(SubjectInDB.onto_hash == self.identifier)
-                .order_by(SubjectInDB.embedding.cosine_distance(query_embedding))
-                .limit(limit)
+                self.__nearest(
+                    select(SubjectInDB).where(SubjectInDB.onto_hash == self.identifier),
+                    SubjectInDB,
+                    query_embedding,
+                    limit,
+                )
             ).all()
-            subjects_enriched = [
-                self.oman.enrich_subject(s[0].subject_id) for s in subjects
-            ]
+            subjects_enriched = self.oman.enrich_subjects(
+                [s[0].subject_id for s in subjects]
+            )
             links = session.execute(
-                select(SubjectLinkDB)
-                .where(SubjectLinkDB.onto_hash == self.identifier)
-                .order_by(SubjectLinkDB.embedding.cosine_distance(query_embedding))
-                .limit(limit)
+                self.__nearest(
+                    select(SubjectLinkDB).where(
+                        SubjectLinkDB.onto_hash == self.identifier
+                    ),
+                    SubjectLinkDB,
+                    query_embedding,
+                    limit,
+                )
             ).all()
-            links_enriched = [l[0].from_db(self.oman) for l in links]
+            links_enriched = SubjectLinkDB.from_db_many(
+                [l[0] for l in links], self.oman
+            )
             return FuzzyQueryResults(
                 links=links_enriched,
                 subjects=subjects_enriched,
@@ -182,23 +294,27 @@ class GuidanceManager:
             if to_id is not None:
                 query = query.where(SubjectLinkDB.to_id == to_id)
             if querystring is not None:
-                query_embedding = self.embedding_model.encode(querystring)
-                query = query.order_by(
-                    SubjectLinkDB.embedding.cosine_distance(query_embedding)
-                )
+                query_embedding = self.embedder.encode(querystring)
+                self.vector_index.configure(session, self.projection.candidates(25))
+                query = self.__nearest(query, SubjectLinkDB, query_embedding, 25)
             links = session.execute(query.limit(25)).all()
-            links_enriched = [l[0].from_db(self.oman) for l in links]
+            links_enriched = SubjectLinkDB.from_db_many(
+                [l[0] for l in links], self.oman
+            )
             return links_enriched
 
     def __embed_query(
         self,
         query: FuzzyQuery,
         session: Session,
+        text_embedding: np.ndarray | None = None,
     ):
         query_embedding = None
         if query.q is not None and len(query.q) > 0:
-            query_embedding = self.embedding_model.encode(
-                query.q, prompt_name=self.query_prompt_name
+            query_embedding = (
+                text_embedding
+                if text_embedding is not None
+                else self.embedder.encode(query.q, prompt_name=self.query_prompt_name)
             )
         if query.topic_ids is not None and len(query.topic_ids) > 0:
             topics = session.execute(
@@ -206,8 +322,8 @@ class GuidanceManager:
                 .where(TopicDB.onto_hash == self.identifier)
                 .where(TopicDB.topic_id.in_(query.topic_ids))
             ).all()
-            topic_embeddings = torch.tensor([topic[0].embedding for topic in topics])
-            topic_embedding = torch.mean(topic_embeddings, axis=0)
+            topic_embeddings = np.array([topic[0].embedding for topic in topics])
+            topic_embedding = np.mean(topic_embeddings, axis=0)
             if query_embedding is not None:
                 query_embedding = (
                     1 - query.mix_topic_factor
@@ -217,101 +333,233 @@ class GuidanceManager:
 
         if query.q is None and (query.topic_ids is None or len(query.topic_ids) == 0):
             query_embedding = (
-                torch.ones(N_EMBEDDINGS) / N_EMBEDDINGS
+                np.ones(N_EMBEDDINGS) / N_EMBEDDINGS
             )  # default to uniform
         return query_embedding
 
+    def __ancestors(self, ids: list[str], name: str):
+        """The ids and all their ancestors, from the closure table if it is built."""
+        if self.hierarchy.loaded:
+            return union(
+                values(column("subject_id", String), name=f"{name}_start")
+                .data([(subject_id,) for subject_id in ids])
+                .select(),
+                select(SubjectClosureDB.ancestor_id).where(
+                    SubjectClosureDB.onto_hash == self.identifier,
+                    SubjectClosureDB.descendant_id.in_(ids),
+                ),
+            ).subquery(name)
+        # otherwise along the first superclass stored per subject
+        start = values(column("subject_id", String), name=f"{name}_start").data(
+            [(subject_id,) for subject_id in ids]
+        )
+        ancestors = select(start.c.subject_id).cte(name, recursive=True)
+        return ancestors.union(
+            select(SubjectInDB.parent_id).where(
+                SubjectInDB.subject_id == ancestors.c.subject_id,
+                SubjectInDB.onto_hash == self.identifier,
+                SubjectInDB.parent_id != None,
+            )
+        )
+
+    def __nearest(
+        self,
+        statement,
+        model: type[SubjectInDB] | type[SubjectLinkDB],
+        query_embedding: np.ndarray,
+        limit: int | None,
+        offset: int | None = 0,
+        entity: bool = True,
+    ):
+        """
+        `statement` ordered by cosine distance to the query. With reduced vectors
+        the candidates are ranked on those and re-ranked on the full vectors;
+        statements that do not select `model` need a full `distance` column.
+        """
+        if not self.projection.loaded:
+            return (
+                statement.order_by(model.embedding.cosine_distance(query_embedding))
+                .offset(offset)
+                .limit(limit)
+            )
+        candidates = statement.order_by(
+            self.projection.distance(model, query_embedding)
+        )
+        if self.search_config.embedding_rerank is None or limit is None:
+            return candidates.offset(offset).limit(limit)
+        candidates = candidates.limit(
+            self.projection.candidates((offset or 0) + limit)
+        ).subquery("candidates")
+        if entity:
+            candidate = aliased(model, candidates)
+            return (
+                select(candidate)
+                .order_by(candidate.embedding.cosine_distance(query_embedding))
+                .offset(offset)
+                .limit(limit)
+            )
+        return (
+            select(candidates)
+            .order_by(candidates.c.distance)
+            .offset(offset)
+            .limit(limit)
+        )
+
+    def __fuzzy_subjects(self, query: FuzzyQuery, query_embedding):
+        distance = SubjectInDB.embedding.cosine_distance(query_embedding)
+        query_subject = select(
+            literal(RETURN_TYPE.SUBJECT.value).label("kind"),
+            SubjectInDB.subject_id.label("subject_id"),
+            *[
+                cast(null(), link_column.type).label(link_column.key)
+                for link_column in FUZZY_LINK_COLUMNS
+            ],
+            distance.label("distance"),
+        ).where(SubjectInDB.onto_hash == self.identifier)
+        if query.entity_type is not None:
+            query_subject = query_subject.where(
+                SubjectInDB.subject_type == query.entity_type
+            )
+        if query.order == FUZZY_QUERY_ORDER.SCORE:
+            return self.__nearest(
+                query_subject,
+                SubjectInDB,
+                query_embedding,
+                query.limit,
+                query.skip,
+                entity=False,
+            )
+        return (
+            query_subject.order_by(SubjectInDB.instance_count)
+            .offset(query.skip)
+            .limit(query.limit)
+        )
+
+    def __fuzzy_links(self, query: FuzzyQuery, query_embedding, name: str = "ranked"):
+        distance = SubjectLinkDB.embedding.cosine_distance(query_embedding)
+        query_link = select(
+            literal(RETURN_TYPE.LINK.value).label("kind"),
+            cast(null(), String).label("subject_id"),
+            *[link_column.label(link_column.key) for link_column in FUZZY_LINK_COLUMNS],
+            func.coalesce(distance, 0.0).label("distance"),
+        ).where(SubjectLinkDB.onto_hash == self.identifier)
+        if query.from_id is not None:
+            if isinstance(query.from_id, str):
+                query.from_id = [query.from_id]
+            from_parents = select(
+                self.__ancestors(query.from_id, f"{name}_from_parents")
+            )
+            from_condition = SubjectLinkDB.from_id.in_(from_parents)
+            if query.include_thing:
+                from_condition = or_(from_condition, SubjectLinkDB.from_id == THING)
+            query_link = query_link.where(from_condition)
+        if query.to_id is not None:
+            to_parents = select(self.__ancestors([query.to_id], f"{name}_to_parents"))
+            to_condition = SubjectLinkDB.to_id.in_(to_parents)
+            if query.include_thing:
+                to_condition = or_(to_condition, SubjectLinkDB.to_id == THING)
+            query_link = query_link.where(to_condition)
+        if query.relation_type == RELATION_TYPE.INSTANCE:
+            query_link = query_link.where(
+                SubjectLinkDB.to_id != None,
+            )
+        elif query.relation_type == RELATION_TYPE.PROPERTY:
+            query_link = query_link.where(
+                SubjectLinkDB.to_id == None,
+                SubjectLinkDB.to_proptype != None,  # constraint to known proptypes
+            )
+        if query.order == FUZZY_QUERY_ORDER.SCORE:
+            return self.__nearest(
+                query_link,
+                SubjectLinkDB,
+                query_embedding,
+                query.limit,
+                query.skip,
+                entity=False,
+            )
+        return (
+            query_link.order_by(SubjectLinkDB.instance_count)
+            .offset(query.skip)
+            .limit(query.limit)
+        )
+
     def search_fuzzy(self, query: FuzzyQuery):
-        with Session(self.engine) as session:
-            query_embedding = self.__embed_query(query, session)
+        return self.search_fuzzy_many([query])[0]
 
-            results: list[FuzzyQueryResult] = []
-            if query.type == RETURN_TYPE.SUBJECT or query.type == RETURN_TYPE.BOTH:
-                order_by = (
-                    SubjectInDB.embedding.cosine_distance(query_embedding)
-                    if query.order == FUZZY_QUERY_ORDER.SCORE
-                    else SubjectInDB.instance_count
-                )
-                query_subject = (
-                    select(
-                        SubjectInDB,
-                        SubjectInDB.embedding.cosine_distance(query_embedding).label(
-                            "distance"
-                        ),
-                    )
-                    .where(SubjectInDB.onto_hash == self.identifier)
-                    .order_by(order_by)
-                    .offset(query.skip)
-                    .limit(query.limit)
-                )
-                if query.entity_type is not None:
-                    query_subject = query_subject.where(
-                        SubjectInDB.subject_type == query.entity_type
-                    )
-                subjects = session.execute(query_subject).all()
-                subjects_enriched = [
-                    (self.oman.enrich_subject(s[0].subject_id), s.distance)
-                    for s in subjects
-                ]
-                for s in subjects_enriched:
-                    results.append(FuzzyQueryResult(subject=s[0], score=s[1]))
-            if query.type == RETURN_TYPE.LINK or query.type == RETURN_TYPE.BOTH:
-                order_by = (
-                    SubjectLinkDB.embedding.cosine_distance(query_embedding)
-                    if query.order == FUZZY_QUERY_ORDER.SCORE
-                    else SubjectLinkDB.instance_count
-                )
-                query_link = select(
-                    SubjectLinkDB,
-                    SubjectLinkDB.embedding.cosine_distance(query_embedding).label(
-                        "distance"
+    def search_fuzzy_many(self, queries: list[FuzzyQuery]) -> list[FuzzyQueryResults]:
+        """
+        Subjects and links closest to each query, ranked in one statement for all
+        queries. The query texts are encoded in one batch, ancestors of
+        `from_id`/`to_id` come from the stored class hierarchy and the subjects of
+        all results are enriched once, in one (cached) batch.
+        """
+        if len(queries) == 0:
+            return []
+        texts = [
+            query.q for query in queries if query.q is not None and len(query.q) > 0
+        ]
+        text_embeddings = iter(
+            self.embedder.encode(texts, prompt_name=self.query_prompt_name)
+            if len(texts) > 0
+            else []
+        )
+        with Session(self.engine) as session:
+            self.vector_index.configure(
+                session,
+                self.projection.candidates(
+                    max((query.skip or 0) + (query.limit or 0) for query in queries)
+                ),
+            )
+            statements = []
+            for index, query in enumerate(queries):
+                query_embedding = self.__embed_query(
+                    query,
+                    session,
+                    (
+                        next(text_embeddings)
+                        if query.q is not None and len(query.q) > 0
+                        else None
                     ),
-                ).where(SubjectLinkDB.onto_hash == self.identifier)
-                if query.from_id is not None:
-                    if isinstance(query.from_id, str):
-                        query.from_id = [query.from_id]
-                    from_parents = [
-                        self.oman.get_parents(from_id) + [from_id]
-                        for from_id in query.from_id
-                    ]
-                    from_parents = [
-                        item for sublist in from_parents for item in sublist
-                    ]
-                    if query.include_thing:
-                        from_parents.append("owl:Thing")
-                    query_link = query_link.where(
-                        SubjectLinkDB.from_id.in_(from_parents),
-                    )
-                if query.to_id is not None:
-                    to_parents = self.oman.get_parents(query.to_id) + [query.to_id]
-                    if query.include_thing:
-                        to_parents.append("owl:Thing")
-                    query_link = query_link.where(SubjectLinkDB.to_id.in_(to_parents))
-                if query.relation_type == RELATION_TYPE.INSTANCE:
-                    query_link = query_link.where(
-                        SubjectLinkDB.to_id != None,
-                    )
-                elif query.relation_type == RELATION_TYPE.PROPERTY:
-                    query_link = query_link.where(
-                        SubjectLinkDB.to_id == None,
-                        SubjectLinkDB.to_proptype
-                        != None,  # constraint to known proptypes
+                )
+                branches = []
+                if query.type == RETURN_TYPE.SUBJECT or query.type == RETURN_TYPE.BOTH:
+                    branches.append(self.__fuzzy_subjects(query, query_embedding))
+                if query.type == RETURN_TYPE.LINK or query.type == RETURN_TYPE.BOTH:
+                    branches.append(
+                        self.__fuzzy_links(query, query_embedding, f"ranked_{index}")
                     )
-                query_link = query_link.order_by(order_by)
-                links = session.execute(
-                    query_link.offset(query.skip).limit(query.limit)
-                ).all()
+                ranked = union_all(*branches).subquery(f"ranked_{index}")
+                statements.append(select(literal(index).label("query_index"), ranked))
+            ranked = union_all(*statements).subquery("ranked")
+            rows = session.execute(
+                select(ranked).order_by(ranked.c.query_index, ranked.c.distance)
+            ).all()
 
-                links_enriched = [(l[0].from_db(self.oman), l.distance) for l in links]
+        # subjects recurring across queries and links are enriched once
+        subject_ids = [row.subject_id for row in rows if row.subject_id is not None]
+        link_rows = [row for row in rows if row.kind == RETURN_TYPE.LINK.value]
+        for row in link_rows:
+            subject_ids.extend([row.from_id, row.to_id])
+        subject_ids = list(dict.fromkeys(subject_ids))
+        enriched = dict(zip(subject_ids, self.oman.enrich_subjects(subject_ids)))
+        links = iter(
+            SubjectLinkDB.with_subjects(
+                link_rows,
+                [enriched[row.from_id] for row in link_rows],
+                [enriched[row.to_id] for row in link_rows],
+            )
+        )
 
-                for l in links_enriched:
-                    results.append(
-                        FuzzyQueryResult(
-                            link=l[0], score=l[1] if l[1] is not None else 0.0
-                        )
-                    )
-            results = sorted(results, key=lambda x: x.score, reverse=False)
-            return FuzzyQueryResults(results=results)
+        results: list[list[FuzzyQueryResult]] = [[] for _ in queries]
+        for row in rows:
+            if row.kind == RETURN_TYPE.SUBJECT.value:
+                result = FuzzyQueryResult(
+                    subject=enriched[row.subject_id], score=row.distance
+                )
+            else:
+                result = FuzzyQueryResult(link=next(links), score=row.distance)
+            results[row.query_index].append(result)
+        return [FuzzyQueryResults(results=result) for result in results]
 
     def search_subclasses(self, query: FuzzyQuery):
         with Session(self.engine) as session:
@@ -335,11 +583,28 @@ class GuidanceManager:
                 .order_by(SubjectInDB.embedding.cosine_distance(query_embedding))
             )
             results = session.execute(query).all()
+            subjects_enriched = self.oman.enrich_subjects(
+                [s[0].subject_id for s in results]
+            )
             results = [
                 FuzzyQueryResult(
-                    subject=self.oman.enrich_subject(s[0].subject_id),
+                    subject=subject,
                     score=s.distance if s.distance is not None else 0.0,
                 )
-                for s in results
+                for s, subject in zip(results, subjects_enriched)
             ]
             return FuzzyQueryResults(results=results)
+
+    def vector_index_report(
+        self, queries: list[str], k: int = 25
+    ) -> list[VectorIndexReport]:
+        """Compares indexed and exact search for the given example queries."""
+        embeddings = self.embedder.encode(queries, prompt_name=self.query_prompt_name)
+        return self.vector_index.report(list(embeddings), k=k)
+
+    def projection_report(
+        self, queries: list[str], k: int = 25
+    ) -> list[ProjectionReport]:
+        """Recall of the reduced-dimension search for the given example queries."""
+        embeddings = self.embedder.encode(queries, prompt_name=self.query_prompt_name)
+        return self.projection.report(list(embeddings), k=k)
@@ -0,0 +1,110 @@
+from __future__ import annotations
+from hashlib import sha1
+from typing import TYPE_CHECKING, Callable, Iterable
+import json
+import threading
+import traceback
+
+from cachetools import LRUCache
+from pydantic import BaseModel
+
+from redis_cache import RedisCache
+
+if TYPE_CHECKING:
+    from llama_cpp import LlamaGrammar
+
+
+class GrammarCache:
+    """
+    Bounded LRU of constrained response models and their compiled llama.cpp
+    grammars, keyed on a canonical signature of the allowed values, so a repeated
+    candidate set skips the GBNF generation and compilation. Compiled grammars
+    stay in the process; the optional shared tier keeps the GBNF text in Redis,
+    so other workers and restarts only compile it.
+    """
+
+    def __init__(
+        self,
+        max_items: int = 128,
+        ttl: float = 7 * 24 * 60 * 60,
+        redis_cache: RedisCache | None = None,
+        prefix: str = "gbnf",
+    ):
+        self.ttl = ttl
+        self.prefix = prefix
+        self.local: LRUCache[str, tuple[type[BaseModel], LlamaGrammar]] = LRUCache(
+            maxsize=max_items
+        )
+        self.shared = redis_cache
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def signature(root: str, **allowed: Iterable | None) -> str:
+        """
+        Order independent signature of a response model, `allowed` maps every
+        constrained field to its values (None if unconstrained).
+        """
+        canonical = {
+            name: (
+                sorted(json.dumps(value) for value in values)
+                if values is not None
+                else None
+            )
+            for name, values in allowed.items()
+        }
+        return sha1(json.dumps([root, canonical], sort_keys=True).encode()).hexdigest()
+
+    def key(self, signature: str) -> str:
+        return f"{self.prefix}:{signature}"
+
+    def __gbnf(self, key: str, model: type[BaseModel]) -> str:
+        from llama_cpp_agent.gbnf_grammar_generator.gbnf_grammar_from_pydantic_models import (
+            generate_gbnf_grammar_from_pydantic_models,
+        )
+
+        if self.shared is not None:
+            try:
+                data = self.shared.get_raw(key)
+                if data is not None:
+                    return data.decode()
+            except Exception as e:
+                print(traceback.format_exc())
+                print("Failed to read shared grammar cache", e)
+        gbnf = generate_gbnf_grammar_from_pydantic_models(
+            [model], model.__name__, add_inner_thoughts=False
+        )
+        if self.shared is not None:
+            try:
+                self.shared.set_raw(key, gbnf, ttl=int(self.ttl))
+            except Exception as e:
+                print(traceback.format_exc())
+                print("Failed to write shared grammar cache", e)
+        return gbnf
+
+    def get(
+        self, signature: str, build: Callable[[], type[BaseModel]]
+    ) -> tuple[type[BaseModel], LlamaGrammar]:
+        """
+        The response model and grammar of `signature`, `build` creates the model
+        on a miss. Grammars are only read while sampling, so requests share them.
+        """
+        from llama_cpp import LlamaGrammar
+
+        key = self.key(signature)
+        with self.lock:
+            entry = self.local.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            self.misses += 1
+        model = build()
+        grammar = LlamaGrammar.from_string(self.__gbnf(key, model), verbose=False)
+        with self.lock:
+            self.local[key] = (model, grammar)
+        return model, grammar
+
+    def clear(self):
+        with self.lock:
+            self.local.clear()
@@ -4,14 +4,17 @@ from sqlalchemy import select, text, func, and_
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field, create_model
 from enum import Enum
+from typing import Callable
+from uuid import uuid4
 import datetime
-from fastapi import BackgroundTasks
+import json
 import numpy as np
 import tqdm
 
 from utils import escape_sparql_var, fix_json
 
 from explorative.explorative_support import GuidanceManager
+from explorative.grammar_cache import GrammarCache
 from explorative.exp_model import (
     FuzzyQuery,
     RETURN_TYPE,
@@ -29,7 +32,10 @@ from explorative.exp_model import Subject, SubjectLink
 from llama_cpp_agent.gbnf_grammar_generator.gbnf_grammar_from_pydantic_models import (
     generate_gbnf_grammar_from_pydantic_models,
 )
-from redis_cache import RedisCache
+import redis
+from job_queue import Job, JobCancelled, JobLane, JobQueue, JobStatus, JobSuperseded
+from progress_stream import ProgressStream
+from progress_store import ProgressStore
 from explorative.llm_query_gen import (
     choose_graph,
     erl_to_templated_query,
@@ -143,6 +149,10 @@ RAG_PROMPT_EXAMPLE = (
 )
 
 
+# the QueryProgress fields of the "progress" events, steps are sent on their own
+PROGRESS_HEADER = {"id", "start_time", "progress", "max_steps", "message", "status"}
+
+
 class LLMQuery(Initationatable):
     def __init__(
         self,
@@ -151,25 +161,54 @@ class LLMQuery(Initationatable):
         temperature=0.4,
         max_tokens=1024,  # 1024 is the default for llama.cpp,
         redis_url="redis://localhost:6379/0",
+        compress_progress=True,
     ):
         self.max_tokens = max_tokens
         self.zero_shot = zero_shot
         self.temperature = temperature
         self.guidance_man = topic
-        self.gbnf_erl = generate_gbnf_grammar_from_pydantic_models(
-            [EntitiesRelations], "EntitiesRelations", add_inner_thoughts=False
+        self.__grammar_erl = None
+        self.redis = redis.Redis.from_url(redis_url)
+        # header fields and steps are written separately, see __update
+        self.progress = ProgressStore(
+            self.redis,
+            QueryProgress,
+            "relations_steps",
+            prefix="llm_progress",
+            compress=compress_progress,
         )
-        self.grammar_erl = LlamaGrammar.from_string(self.gbnf_erl)
+        # queries run on the workers of api.config, not in the request's process
+        self.jobs = JobQueue(self.redis, prefix="llm_jobs")
+        self.events = ProgressStream(redis_url, client=self.redis)
 
-        self.gbnf_candidates = generate_gbnf_grammar_from_pydantic_models(
-            [Candidates], "Candidates", add_inner_thoughts=False
+    def __update(
+        self,
+        progress: QueryProgress,
+        enable_cache: bool,
+        step: BaseModel | None = None,
+    ):
+        """Stores and publishes the header and the new step."""
+        if not enable_cache:
+            return
+        # enriched_relations is the last step, it is restored from there
+        self.progress.set(progress.id, progress, step, exclude={"enriched_relations"})
+        self.events.publish(
+            progress.id, "progress", progress.model_dump_json(include=PROGRESS_HEADER)
         )
-        self.grammar_candidates = LlamaGrammar.from_string(self.gbnf_candidates)
-        self.query_id_counter = 0
-        self.cache = RedisCache[QueryProgress](model=QueryProgress, redis_url=redis_url)
+        if step is not None:
+            index = len(progress.relations_steps) - 1
+            self.events.publish(
+                progress.id,
+                "step",
+                f'{{"index": {index}, "step": {step.model_dump_json()}}}',
+            )
 
     def run_query(
-        self, query: str, progress: QueryProgress | None = None, enable_cache=True
+        self,
+        query: str,
+        progress: QueryProgress | None = None,
+        enable_cache=True,
+        checkpoint: Callable[[], None] = lambda: None,
     ):
         if progress is None:
             progress = QueryProgress(
@@ -178,67 +217,151 @@ class LLMQuery(Initationatable):
                 start_time=datetime.datetime.now().isoformat(),
                 relations_steps=[],
             )
+        on_token = None
+        if enable_cache:
+
+            def on_token(token: str):
+                self.events.publish(
+                    progress.id,
+                    "token",
+                    json.dumps({"progress": progress.progress, "text": token}),
+                )
+
         progress.progress = 1
         progress.message = "Querying entities and relations"
-        if enable_cache:
-            self.cache[progress.id] = progress
+        self.__update(progress, enable_cache)
 
-        erl = self.query_erl(query)
+        checkpoint()
+        erl = self.query_erl(query, on_token)
         progress.progress = 2
         progress.message = "Fetching possible candidates"
         erl.message = "Found entities and relations"
         progress.relations_steps.append(erl)
-        if enable_cache:
-            self.cache[progress.id] = progress
+        self.__update(progress, enable_cache, erl)
 
+        checkpoint()
         candidates = self.candidates_for_erl(erl)
         progress.progress = 3
         progress.message = "Querying candidates"
         candidates.message = "Found similar candidates"
         progress.relations_steps.append(candidates)
-        if enable_cache:
-            self.cache[progress.id] = progress
+        self.__update(progress, enable_cache, candidates)
 
-        constrained_erl = self.query_constrained(query, candidates)
+        checkpoint()
+        constrained_erl = self.query_constrained(query, candidates, on_token)
         progress.progress = 4
         progress.message = "Enriching results"
         constrained_erl.message = "Constraints applied"
         progress.relations_steps.append(constrained_erl)
-        if enable_cache:
-            self.cache[progress.id] = progress
+        self.__update(progress, enable_cache, constrained_erl)
 
+        checkpoint()
         enriched_erl = self.enrich_entities_relations(constrained_erl, candidates)
         progress.progress = 5
         progress.message = "Query completed"
         enriched_erl.message = "Aligned results"
+        # also the last step, which is what the event stream sends for it
         progress.enriched_relations = enriched_erl
         progress.relations_steps.append(enriched_erl)
-        if enable_cache:
-            self.cache[progress.id] = progress
+        self.__update(progress, enable_cache, enriched_erl)
         return progress
 
-    def start_query(self, query: str, background_tasks: BackgroundTasks):
-        query_id = self.query_id_counter = self.query_id_counter + 1
-        start_time = datetime.datetime.now().isoformat()
-        query_key = f"query:{query_id}:{start_time}"
+    def start_query(
+        self, query: str, lane: JobLane = JobLane.INTERACTIVE
+    ) -> QueryProgress:
+        query_key = f"query:{uuid4().hex}"
         progress = QueryProgress(
             max_steps=5,
             id=query_key,
-            start_time=start_time,
+            start_time=datetime.datetime.now().isoformat(),
             relations_steps=[],
         )
-        self.cache[query_key] = progress
-        background_tasks.add_task(self.run_query, query, progress)
+        # stored before the job is queued, the worker continues this progress
+        self.progress.set(query_key, progress, reset=True)
+        job = self.jobs.submit({"query": query}, lane, job_id=query_key)
+        progress.status = job.status
+        return progress
+
+    def run_job(self, job: Job):
+        """Handler of the LLM query workers."""
+        progress = self.progress.get_header(job.id)
+        if progress is None:
+            progress = QueryProgress(
+                max_steps=5,
+                id=job.id,
+                start_time=datetime.datetime.now().isoformat(),
+                relations_steps=[],
+            )
+        progress.status = JobStatus.RUNNING
+        # a job run again after an expired lease starts over
+        self.progress.set(job.id, progress, reset=True)
+        try:
+            self.run_query(
+                job.payload["query"],
+                progress,
+                checkpoint=lambda: self.jobs.checkpoint(job.id, job.attempts),
+            )
+        except JobSuperseded:
+            # the attempt that took over reports the outcome
+            raise
+        except JobCancelled:
+            self.__publish_status(job.id, JobStatus.CANCELLED)
+            raise
+        except Exception as e:
+            self.__publish_status(job.id, JobStatus.FAILED, str(e))
+            raise
+        self.__publish_status(job.id, JobStatus.DONE)
+
+    def __publish_status(self, query_id: str, status: JobStatus, message=""):
+        # the last event of a query's stream
+        self.events.publish(
+            query_id, "status", json.dumps({"status": status.value, "message": message})
+        )
+
+    def query_progress(self, query_id: str) -> QueryProgress | None:
+        progress = self.progress.get(query_id)
+        if progress is None:
+            return None
+        if (
+            progress.progress == progress.max_steps
+            and len(progress.relations_steps) > 0
+        ):
+            progress.enriched_relations = EnrichedEntitiesRelations.model_validate_json(
+                self.progress.get_steps(query_id, -1)[0]
+            )
+        job = self.jobs.get(query_id)
+        if job is None:
+            return progress
+        progress.status = job.status
+        if job.error is not None:
+            progress.message = job.error
         return progress
 
-    def query_progress(self, query_id: str) -> QueryProgress:
-        return self.cache[query_id]
+    def cancel_query(self, query_id: str) -> QueryProgress | None:
+        job = self.jobs.cancel(query_id)
+        if job is not None and job.status == JobStatus.CANCELLED:
+            # never started, running ones publish it once they stop
+            self.__publish_status(query_id, JobStatus.CANCELLED)
+        return self.query_progress(query_id)
+
+    @property
+    def grammar_erl(self) -> LlamaGrammar:
+        # compiled on the first LLM query instead of at startup
+        if self.__grammar_erl is None:
+            self.__grammar_erl = LlamaGrammar.from_string(
+                generate_gbnf_grammar_from_pydantic_models(
+                    [EntitiesRelations], "EntitiesRelations", add_inner_thoughts=False
+                )
+            )
+        return self.__grammar_erl
 
     @property
     def model(self) -> Llama:
         return self.guidance_man.llama_model
 
-    def query_erl(self, query: str) -> EntitiesRelations:
+    def query_erl(
+        self, query: str, on_token: Callable[[str], None] | None = None
+    ) -> EntitiesRelations:
         messages = [
             {"role": "system", "content": ERL_PROMPT_SYSTEM},
         ]
@@ -250,7 +373,8 @@ class LLMQuery(Initationatable):
                 ]
             )
         messages.append({"role": "user", "content": query})
-        response = self.model.create_chat_completion(
+        response = self.guidance_man.chat_completion(
+            on_token,
             grammar=self.grammar_erl,
             messages=messages,
             max_tokens=self.max_tokens,
@@ -261,14 +385,20 @@ class LLMQuery(Initationatable):
         return EntitiesRelations.model_validate(fixed_response)
 
     def query_constrained(
-        self, query: str, candidates: Candidates
+        self,
+        query: str,
+        candidates: Candidates,
+        on_token: Callable[[str], None] | None = None,
     ) -> EntitiesRelations:
-        ConstrainedEntitiesRelations = self.build_constrained_classes(candidates)
-        grammar_constrained = LlamaGrammar.from_string(
-            generate_gbnf_grammar_from_pydantic_models(
-                [ConstrainedEntitiesRelations],
-                "ConstrainedEntitiesRelations",
-                add_inner_thoughts=False,
+        # candidate sets repeat across queries, so their grammars are cached
+        signature = GrammarCache.signature(
+            "ConstrainedEntitiesRelations",
+            entities=[(e.subject.subject_id, e.type) for e in candidates.entities],
+            relations=[(r.link.property_id, r.relation) for r in candidates.relations],
+        )
+        ConstrainedEntitiesRelations, grammar_constrained = (
+            self.guidance_man.grammars.get(
+                signature, lambda: self.build_constrained_classes(candidates)
             )
         )
         messages = [
@@ -282,7 +412,8 @@ class LLMQuery(Initationatable):
                 ]
             )
         messages.append({"role": "user", "content": query})
-        response = self.model.create_chat_completion(
+        response = self.guidance_man.chat_completion(
+            on_token,
             grammar=grammar_constrained,
             messages=messages,
             max_tokens=self.max_tokens,
@@ -299,16 +430,31 @@ class LLMQuery(Initationatable):
         relation_candidates: list[CandidateRelation] = []
         constraint_candidates: list[CandidateConstraint] = []
         entity_candidates: list[CandidateEntity] = []
-        for relation in erl.relations:
-            top_results = self.guidance_man.search_fuzzy(
-                query=FuzzyQuery(
-                    q=f"A {relation.entity} is {relation.relation} of {relation.target}",
-                    limit=candidate_limit,
-                    type=RETURN_TYPE.LINK,
-                    relation_type=RELATION_TYPE.INSTANCE,
-                    include_thing=False,
-                ),
+        # one encode, statement and enrichment for all relations and entities
+        relation_queries = [
+            FuzzyQuery(
+                q=f"A {relation.entity} is {relation.relation} of {relation.target}",
+                limit=candidate_limit,
+                type=RETURN_TYPE.LINK,
+                relation_type=RELATION_TYPE.INSTANCE,
+                include_thing=False,
             )
+            for relation in erl.relations
+        ]
+        entity_queries = [
+            FuzzyQuery(
+                q=f"A {entity.type}",
+                limit=candidate_limit,
+                type=RETURN_TYPE.SUBJECT,
+                relation_type=RELATION_TYPE.INSTANCE,
+                include_thing=False,
+            )
+            for entity in erl.entities
+        ]
+        top_results = self.guidance_man.search_fuzzy_many(
+            relation_queries + entity_queries
+        )
+        for relation_results in top_results[: len(relation_queries)]:
             relation_candidates.extend(
                 [
                     CandidateRelation(
@@ -318,20 +464,11 @@ class LLMQuery(Initationatable):
                         score=res.score,
                         link=res.link,
                     )
-                    for res in top_results.results
+                    for res in relation_results.results
                 ]
             )
 
-        for entity in erl.entities:
-            top_results = self.guidance_man.search_fuzzy(
-                query=FuzzyQuery(
-                    q=f"A {entity.type}",
-                    limit=candidate_limit,
-                    type=RETURN_TYPE.SUBJECT,
-                    relation_type=RELATION_TYPE.INSTANCE,
-                    include_thing=False,
-                )
-            )
+        for entity_results in top_results[len(relation_queries) :]:
             candidates = [
                 CandidateEntity(
                     type=res.subject.label,
@@ -339,7 +476,7 @@ class LLMQuery(Initationatable):
                     identifier=res.subject.label,
                     subject=res.subject,
                 )
-                for res in top_results.results
+                for res in entity_results.results
             ]
             entity_candidates.extend(candidates)
             # candidate_ids = [c.subject.subject_id for c in candidates]
@@ -607,7 +744,7 @@ class LLMQuery(Initationatable):
                 k, guidance_man=self.guidance_man, seed=seed + i, top_k=10
             )
             query_graph_reduced = reduce_erl(query_graph)
-            query_response = self.guidance_man.llama_model.create_chat_completion(
+            query_response = self.guidance_man.chat_completion(
                 # grammar=self.grammar_erl,
                 messages=[
                     {
@@ -686,6 +823,25 @@ class LLMQuery(Initationatable):
                 .filter(SampledGraphDB.onto_hash == self.guidance_man.identifier)
                 .all()
             )
+            subject_ids = [
+                entity.subject.subject_id
+                for graph in graphs
+                for entity in graph.graph_entities
+            ]
+            subjects = dict(
+                zip(subject_ids, self.guidance_man.oman.enrich_subjects(subject_ids))
+            )
+            subject_links = [
+                link.subject_link for graph in graphs for link in graph.graph_links
+            ]
+            links = dict(
+                zip(
+                    [link.link_id for link in subject_links],
+                    SubjectLinkDB.from_db_many(
+                        subject_links, self.guidance_man.oman
+                    ),
+                )
+            )
             examples = []
             for graph in graphs:
                 query_graph = EnrichedEntitiesRelations(message=graph.graph_query)
@@ -694,9 +850,7 @@ class LLMQuery(Initationatable):
                         identifier=f"{escape_sparql_var(entity.subject.subject_id)}_{entity.entity_id}",
                         constraints=[],
                         type=entity.subject.subject_id,
-                        subject=self.guidance_man.oman.enrich_subject(
-                            entity.subject.subject_id
-                        ),
+                        subject=subjects[entity.subject.subject_id],
                     )
                     query_graph.entities.append(enriched_entity)
                 for link in graph.graph_links:
@@ -704,7 +858,7 @@ class LLMQuery(Initationatable):
                         entity=f"{escape_sparql_var(link.from_entity.subject.subject_id)}_{link.from_entity.entity_id}",
                         relation=link.subject_link.property_id,
                         target=f"{escape_sparql_var(link.to_entity.subject.subject_id)}_{link.to_entity.entity_id}",
-                        link=link.subject_link.from_db(self.guidance_man.oman),
+                        link=links[link.subject_link.link_id],
                     )
                     query_graph.relations.append(enriched_relation)
                 examples.append(query_graph)
@@ -19,6 +19,7 @@ from sqlalchemy.sql import text
 from rdflib.plugins.stores.sparqlstore import SPARQLStore
 from model import Subject
 from pydantic import BaseModel, Field, create_model
+from job_queue import JobStatus
 
 from ontology import OntologyManager, OntologyConfig, Graph
 from explorative.explorative_support import GuidanceManager, select
@@ -113,6 +114,7 @@ class QueryProgress(BaseModel):
         EntitiesRelations | Candidates | EnrichedEntitiesRelations
     ] = Field([])
     enriched_relations: EnrichedEntitiesRelations | None = None
+    status: JobStatus | None = Field(None, description="State of the query's job")
 
 
 class EnrichedDBEntity(Entity, arbitrary_types_allowed=True):
@@ -0,0 +1,153 @@
+from rdflib import URIRef
+from sqlalchemy import Engine, delete, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+import traceback
+
+from ontology import OntologyManager
+from explorative.exp_model import OntologyStatisticDB
+
+CLASS_COUNTS_QUERY = """
+SELECT ?entity (COUNT(?s) as ?count) WHERE {{
+    {values}
+    ?s a ?entity
+}} GROUP BY ?entity"""
+PROPERTY_COUNTS_QUERY = """
+SELECT ?entity (COUNT(?s) as ?count) WHERE {{
+    {values}
+    ?s ?entity ?o
+}} GROUP BY ?entity"""
+QUERIES = {"class": CLASS_COUNTS_QUERY, "property": PROPERTY_COUNTS_QUERY}
+
+
+class OntologyStatistics:
+    """
+    Class cardinalities and predicate frequencies of one ontology.
+    Built with one grouped query per kind, persisted in `ontology_statistics` and
+    held in memory, so counts are dictionary lookups instead of COUNT scans.
+    """
+
+    def __init__(self, oman: OntologyManager, engine: Engine, identifier: str):
+        self.oman = oman
+        self.engine = engine
+        self.identifier = identifier
+        self.counts: dict[str, dict[str, int]] | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.counts is not None
+
+    def __query_counts(
+        self, kind: str, entities: list[URIRef] | None = None
+    ) -> dict[str, int]:
+        values = (
+            f"VALUES ?entity {{ {' '.join(e.n3() for e in entities)} }}"
+            if entities is not None
+            else ""
+        )
+        rows = self.oman.onto.query(QUERIES[kind].format(values=values))
+        return {
+            str(entity): int(count.value)
+            for entity, count in rows
+            if isinstance(entity, URIRef)
+        }
+
+    def build(self):
+        """Recomputes all counts of the ontology and replaces the stored ones."""
+        counts = {kind: self.__query_counts(kind) for kind in QUERIES}
+        with Session(self.engine) as session:
+            session.execute(
+                delete(OntologyStatisticDB).where(
+                    OntologyStatisticDB.onto_hash == self.identifier
+                )
+            )
+            rows = [
+                {
+                    "onto_hash": self.identifier,
+                    "kind": kind,
+                    "entity_id": entity,
+                    "count": count,
+                }
+                for kind, kind_counts in counts.items()
+                for entity, count in kind_counts.items()
+            ]
+            for i in range(0, len(rows), 10_000):
+                session.execute(insert(OntologyStatisticDB), rows[i : i + 10_000])
+            session.commit()
+        self.counts = counts
+        print(
+            "Built statistics for",
+            {kind: len(kind_counts) for kind, kind_counts in counts.items()},
+        )
+
+    def load(self) -> bool:
+        """Loads stored counts, returns False if there are none for this ontology."""
+        try:
+            with Session(self.engine) as session:
+                rows = session.execute(
+                    select(
+                        OntologyStatisticDB.kind,
+                        OntologyStatisticDB.entity_id,
+                        OntologyStatisticDB.count,
+                    ).where(OntologyStatisticDB.onto_hash == self.identifier)
+                ).all()
+        except Exception as e:
+            print(traceback.format_exc())
+            print("Failed to load ontology statistics", e)
+            return False
+        if len(rows) == 0:
+            return False
+        counts: dict[str, dict[str, int]] = {kind: {} for kind in QUERIES}
+        for kind, entity, count in rows:
+            counts[kind][entity] = count
+        self.counts = counts
+        return True
+
+    def refresh(self, kind: str, entities: list[str], batch_size=256):
+        """
+        Recounts only the given classes or properties (IRIs or prefixed names),
+        e.g. after parts of the data changed.
+        """
+        if self.counts is None:
+            self.counts = {k: {} for k in QUERIES}
+        terms = []
+        for entity in entities:
+            term = self.oman.term_for(entity)
+            if term is not None:
+                terms.append(term)
+        for i in range(0, len(terms), batch_size):
+            batch = terms[i : i + batch_size]
+            counts = self.__query_counts(kind, batch)
+            rows = [
+                {
+                    "onto_hash": self.identifier,
+                    "kind": kind,
+                    "entity_id": str(term),
+                    "count": counts.get(str(term), 0),
+                }
+                for term in batch
+            ]
+            statement = pg_insert(OntologyStatisticDB).values(rows)
+            with Session(self.engine) as session:
+                session.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=["onto_hash", "kind", "entity_id"],
+                        set_={"count": statement.excluded["count"]},
+                    )
+                )
+                session.commit()
+            for row in rows:
+                self.counts[kind][row["entity_id"]] = row["count"]
+
+    def count(self, kind: str, iri: str) -> int | None:
+        """Count for a full IRI, None if no statistics are loaded."""
+        if self.counts is None:
+            return None
+        # classes without instances do not appear in the grouped result
+        return self.counts[kind].get(iri, 0)
+
+    def instance_count(self, iri: str) -> int | None:
+        return self.count("class", iri)
+
+    def property_count(self, iri: str) -> int | None:
+        return self.count("property", iri)
@@ -3,7 +3,17 @@ from bertopic.representation import LangChain, LlamaCPP
 from scipy.cluster import hierarchy as sch
 
 
-from sqlalchemy import text, inspect, create_engine, select, delete
+from sqlalchemy import (
+    bindparam,
+    create_engine,
+    delete,
+    exists,
+    func,
+    inspect,
+    select,
+    text,
+    update,
+)
 from sqlalchemy.orm import Session
 from model import Subject
 from tqdm import tqdm
@@ -14,6 +24,7 @@ import numpy as np
 from eval_config import EvalConfig
 from explorative.exp_model import TopicDB, SubjectLinkDB, SubjectInDB, BasePostgres
 from explorative.explorative_support import GuidanceManager
+from explorative.bulk_loader import BulkLoader
 
 from initiator import Initationatable, InitatorManager
 from utils import to_readable
@@ -57,9 +68,34 @@ TOPIC_LLAMA3_PROMPT = (
 )
 
 
+# columns written by the bulk loader
+CLASS_COLUMNS = [
+    "subject_id",
+    "comment",
+    "label",
+    "onto_hash",
+    "parent_id",
+    "subject_type",
+    "instance_count",
+    "embedding",
+]
+LINK_COLUMNS = [
+    "from_id",
+    "to_id",
+    "to_proptype",
+    "property_id",
+    "description",
+    "link_type",
+    "label",
+    "instance_count",
+]
+TOPIC_COLUMNS = ["topic_id", "parent_topic_id", "topic", "count", "doc_string"]
+
+
 class TopicInitator:
     def __init__(self, guidance_man: GuidanceManager):
         self.guidance_man = guidance_man
+        self.loader = BulkLoader(guidance_man.engine)
         self.__all_classes = None
         self.__prop_range_label_cache = {}
 
@@ -75,16 +111,20 @@ class TopicInitator:
     }
     """
         )[0].to_list()
-        all_class_iter = tqdm(all_classes, desc="Enriching classes")
-        all_classes: dict[str, Subject] = {}
-        for c in all_class_iter:
-            all_class_iter.set_description(f"Enriching {c}")
-            all_classes[c] = self.guidance_man.oman.enrich_subject(
-                c, load_properties=True
-            )
+        chunk_size = 1024
+        enriched: dict[str, Subject] = {}
+        for i in tqdm(
+            range(0, len(all_classes), chunk_size),
+            desc=f"Enriching {len(all_classes)} classes",
+        ):
+            # batched queries per chunk, keyed by the readable id callers look up
+            for subject in self.guidance_man.oman.enrich_subjects(
+                all_classes[i : i + chunk_size], load_properties=True
+            ):
+                enriched[subject.subject_id] = subject
 
-        self.__all_classes = all_classes
-        return all_classes
+        self.__all_classes = enriched
+        return enriched
 
     def model_topics(self):
         representation_llama = LlamaCPP(
@@ -129,118 +169,149 @@ class TopicInitator:
         topic_ids = topic_model_llm.get_topic_info()
         # Save the model
         # topic_model_llm.save(f"model_{self.guidance_man.identifier}.pkl")
+        topic_map: dict[int, dict] = {}
+        for i, topic in topic_ids.iterrows():
+            topic_id = int(topic["Topic"])
+            topic_label = topic_model_llm.get_topic(topic["Topic"])[0][0]
+            repr_docs = "\n".join(topic["Representative_Docs"])
+            topic_map[topic_id] = {
+                "topic_id": topic_id,
+                "topic": topic_label,
+                "doc_string": repr_docs,
+                "count": 0,
+                "parent_topic_id": None,
+            }
+        leaf_ids = list(topic_map.keys())
+        leaf_embeddings = self.guidance_man.embedder.encode(
+            [
+                f"{topic_map[id]['topic']}\n\n{topic_map[id]['doc_string']}"
+                for id in leaf_ids
+            ],
+            use_cache=False,
+        )
+        for id, embedding in zip(leaf_ids, leaf_embeddings):
+            topic_map[id]["embedding"] = embedding
+
+        subject_topics: list[dict] = []
+        individual_topics: list[dict] = []
+        property_topics: list[dict] = []
+        doc_info = topic_model_llm.get_document_info(docs["doc"], docs)
+        for i, doc in doc_info.iterrows():
+            topic_id = int(doc["Topic"])
+            if topic_id not in topic_map:
+                continue
+            if doc["type"] == "subclass":
+                subject_topics.append({"b_id": doc["subject_id"], "b_topic": topic_id})
+            elif doc["type"] == "named_individual":
+                individual_topics.append(
+                    {"b_id": doc["named_individual_id"], "b_topic": topic_id}
+                )
+            elif doc["type"] == "property":
+                property_topics.append(
+                    {"b_id": doc["property_id"], "b_topic": topic_id}
+                )
+
+        for i, topic in hierarchical_topics.iterrows():
+            parent_name: str = topic["Parent_Name"]
+            parent_name = parent_name.strip("_")
+            id = int(topic["Parent_ID"])
+            topic_map[id] = {
+                "topic_id": id,
+                "topic": parent_name,
+                "doc_string": None,
+                "count": 0,
+                "parent_topic_id": None,
+                "embedding": None,
+            }
+        sub_topic_ids: dict[int, list[int]] = {id: [] for id in topic_map}
+        for i, topic in hierarchical_topics.iterrows():
+            for st in ["Child_Left_ID", "Child_Right_ID"]:
+                topic_map[int(topic[st])]["parent_topic_id"] = int(topic["Parent_ID"])
+                sub_topic_ids[int(topic["Parent_ID"])].append(int(topic[st]))
+
+        # Aggregate embeddings
+        # --> seems to be a bit too average-y -> parent topics are now combined
+        def get_and_set_aggregated_embedding(topic: dict) -> list[str]:
+            if len(sub_topic_ids[topic["topic_id"]]) == 0:
+                return [topic["topic"] + "\n" + topic["doc_string"]]
+            sub_topics = [
+                topic_str
+                for sub_topic_id in sub_topic_ids[topic["topic_id"]]
+                for topic_str in get_and_set_aggregated_embedding(
+                    topic_map[sub_topic_id]
+                )
+            ]
+            topic_description = "\n".join(sub_topics)
+            topic["embedding"] = self.guidance_man.embedder.encode(
+                f"{topic['topic']}\n\n{topic_description}", use_cache=False
+            )
+            return [topic["topic"]] + sub_topics
+
+        [
+            get_and_set_aggregated_embedding(topic)
+            for topic in topic_map.values()
+            if topic["parent_topic_id"] is None
+        ]
+
+        identifier = self.guidance_man.identifier
         with Session(self.guidance_man.engine) as session:
             # https://stackoverflow.com/a/48057795
             # defer for *current* transaction!
             session.execute(text("SET CONSTRAINTS ALL DEFERRED"))
-            session.execute(
-                delete(TopicDB).where(TopicDB.onto_hash == self.guidance_man.identifier)
-            )
-            topic_map: dict[int, TopicDB] = {}
-            for i, topic in topic_ids.iterrows():
-                topic_id = topic["Topic"]
-                topic_label = topic_model_llm.get_topic(topic["Topic"])[0][0]
-                repr_docs = "\n".join(topic["Representative_Docs"])
-
-                topic_embedding = self.guidance_man.embedding_model.encode(
-                    f"{topic_label}\n\n{repr_docs}"
-                )
-                topic_db = TopicDB(
-                    topic_id=topic_id,
-                    topic=topic_label,
-                    doc_string=repr_docs,
-                    embedding=topic_embedding,
+            for model in [SubjectInDB, SubjectLinkDB]:
+                session.execute(
+                    update(model)
+                    .where(model.onto_hash == identifier)
+                    .values(topic_id=None)
                 )
-                # elif doc["type"] == "property":
-                #     link=session.execute(
-                #         select(SubjectLinkDB).where(SubjectLinkDB.property_id == doc["property_id"])
-                #     ).first()
-                #     if link is not None:
-                #         topic_db.subjects.append(link)
-                topic_map[topic_id] = topic_db
-
-            doc_info = topic_model_llm.get_document_info(docs["doc"], docs)
-            for i, doc in doc_info.iterrows():
-                topic_id = doc["Topic"]
-                if doc["type"] == "subclass":
-                    subject = session.execute(
-                        select(SubjectInDB).where(
-                            SubjectInDB.subject_id == doc["subject_id"]
-                        )
-                    ).first()
-                    if subject is not None and topic_id in topic_map:
-                        subject[0].topic_id = topic_id
-                        print(topic_id, doc["Document"], doc["subject_id"])
-                elif doc["type"] == "named_individual":
-                    subject = session.execute(
-                        select(SubjectInDB).where(
-                            SubjectInDB.subject_id == doc["named_individual_id"],
-                            SubjectInDB.subject_type == "individual",
-                        )
-                    ).first()
-                    if subject is not None and topic_id in topic_map:
-                        subject[0].topic_id = topic_id
-                elif doc["type"] == "property":
-                    link = session.execute(
-                        select(SubjectLinkDB).where(
-                            SubjectLinkDB.property_id == doc["property_id"]
-                        )
-                    ).first()
-                    if link is not None and topic_id in topic_map:
-                        link[0].topic_id = topic_id
-            for i, topic in hierarchical_topics.iterrows():
-                parent_name: str = topic["Parent_Name"]
-                parent_name = parent_name.strip("_")
-                id = int(topic["Parent_ID"])
-                topic_db = TopicDB(topic_id=id, topic=parent_name)
-                topic_map[id] = topic_db
-            for i, topic in hierarchical_topics.iterrows():
-                sub_topics = [
-                    topic_map[int(topic[st])]
-                    for st in ["Child_Left_ID", "Child_Right_ID"]
-                ]
-                for sub_topic in sub_topics:
-                    topic_map[int(sub_topic.topic_id)].parent_topic_id = int(
-                        topic["Parent_ID"]
-                    )
-
-            for topic in topic_map.values():
-                topic.onto_hash = self.guidance_man.identifier
-                # if topic.embedding is None:
-                #     topic.embedding = self.guidance_man.embedding_model.encode(topic.topic)
-                topic.onto_hash = self.guidance_man.identifier
-                session.add(topic)
             session.commit()
 
-            # Aggregate embeddings
-            # --> seems to be a bit too average-y -> parent topics are now combined
-            root_topics = session.execute(
-                select(TopicDB).where(
-                    TopicDB.onto_hash == self.guidance_man.identifier,
-                    TopicDB.parent_topic_id == None,
-                )
-            ).fetchall()
-
-            def get_and_set_aggregated_embedding(topic: TopicDB) -> list[str]:
-                if len(topic.sub_topics) == 0:
-                    return [topic.topic + "\n" + topic.doc_string]
-                sub_topics = [
-                    topic_str
-                    for sub_topic in topic.sub_topics
-                    for topic_str in get_and_set_aggregated_embedding(sub_topic)
-                ]
-                topic_description = "\n".join(sub_topics)
-                aggregated_embedding = self.guidance_man.embedding_model.encode(
-                    f"{topic.topic}\n\n{topic_description}"
-                )
-                topic.embedding = aggregated_embedding
-                session.add(topic)
-                return [topic.topic] + sub_topics
+        self.loader.replace(
+            TopicDB,
+            identifier,
+            topic_map.values(),
+            TOPIC_COLUMNS + ["embedding"],
+        )
 
-            [
-                get_and_set_aggregated_embedding(root_topic[0])
-                for root_topic in root_topics
+        with Session(self.guidance_man.engine) as session:
+            session.execute(text("SET CONSTRAINTS ALL DEFERRED"))
+            connection = session.connection()
+            assignments = [
+                (
+                    update(SubjectInDB).where(
+                        SubjectInDB.subject_id == bindparam("b_id"),
+                        SubjectInDB.onto_hash == identifier,
+                    ),
+                    subject_topics,
+                ),
+                (
+                    update(SubjectInDB).where(
+                        SubjectInDB.subject_id == bindparam("b_id"),
+                        SubjectInDB.subject_type == "individual",
+                        SubjectInDB.onto_hash == identifier,
+                    ),
+                    individual_topics,
+                ),
+                (
+                    # the first link of the property
+                    update(SubjectLinkDB).where(
+                        SubjectLinkDB.link_id
+                        == select(func.min(SubjectLinkDB.link_id))
+                        .where(
+                            SubjectLinkDB.property_id == bindparam("b_id"),
+                            SubjectLinkDB.onto_hash == identifier,
+                        )
+                        .scalar_subquery()
+                    ),
+                    property_topics,
+                ),
             ]
+            for statement, params in assignments:
+                if len(params) > 0:
+                    # executemany, not an ORM bulk update by primary key
+                    connection.execute(
+                        statement.values(topic_id=bindparam("b_topic")), params
+                    )
             session.commit()
 
     def embed_property(self, p: Subject, cls: Subject) -> SubjectLinkDB:
@@ -293,171 +364,158 @@ class TopicInitator:
             )
         return subject_links
 
-    def embed_relations(self):
+    def __describe_class(self, cls: Subject) -> tuple[dict, str]:
+        comment = (
+            cls.spos["rdfs:comment"].first_value() if "rdfs:comment" in cls.spos else ""
+        )
+        subcls = (
+            cls.spos["rdfs:subClassOf"].first_value()
+            if "rdfs:subClassOf" in cls.spos
+            else ""
+        )
+        subcls_desc = ""
+        if len(subcls) > 0:
+            parent_cls = self.all_classes.get(subcls)
+            if parent_cls is None:
+                parent_cls = self.guidance_man.oman.enrich_subject(subcls)
+            subcls_desc = f"A {cls.label} is a {parent_cls.label}."
+        desc_short = f"""A {cls.label} is a {cls.subject_type}. {subcls_desc} {comment}
+                    """
+        row = {
+            "subject_id": cls.subject_id,
+            "comment": comment if len(comment) > 0 else None,
+            "label": cls.label,
+            "onto_hash": self.guidance_man.identifier,
+            "parent_id": subcls if len(subcls) > 0 else None,
+            "subject_type": cls.subject_type,
+            "instance_count": cls.instance_count,
+        }
+        return row, desc_short
+
+    def __save_classes(self, session: Session, resume=False, batch_size=512):
+        """
+        Describes all classes first, then embeds and bulk inserts them in batches,
+        committing each batch. When resuming, classes stored by an earlier
+        (interrupted) run are skipped.
+        """
+        stored = set()
+        if resume:
+            stored = set(
+                session.execute(
+                    select(SubjectInDB.subject_id).where(
+                        SubjectInDB.onto_hash == self.guidance_man.identifier,
+                        SubjectInDB.embedding != None,
+                    )
+                ).scalars()
+            )
+        rows: list[dict] = []
+        descs: list[str] = []
+        for cls in tqdm(self.all_classes.values(), desc="Describing classes"):
+            if cls.subject_id in stored:
+                continue
+            row, desc = self.__describe_class(cls)
+            rows.append(row)
+            descs.append(desc)
+        if len(stored) > 0:
+            print("Resuming with", len(rows), "of", len(self.all_classes), "classes")
+
+        for i in tqdm(range(0, len(rows), batch_size), desc="Saving classes"):
+            batch = rows[i : i + batch_size]
+            embeddings = self.guidance_man.embedder.encode(
+                descs[i : i + batch_size], use_cache=False
+            )
+            for row, embedding in zip(batch, embeddings):
+                row["embedding"] = embedding
+            # committed per batch, a resumed run continues after the last one
+            self.loader.append(SubjectInDB, batch, CLASS_COLUMNS, replica=True)
+
+    def __link_rows(self, links: list[SubjectLinkDB], batch_size=512):
+        """Link rows with their embeddings, encoded in batches while streaming."""
+        for i in tqdm(range(0, len(links), batch_size), desc="Embedding links"):
+            batch = links[i : i + batch_size]
+            embeddings = self.guidance_man.embedder.encode(
+                [link.description for link in batch], use_cache=False
+            )
+            for link, embedding in zip(batch, embeddings):
+                row = {column: getattr(link, column) for column in LINK_COLUMNS}
+                row["embedding"] = embedding
+                yield row
+
+    def fix_property_links(self) -> int:
+        """
+        Links whose target is not a stored class point to a datatype, so the
+        target moves to `to_proptype`. A single UPDATE that can be re-run, returns
+        the number of rewritten links.
+        """
+        identifier = self.guidance_man.identifier
+        with Session(self.guidance_man.engine) as session:
+            result = session.execute(
+                update(SubjectLinkDB)
+                .where(
+                    SubjectLinkDB.onto_hash == identifier,
+                    SubjectLinkDB.to_id != None,
+                    ~exists().where(
+                        SubjectInDB.subject_id == SubjectLinkDB.to_id,
+                        SubjectInDB.onto_hash == identifier,
+                    ),
+                )
+                .values(to_proptype=SubjectLinkDB.to_id, to_id=None)
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+        print("Fixed", result.rowcount, "property links")
+        return result.rowcount
+
+    def embed_relations(self, resume=False):
+        """
+        Stores and embeds all classes and links of the ontology. With `resume`,
+        classes that are already stored are kept and the links are rebuilt.
+        """
+        # ancestor lookups while embedding and searching use the closure
+        self.guidance_man.hierarchy.build()
+        self.guidance_man.oman.hierarchy = self.guidance_man.hierarchy
+
         with Session(self.guidance_man.engine) as session:
             session.execute(text("SET CONSTRAINTS ALL DEFERRED"))
             session.execute(text("SET session_replication_role = replica"))
+            self.__save_classes(session, resume)
 
             anonymous_props = self.guidance_man.oman.open_properties()
             thing = self.guidance_man.oman.enrich_subject("owl:Thing")
-
-            for i, prop in enumerate(
-                tqdm(anonymous_props, desc="Saving anonymous properties")
-            ):
+            subject_links: list[SubjectLinkDB] = []
+            for prop in tqdm(anonymous_props, desc="Describing anonymous properties"):
                 enriched_prop = self.guidance_man.oman.enrich_subject(prop)
-                subject_links = self.embed_property(enriched_prop, thing)
-                session.add_all(subject_links)
-                if i % 1000 == 0:
-                    session.commit()
-
-            session.commit()
-            all_class_ids = [self.all_classes[c].subject_id for c in self.all_classes]
-            cls_descs: dict[str, str] = {}
-            named_individuals_ids = {}
-
-            cls_it = tqdm(self.all_classes.values(), desc="Saving classes")
-            for cls in cls_it:
-                comment = (
-                    cls.spos["rdfs:comment"].first_value()
-                    if "rdfs:comment" in cls.spos
-                    else ""
-                )
-                subcls = (
-                    cls.spos["rdfs:subClassOf"].first_value()
-                    if "rdfs:subClassOf" in cls.spos
-                    else ""
-                )
-                subcls_desc = ""
-                if len(subcls) > 0:
-                    parent_cls = self.all_classes.get(
-                        subcls, self.guidance_man.oman.enrich_subject(subcls)
-                    )
-                    subcls_desc = (
-                        ""
-                        if len(subcls) == 0
-                        else f"A {cls.label} is a {parent_cls.label}."
-                    )
-                desc_short = f"""A {cls.label} is a {cls.subject_type}. {subcls_desc} {comment}
-                    """
-                cls_descs[cls.subject_id] = desc_short
-                embedding = self.guidance_man.embedding_model.encode(desc_short)
-                if cls.subject_id in named_individuals_ids.keys():
-                    session.execute(
-                        delete(SubjectInDB).where(
-                            SubjectInDB.subject_id == cls.subject_id,
-                            SubjectInDB.onto_hash == self.guidance_man.identifier,
-                        )
-                    )
-                    session.commit()
-                session.add(
-                    SubjectInDB(
-                        subject_id=cls.subject_id,
-                        embedding=embedding,
-                        comment=comment if len(comment) > 0 else None,
-                        label=cls.label,
-                        onto_hash=self.guidance_man.identifier,
-                        parent_id=subcls if len(subcls) > 0 else None,
-                        subject_type=cls.subject_type,
-                        instance_count=cls.instance_count,
-                    )
-                )
-
-                session.commit()
-                named_individuals = self.guidance_man.oman.get_named_individuals(
-                    cls.subject_id
-                )
-                # cls_it.set_description(
-                #     f"{cls.label} with {len(named_individuals)} named individuals"
-                # )
-
-                # for ne in named_individuals:
-                #     existing_individual = session.execute(
-                #         select(SubjectInDB)
-                #         .where(
-                #             SubjectInDB.subject_id == ne.subject_id,
-                #             SubjectInDB.onto_hash == self.guidance_man.identifier,
-                #         )
-                #         .limit(1)
-                #     ).first()
-                #     if (
-                #         ne.subject_id in self.all_classes.keys()
-                #         or existing_individual is not None
-                #     ):
-                #         # print(f"Named individual {ne.subject_id} is a class, skipping")
-                #         continue
-                #     if ne.subject_id in named_individuals_ids:
-                #         named_individuals_ids[ne.subject_id].parent_id = cls.subject_id
-                #         continue
-                #     ne_desc = f"{ne.label} is a {cls.label}."
-                #     ne_embedding = self.guidance_man.embedding_model.encode(ne_desc)
-                #     named_individuals_ids[ne.subject_id] = SubjectInDB(
-                #         subject_id=ne.subject_id,
-                #         embedding=ne_embedding,
-                #         label=ne.label if ne.label is not None else ne.subject_id,
-                #         onto_hash=self.guidance_man.identifier,
-                #         parent_id=cls.subject_id if len(cls.subject_id) > 0 else None,
-                #         subject_type=ne.subject_type,
-                #         instance_count=ne.instance_count,
-                #     )
-                #     session.add(named_individuals_ids[ne.subject_id])
-                #     session.commit()
-
-            session.commit()
-
-            for cls in tqdm(self.all_classes.values(), desc="Saving relations"):
+                subject_links.extend(self.embed_property(enriched_prop, thing))
+            for cls in tqdm(self.all_classes.values(), desc="Describing relations"):
                 for prop in cls.properties.keys():
                     for p in cls.properties[prop]:
-                        subject_links = self.embed_property(p, cls)
-                        session.add_all(subject_links)
-                        # print(f"Class {to_id} does not exist, skipping")
-            session.commit()
-
-            all_links = session.query(SubjectLinkDB).yield_per(100).all()
-            for i, link in enumerate(tqdm(all_links, desc="Fixing props links")):
-                if link.to_id is not None:
-                    class_exists = session.execute(
-                        select(SubjectInDB)
-                        .where(SubjectInDB.subject_id == link.to_id)
-                        .limit(1)
-                    ).first()
-                    if class_exists is None:
-                        link.to_proptype = link.to_id
-                        link.to_id = None
-
-                if i % 1000 == 0:
-                    session.commit()
-
-            session.commit()
-
-            # now do the embeddings in batches
-
-            batch_size = 64
-            total = session.query(SubjectLinkDB).count()
-            iter = tqdm("Embedding links", total=total // batch_size)
-            all_links = session.query(SubjectLinkDB).yield_per(batch_size).all()
-            offset = 0
-            has_more = True
-            while has_more:
-                # get the next batch of links
-                links = all_links[offset : offset + batch_size]
-                if len(links) == 0:
-                    has_more = False
-                    break
-                offset += len(links)
-                # get the embeddings for the links
-                descs = [link.description for link in links]
-                embeddings = self.guidance_man.embedding_model.encode(descs)
-                # update the links with the embeddings
-                for i, link in enumerate(links):
-                    link.embedding = embeddings[i]
-                session.commit()
-                iter.update(len(links) // batch_size)
+                        subject_links.extend(self.embed_property(p, cls))
+            # swapped in at once, also replaces the links of an interrupted run
+            self.loader.replace(
+                SubjectLinkDB,
+                self.guidance_man.identifier,
+                self.__link_rows(subject_links),
+                LINK_COLUMNS + ["embedding"],
+                replica=True,
+            )
+        self.fix_property_links()
 
     def initate(
-        self, reset=True, config: EvalConfig = None, force=True, *args, **kwargs
+        self,
+        reset=True,
+        config: EvalConfig = None,
+        force=True,
+        resume=False,
+        *args,
+        **kwargs,
     ):
+        """
+        (Re)builds the subjects, links and topics of the ontology. `resume`
+        continues an interrupted run: nothing is deleted and classes that are
+        already stored are not embedded again.
+        """
         init_topics = False
-        delete_tables = reset
+        delete_tables = reset and not resume
         with Session(self.guidance_man.engine) as session:
             insp = inspect(self.guidance_man.engine)
             if not insp.has_table("topics", schema="public") or not insp.has_table(
@@ -489,22 +547,34 @@ class TopicInitator:
                         TopicDB.onto_hash == self.guidance_man.identifier
                     )
                 )
-                session.execute(
-                    delete(SubjectInDB).where(
-                        SubjectInDB.onto_hash == self.guidance_man.identifier
+                if not resume:
+                    session.execute(
+                        delete(SubjectInDB).where(
+                            SubjectInDB.onto_hash == self.guidance_man.identifier
+                        )
                     )
-                )
-                session.execute(
-                    delete(SubjectLinkDB).where(
-                        SubjectLinkDB.onto_hash == self.guidance_man.identifier
+                    session.execute(
+                        delete(SubjectLinkDB).where(
+                            SubjectLinkDB.onto_hash == self.guidance_man.identifier
+                        )
                     )
-                )
                 session.commit()
 
+            # counts are looked up for every subject and property while embedding
+            self.guidance_man.statistics.build()
+            self.guidance_man.oman.statistics = self.guidance_man.statistics
+
             # embed first, then model to make sure subjects are available for topics
-            self.embed_relations()
+            self.embed_relations(resume=resume)
             self.model_topics()
 
+            # built once all embeddings are stored, IVFFlat derives its lists from them
+            if config is not None:
+                self.guidance_man.vector_index.config = config
+                self.guidance_man.projection.config = config
+            self.guidance_man.projection.build()
+            self.guidance_man.vector_index.build(dims=self.guidance_man.projection.dims)
+
     def __get_named_individuals_desc(self, c: Subject) -> dict[str, str]:
         nis = self.guidance_man.oman.get_named_individuals(c.subject_id)
         return {ne.subject_id: f"{ne.label} is a {c.label}" for ne in nis}
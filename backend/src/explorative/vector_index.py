@@ -0,0 +1,191 @@
+import math
+import time
+
+import numpy as np
+from pydantic import BaseModel, Field
+from sqlalchemy import Engine, func, select, text
+from sqlalchemy.orm import Session
+
+from eval_config import EvalConfig, VectorIndexMethod
+from explorative.embedding_projection import PROJECTED_TABLES, EmbeddingProjection
+from explorative.exp_model import SubjectInDB, SubjectLinkDB, TopicDB
+
+# pgvector's upper bound of hnsw.ef_search
+HNSW_MAX_EF_SEARCH = 1000
+# tables with an embedding column and the key the report compares results by
+INDEXED_TABLES = {
+    "subjects": (SubjectInDB, SubjectInDB.subject_id),
+    "subject_links": (SubjectLinkDB, SubjectLinkDB.link_id),
+    "topics": (TopicDB, TopicDB.topic_id),
+}
+
+
+class VectorIndexReport(BaseModel):
+    table: str
+    method: VectorIndexMethod | None
+    k: int
+    queries: int
+    recall: float = Field(..., description="Mean overlap of indexed and exact top k")
+    exact_ms: float = Field(..., description="Mean latency of the exact scan")
+    indexed_ms: float = Field(..., description="Mean latency using the ANN index")
+
+
+class VectorIndex:
+    """
+    Approximate nearest neighbour indexes on the pgvector embedding columns.
+    One partial index per table and ontology (filtered on `onto_hash`), so each
+    ontology's index only holds its own rows and can be rebuilt on its own.
+    With a loaded `projection`, its tables are searched on the reduced vectors.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        identifier: str,
+        config: EvalConfig,
+        projection: EmbeddingProjection | None = None,
+    ):
+        self.engine = engine
+        self.identifier = identifier
+        self.config = config
+        self.projection = projection
+
+    def index_name(
+        self, table: str, method: VectorIndexMethod, column: str = "embedding"
+    ) -> str:
+        # identifiers are limited to 63 characters
+        return f"{table}_{column}_{method.value}_{self.identifier[:16]}"
+
+    def __lists_for(self, session: Session, table: str) -> int:
+        if self.config.ivfflat_lists is not None:
+            return self.config.ivfflat_lists
+        model, _ = INDEXED_TABLES[table]
+        rows = session.execute(
+            select(func.count())
+            .select_from(model)
+            .where(model.onto_hash == self.identifier, model.embedding != None)
+        ).scalar_one()
+        # pgvector's recommendation: rows / 1000 up to 1M rows, sqrt(rows) above
+        return max(1, rows // 1000 if rows <= 1_000_000 else int(math.sqrt(rows)))
+
+    def build(self, dims: int | None = None):
+        """
+        (Re)creates the indexes of this ontology, once its embeddings are stored.
+        With `dims`, tables with reduced embeddings are indexed on those instead.
+        """
+        onto_hash = self.identifier.replace("'", "''")
+        with Session(self.engine) as session:
+            for table in INDEXED_TABLES:
+                for method in VectorIndexMethod:
+                    for column in ["embedding", "embedding_short"]:
+                        name = self.index_name(table, method, column)
+                        session.execute(text(f"DROP INDEX IF EXISTS {name}"))
+                method = self.config.vector_index
+                if method is None:
+                    continue
+                if method == VectorIndexMethod.HNSW:
+                    options = (
+                        f"m = {int(self.config.hnsw_m)}, "
+                        f"ef_construction = {int(self.config.hnsw_ef_construction)}"
+                    )
+                else:
+                    options = f"lists = {self.__lists_for(session, table)}"
+                column, expression = "embedding", "embedding vector_cosine_ops"
+                if dims is not None and table in PROJECTED_TABLES:
+                    # matches the cast in EmbeddingProjection.distance
+                    column = "embedding_short"
+                    expression = (
+                        f"(embedding_short::halfvec({int(dims)})) halfvec_cosine_ops"
+                    )
+                print("Building", method.value, "index on", table, column)
+                session.execute(
+                    text(
+                        f"CREATE INDEX {self.index_name(table, method, column)} "
+                        f"ON {table} USING {method.value} ({expression}) "
+                        f"WITH ({options}) WHERE onto_hash = '{onto_hash}'"
+                    )
+                )
+            session.commit()
+
+    def configure(self, session: Session, limit: int | None = None):
+        """
+        Sets the search parameters for the current transaction of `session`.
+        HNSW returns at most ef_search rows, so it is raised to the result limit
+        (up to pgvector's maximum of 1000).
+        """
+        method = self.config.vector_index
+        if method is None:
+            return
+        # the partial indexes only match a plan that knows the onto_hash value
+        session.execute(text("SET LOCAL plan_cache_mode = force_custom_plan"))
+        if method == VectorIndexMethod.HNSW:
+            ef_search = min(
+                max(self.config.hnsw_ef_search, limit or 0), HNSW_MAX_EF_SEARCH
+            )
+            session.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+            if self.config.hnsw_iterative_scan is not None:
+                session.execute(
+                    text("SELECT set_config('hnsw.iterative_scan', :mode, true)"),
+                    {"mode": self.config.hnsw_iterative_scan},
+                )
+        else:
+            probes = int(self.config.ivfflat_probes)
+            session.execute(text(f"SET LOCAL ivfflat.probes = {probes}"))
+
+    def __distance(self, table: str, embedding: np.ndarray):
+        model, _ = INDEXED_TABLES[table]
+        if (
+            self.projection is not None
+            and self.projection.loaded
+            and table in PROJECTED_TABLES
+        ):
+            # the column and expression the index of the table is built on
+            return self.projection.distance(model, embedding)
+        return model.embedding.cosine_distance(embedding)
+
+    def __nearest(self, table: str, embedding: np.ndarray, k: int, exact: bool):
+        model, key = INDEXED_TABLES[table]
+        with Session(self.engine) as session:
+            if exact:
+                session.execute(text("SET LOCAL enable_indexscan = off"))
+            else:
+                self.configure(session, k)
+            start = time.perf_counter()
+            keys = (
+                session.execute(
+                    select(key)
+                    .where(model.onto_hash == self.identifier)
+                    .order_by(self.__distance(table, embedding))
+                    .limit(k)
+                )
+                .scalars()
+                .all()
+            )
+            return keys, time.perf_counter() - start
+
+    def report(
+        self, embeddings: list[np.ndarray], k: int = 25
+    ) -> list[VectorIndexReport]:
+        """Recall and latency of the indexed search against an exact scan."""
+        reports = []
+        for table in INDEXED_TABLES:
+            recalls, exact_times, indexed_times = [], [], []
+            for embedding in embeddings:
+                exact, exact_time = self.__nearest(table, embedding, k, exact=True)
+                indexed, indexed_time = self.__nearest(table, embedding, k, exact=False)
+                if len(exact) > 0:
+                    recalls.append(len(set(exact) & set(indexed)) / len(exact))
+                exact_times.append(exact_time)
+                indexed_times.append(indexed_time)
+            reports.append(
+                VectorIndexReport(
+                    table=table,
+                    method=self.config.vector_index,
+                    k=k,
+                    queries=len(embeddings),
+                    recall=float(np.mean(recalls)) if len(recalls) > 0 else 1.0,
+                    exact_ms=float(np.mean(exact_times)) * 1000,
+                    indexed_ms=float(np.mean(indexed_times)) * 1000,
+                )
+            )
+        return reports
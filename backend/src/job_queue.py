@@ -0,0 +1,423 @@
+from enum import Enum
+from typing import Any, Callable
+from uuid import uuid4
+import json
+import threading
+import time
+import traceback
+
+import redis
+from pydantic import BaseModel, Field
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class JobLane(str, Enum):
+    INTERACTIVE = "interactive"
+    BATCH = "batch"
+
+
+# workers claim from the lanes in this order
+LANES = [JobLane.INTERACTIVE, JobLane.BATCH]
+
+
+class Job(BaseModel):
+    id: str
+    lane: JobLane = JobLane.INTERACTIVE
+    status: JobStatus = JobStatus.QUEUED
+    payload: dict[str, Any] = Field({})
+    created: float
+    started: float | None = None
+    finished: float | None = None
+    attempts: int = Field(0, description="Times the job was claimed by a worker")
+    cancel: bool = Field(False, description="Cancellation requested while running")
+    error: str | None = None
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobSuperseded(JobCancelled):
+    """The lease of this attempt expired and the job was queued again."""
+
+
+class JobQueue:
+    """
+    Redis backed job queue with one list per lane, jobs as hashes and a sorted
+    set of worker leases. Claiming moves a job from its lane to a processing
+    list in one command, so a job is always in a lane or in the processing list.
+    A job whose lease runs out (its worker died or the process restarted) is
+    queued again, up to `max_attempts` claims.
+    Takes any redis client, e.g. `RedisCache.redis` or a fakeredis one.
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        prefix: str = "jobs",
+        lease_seconds: float = 60,
+        max_attempts: int = 2,
+        ttl: float = 24 * 60 * 60,
+    ):
+        self.redis = client
+        self.prefix = prefix
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.ttl = ttl
+
+    def __lane_key(self, lane: JobLane) -> str:
+        return f"{self.prefix}:lane:{lane.value}"
+
+    def __job_key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+    @property
+    def __lease_key(self) -> str:
+        return f"{self.prefix}:leases"
+
+    @property
+    def __processing_key(self) -> str:
+        return f"{self.prefix}:processing"
+
+    @staticmethod
+    def __encode(fields: dict) -> dict[str, str]:
+        return {key: json.dumps(value) for key, value in fields.items()}
+
+    @staticmethod
+    def __decode(data: dict[bytes, bytes]) -> Job | None:
+        if not data:
+            return None
+        return Job.model_validate(
+            {key.decode(): json.loads(value) for key, value in data.items()}
+        )
+
+    def __transition(
+        self,
+        job_id: str,
+        statuses: list[JobStatus],
+        update: Callable[[Job], dict],
+        attempt: int | None = None,
+    ) -> Job | None:
+        """
+        Applies `update` if the job is in one of `statuses` (and at `attempt`),
+        atomically.
+        """
+        key = self.__job_key(job_id)
+
+        def apply(pipe: redis.client.Pipeline):
+            job = self.__decode(pipe.hgetall(key))
+            if job is None or job.status not in statuses:
+                return None
+            if attempt is not None and job.attempts != attempt:
+                return None
+            fields = update(job)
+            pipe.multi()
+            pipe.hset(key, mapping=self.__encode(fields))
+            return Job.model_validate({**job.model_dump(), **fields})
+
+        return self.redis.transaction(apply, key, value_from_callable=True)
+
+    def submit(
+        self,
+        payload: dict[str, Any],
+        lane: JobLane = JobLane.INTERACTIVE,
+        job_id: str | None = None,
+    ) -> Job:
+        job = Job(
+            id=job_id if job_id is not None else uuid4().hex,
+            lane=lane,
+            payload=payload,
+            created=time.time(),
+        )
+        key = self.__job_key(job.id)
+        pipe = self.redis.pipeline()
+        pipe.hset(key, mapping=self.__encode(job.model_dump(mode="json")))
+        pipe.expire(key, int(self.ttl))
+        pipe.lpush(self.__lane_key(lane), job.id)
+        pipe.execute()
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self.__decode(self.redis.hgetall(self.__job_key(job_id)))
+
+    def claim(self, timeout: float = 1.0) -> Job | None:
+        """
+        Next queued job, interactive before batch, or None after `timeout`.
+        Only the interactive lane is waited on, a batch job queued meanwhile is
+        picked up by the next call.
+        """
+        job_id = None
+        for lane in LANES:
+            job_id = self.redis.lmove(
+                self.__lane_key(lane), self.__processing_key, "RIGHT", "LEFT"
+            )
+            if job_id is not None:
+                break
+        if job_id is None:
+            job_id = self.redis.blmove(
+                self.__lane_key(JobLane.INTERACTIVE),
+                self.__processing_key,
+                timeout,
+                "RIGHT",
+                "LEFT",
+            )
+        if job_id is None:
+            return None
+        job_id = job_id.decode()
+        # a crash from here on leaves the job in the processing list, where
+        # requeue_expired finds it
+        job = self.__transition(
+            job_id,
+            [JobStatus.QUEUED],
+            lambda job: {
+                "status": JobStatus.RUNNING.value,
+                "started": time.time(),
+                "attempts": job.attempts + 1,
+            },
+        )
+        if job is None:
+            # cancelled (or expired) while queued
+            self.redis.lrem(self.__processing_key, 1, job_id)
+            return None
+        self.redis.zadd(self.__lease_key, {job_id: time.time() + self.lease_seconds})
+        return job
+
+    def renew(self, job_id: str, attempt: int):
+        """
+        Extends the lease of `attempt` while it runs. A lease that expired is not
+        brought back, the job may already be queued or claimed again.
+        """
+        key = self.__job_key(job_id)
+
+        def apply(pipe: redis.client.Pipeline):
+            job = self.__decode(pipe.hgetall(key))
+            if (
+                job is None
+                or job.status != JobStatus.RUNNING
+                or job.attempts != attempt
+            ):
+                return
+            pipe.multi()
+            pipe.zadd(
+                self.__lease_key, {job_id: time.time() + self.lease_seconds}, xx=True
+            )
+
+        self.redis.transaction(apply, key)
+
+    def checkpoint(self, job_id: str, attempt: int | None = None):
+        """
+        Raises `JobCancelled` if the job was cancelled, or `JobSuperseded` if
+        `attempt` is no longer the running one, called between steps.
+        """
+        job = self.get(job_id)
+        if job is None or job.cancel or job.status == JobStatus.CANCELLED:
+            raise JobCancelled(job_id)
+        if attempt is not None and (
+            job.status != JobStatus.RUNNING or job.attempts != attempt
+        ):
+            raise JobSuperseded(job_id)
+
+    def __finish(
+        self, job_id: str, attempt: int, status: JobStatus, error: str | None = None
+    ):
+        finished = self.__transition(
+            job_id,
+            [JobStatus.RUNNING],
+            lambda _: {"status": status.value, "finished": time.time(), "error": error},
+            attempt=attempt,
+        )
+        if finished is None:
+            # superseded, the entries belong to the current attempt
+            return
+        pipe = self.redis.pipeline()
+        pipe.lrem(self.__processing_key, 0, job_id)
+        pipe.zrem(self.__lease_key, job_id)
+        pipe.execute()
+
+    def complete(self, job_id: str, attempt: int):
+        """Marks `attempt` done, a no-op once the job was queued again."""
+        self.__finish(job_id, attempt, JobStatus.DONE)
+
+    def fail(self, job_id: str, attempt: int, error: str):
+        self.__finish(job_id, attempt, JobStatus.FAILED, error)
+
+    def cancelled(self, job_id: str, attempt: int):
+        self.__finish(job_id, attempt, JobStatus.CANCELLED)
+
+    def cancel(self, job_id: str) -> Job | None:
+        """
+        Cancels a queued job right away; a running one is flagged and stops at
+        its next checkpoint.
+        """
+        job = self.__transition(
+            job_id,
+            [JobStatus.QUEUED],
+            lambda _: {"status": JobStatus.CANCELLED.value, "finished": time.time()},
+        )
+        if job is not None:
+            self.redis.lrem(self.__lane_key(job.lane), 0, job_id)
+            return job
+        job = self.__transition(job_id, [JobStatus.RUNNING], lambda _: {"cancel": True})
+        return job if job is not None else self.get(job_id)
+
+    def __lease_unleased(self):
+        """
+        Leases the claimed jobs without a lease, i.e. whose worker stopped before
+        leasing them, so they expire like any other.
+        """
+        claimed = self.redis.lrange(self.__processing_key, 0, -1)
+        if len(claimed) == 0:
+            return
+        pipe = self.redis.pipeline()
+        for job_id in claimed:
+            pipe.zscore(self.__lease_key, job_id)
+        unleased = [
+            job_id for job_id, lease in zip(claimed, pipe.execute()) if lease is None
+        ]
+        if len(unleased) > 0:
+            # nx, so a lease the worker set meanwhile is kept
+            deadline = time.time() + self.lease_seconds
+            self.redis.zadd(
+                self.__lease_key, {job_id: deadline for job_id in unleased}, nx=True
+            )
+
+    def __return_to_lane(self, job: Job):
+        # to the front of its lane
+        pipe = self.redis.pipeline()
+        pipe.lrem(self.__processing_key, 0, job.id)
+        pipe.rpush(self.__lane_key(job.lane), job.id)
+        pipe.execute()
+
+    def requeue_expired(self) -> int:
+        """
+        Queues the claimed jobs whose lease ran out again, returns their count.
+        """
+        self.__lease_unleased()
+        expired = self.redis.zrangebyscore(self.__lease_key, "-inf", time.time())
+        for job_id in expired:
+            job_id = job_id.decode()
+            if self.redis.zrem(self.__lease_key, job_id) == 0:
+                # another worker got to it first
+                continue
+            job = self.get(job_id)
+            if job is None or job.status not in [JobStatus.QUEUED, JobStatus.RUNNING]:
+                # finished, only the processing entry may be left
+                self.redis.lrem(self.__processing_key, 0, job_id)
+                continue
+            if job.status == JobStatus.QUEUED:
+                # claimed, but its worker stopped before starting it
+                self.__return_to_lane(job)
+                print("Requeued job", job_id, "claimed by a stopped worker")
+                continue
+            if job.attempts >= self.max_attempts:
+                self.__finish(
+                    job_id, job.attempts, JobStatus.FAILED, "Worker lease expired"
+                )
+                continue
+            requeued = self.__transition(
+                job_id,
+                [JobStatus.RUNNING],
+                lambda _: {"status": JobStatus.QUEUED.value},
+                attempt=job.attempts,
+            )
+            if requeued is not None:
+                self.__return_to_lane(requeued)
+            print("Requeued job", job_id, "after an expired lease")
+        return len(expired)
+
+
+class JobWorkers:
+    """
+    Pool of `size` worker threads running `handler` on claimed jobs, with one
+    heartbeat thread renewing the leases of the jobs in progress.
+    `handler` should call `queue.checkpoint(job.id, job.attempts)` between its
+    steps.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: Callable[[Job], None],
+        size: int = 1,
+        poll_timeout: float = 1.0,
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.size = size
+        self.poll_timeout = poll_timeout
+        # attempt of each job in progress
+        self.__running: dict[str, int] = {}
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__threads: list[threading.Thread] = []
+
+    def start(self):
+        if self.size <= 0 or len(self.__threads) > 0:
+            return
+        self.__threads = [
+            threading.Thread(
+                target=self.__work, name=f"{self.queue.prefix}-worker-{i}", daemon=True
+            )
+            for i in range(self.size)
+        ]
+        self.__threads.append(
+            threading.Thread(
+                target=self.__heartbeat,
+                name=f"{self.queue.prefix}-heartbeat",
+                daemon=True,
+            )
+        )
+        for thread in self.__threads:
+            thread.start()
+
+    def close(self, timeout: float | None = None):
+        self.__stop.set()
+        for thread in self.__threads:
+            thread.join(timeout)
+
+    def __heartbeat(self):
+        while not self.__stop.wait(self.queue.lease_seconds / 3):
+            with self.__lock:
+                running = list(self.__running.items())
+            try:
+                for job_id, attempt in running:
+                    self.queue.renew(job_id, attempt)
+            except Exception as e:
+                print(traceback.format_exc())
+                print("Failed to renew job leases", e)
+
+    def __work(self):
+        while not self.__stop.is_set():
+            try:
+                self.queue.requeue_expired()
+                job = self.queue.claim(self.poll_timeout)
+            except Exception as e:
+                print(traceback.format_exc())
+                print("Failed to claim a job", e)
+                self.__stop.wait(self.poll_timeout)
+                continue
+            if job is None:
+                continue
+            with self.__lock:
+                self.__running[job.id] = job.attempts
+            try:
+                self.handler(job)
+                self.queue.complete(job.id, job.attempts)
+            except JobSuperseded:
+                print("Stopped job", job.id, "after its lease expired")
+            except JobCancelled:
+                print("Cancelled job", job.id)
+                self.queue.cancelled(job.id, job.attempts)
+            except Exception as e:
+                print(traceback.format_exc())
+                self.queue.fail(job.id, job.attempts, str(e))
+            finally:
+                with self.__lock:
+                    self.__running.pop(job.id, None)
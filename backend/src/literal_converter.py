@@ -0,0 +1,129 @@
+import threading
+
+from cachetools import LRUCache
+import numpy as np
+import pandas as pd
+from rdflib import Literal, URIRef
+from rdflib.namespace import NamespaceManager
+import regex as re
+
+INT_COMPATIBLE_TYPES = [
+    "http://www.w3.org/2001/XMLSchema#int",
+    "http://www.w3.org/2001/XMLSchema#integer",
+    "http://www.w3.org/2001/XMLSchema#positiveInteger",
+    "http://www.w3.org/2001/XMLSchema#nonNegativeInteger",
+]
+FLOAT_COMPATIBLE_TYPES = [
+    "http://www.w3.org/2001/XMLSchema#float",
+    "http://www.w3.org/2001/XMLSchema#double",
+    "http://www.w3.org/2001/XMLSchema#decimal",
+    # kilogram, seconds
+]
+# datatypes of unit literals (e.g. QUDT) that are converted to float as well
+FLOAT_COMPATIBLE_UNITS = ["kilogram", "metre", "seconds", "minute", "hour", "day"]
+
+INT_PATTERN = re.compile(r"\s*[+-]?\d+\s*")
+FLOAT_PATTERN = re.compile(r"\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*")
+
+MISSING_KIND = object()
+CONVERTERS = {
+    "int": (int, np.int64, INT_PATTERN),
+    "float": (float, np.float64, FLOAT_PATTERN),
+}
+
+
+class LiteralConverter:
+    """
+    Turns result terms into the values the API returns: literals become their
+    (title-cased) text, converted to int or float for numeric datatypes, and
+    IRIs their prefixed name.
+    Columns are converted per distinct term, and literals of one datatype are
+    converted together with NumPy.
+    """
+
+    def __init__(self, namespace_manager: NamespaceManager, n3_cache_size=100_000):
+        self.namespace_manager = namespace_manager
+        self.__kinds: dict[str, str | None] = {}
+        self.__n3_cache = LRUCache(maxsize=n3_cache_size)
+        self.__n3_lock = threading.Lock()
+
+    def kind_of(self, datatype: str | None) -> str | None:
+        """Converter ("int", "float" or None) for a datatype, looked up once per datatype."""
+        if datatype is None:
+            return None
+        kind = self.__kinds.get(datatype, MISSING_KIND)
+        if kind is MISSING_KIND:
+            if datatype in INT_COMPATIBLE_TYPES:
+                kind = "int"
+            elif datatype in FLOAT_COMPATIBLE_TYPES or any(
+                unit in datatype for unit in FLOAT_COMPATIBLE_UNITS
+            ):
+                kind = "float"
+            else:
+                kind = None
+            self.__kinds[datatype] = kind
+        return kind
+
+    def n3(self, term) -> str:
+        with self.__n3_lock:
+            value = self.__n3_cache.get(term)
+        if value is None:
+            value = term.n3(self.namespace_manager)
+            with self.__n3_lock:
+                self.__n3_cache[term] = value
+        return value
+
+    @staticmethod
+    def convert_one(kind: str | None, value: str):
+        if kind is None:
+            return value
+        try:
+            return CONVERTERS[kind][0](value)
+        except (ValueError, OverflowError):
+            return value
+
+    def readable(self, term):
+        if isinstance(term, Literal):
+            datatype = str(term.datatype) if term.datatype is not None else None
+            return self.convert_one(self.kind_of(datatype), term.title())
+        elif isinstance(term, URIRef) or hasattr(term, "n3"):
+            return self.n3(term)
+        return term
+
+    def convert_many(self, kind: str | None, values: list[str]) -> list:
+        if kind is None:
+            return values
+        convert, dtype, pattern = CONVERTERS[kind]
+        converted: list = list(values)
+        simple = [i for i, value in enumerate(values) if pattern.fullmatch(value)]
+        try:
+            numbers = np.array([values[i] for i in simple], dtype=dtype).tolist()
+            for i, number in zip(simple, numbers):
+                converted[i] = number
+        except (ValueError, OverflowError):
+            # e.g. integers beyond int64
+            simple = []
+        done = set(simple)
+        for i, value in enumerate(values):
+            if i not in done:
+                converted[i] = self.convert_one(kind, value)
+        return converted
+
+    def readable_column(self, values) -> pd.Series:
+        """`readable` for a whole column, converting each distinct term once."""
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+        readable = np.empty(len(uniques) + 1, dtype=object)
+        readable[-1] = None  # unbound
+
+        literal_groups: dict[str | None, list[int]] = {}
+        for i, term in enumerate(uniques):
+            if isinstance(term, Literal):
+                datatype = str(term.datatype) if term.datatype is not None else None
+                literal_groups.setdefault(self.kind_of(datatype), []).append(i)
+            else:
+                readable[i] = self.readable(term)
+        for kind, idx in literal_groups.items():
+            texts = pd.Series([uniques[i] for i in idx], dtype=object).str.title()
+            for i, value in zip(idx, self.convert_many(kind, texts.tolist())):
+                readable[i] = value
+        return pd.Series(readable[codes]).infer_objects()
@@ -186,6 +186,14 @@ class SubjectLink(BaseModel):
     instance_count: int = 0
 
 
+class GraphLoadProgress(BaseModel):
+    level: int = 0
+    loaded: int = 0
+    pending: int = 0
+    running: bool = False
+    done: bool = False
+
+
 class GeneralizationQuery(BaseModel):
     cls: str = Field("")
     out_link_ids: list[str] = Field([])
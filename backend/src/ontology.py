@@ -1,7 +1,8 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 from rdflib import Graph, URIRef, Literal
 from model import (
     GeneralizationQuery,
+    GraphLoadProgress,
     Instance,
     InstanceQuery,
     Property,
@@ -10,10 +11,24 @@ from model import (
     SubjectLink,
 )
 import pandas as pd
+import asyncio
+import re
 from rdflib.plugins.sparql import prepareQuery
+from rdflib.util import from_n3
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import threading
+from hashlib import sha256
+from typing import Any, AsyncIterator, Callable
 from tqdm import tqdm
 import traceback
 
+from class_tree_snapshot import ClassTreeSnapshot
+from literal_converter import LiteralConverter
+from ontology_cache import OntologyCache, cached, caching_scope, skip_caching, MISSING
+from sparql_client import AsyncSparqlClient, SparqlResult
+
 
 class Prefix(BaseModel):
     ttl_prefix: str = Field(
@@ -63,27 +78,79 @@ class OntologyConfig(BaseModel):
     language: str = Field(
         "en", title="Language", description="Language of the ontology"
     )
+    load_workers: int = Field(
+        8,
+        title="Load Workers",
+        description="Concurrent SPARQL requests when loading the full class tree",
+    )
+    snapshot_dir: str | None = Field(
+        None,
+        title="Snapshot Directory",
+        description="Directory for class tree snapshots, disabled if not set",
+    )
 
 
-INT_COMPATIBLE_TYPES = [
-    "http://www.w3.org/2001/XMLSchema#int",
-    "http://www.w3.org/2001/XMLSchema#integer",
-    "http://www.w3.org/2001/XMLSchema#positiveInteger",
-    "http://www.w3.org/2001/XMLSchema#nonNegativeInteger",
-]
-FLOAT_COMPATIBLE_TYPES = [
-    "http://www.w3.org/2001/XMLSchema#float",
-    "http://www.w3.org/2001/XMLSchema#double",
-    "http://www.w3.org/2001/XMLSchema#decimal",
-    # kilogram, seconds
+SUBJECT_ADAPTER = TypeAdapter(Subject)
+# (lexical form, language) of a label, None if the subject has none
+LABEL_ADAPTER = TypeAdapter(tuple[str, str | None] | None)
+ENRICH_EDGES = [
+    "rdfs:label",
+    "rdfs:range",
+    "rdfs:domain",
+    "rdfs:subPropertyOf",
+    "rdfs:subClassOf",
+    "rdf:type",
 ]
 
 
 class OntologyManager:
-    def __init__(self, config: OntologyConfig, brainteaser_graph: Graph):
+    def __init__(
+        self,
+        config: OntologyConfig,
+        brainteaser_graph: Graph,
+        cache: OntologyCache | None = None,
+        sparql_client: AsyncSparqlClient | None = None,
+    ):
         self.config = config
         self.onto = brainteaser_graph  # TODO enable dynamic loading
-        self.__label_cache: dict[str, str] = {}
+        self.cache = cache if cache is not None else OntologyCache()
+        self.sparql_client = sparql_client
+        self.converter = LiteralConverter(self.onto.namespace_manager)
+        # precomputed counts (explorative.statistics.OntologyStatistics), if built
+        self.statistics = None
+        # subclass closure (explorative.class_hierarchy.ClassHierarchy), if built
+        self.hierarchy = None
+        self.__identifier: str | None = None
+        self.roots_cache: list[Subject] | None = None
+        self.load_progress = GraphLoadProgress()
+        self.__load_lock = threading.Lock()
+        self.__load_thread: threading.Thread | None = None
+        self.__roots_ready = threading.Event()
+        self.__snapshot: ClassTreeSnapshot | None = None
+
+    @property
+    def identifier(self) -> str:
+        if self.__identifier is not None:
+            return self.__identifier
+        identifier_results = self.onto.query(
+            "SELECT ?s  ?p ?o WHERE {?s ?o ?p.} LIMIT 25"
+        )
+        if len(identifier_results) == 1:
+            raise ValueError(
+                "Ontology is empty or SPARQL endpoint is not reachable",
+                identifier_results,
+            )
+        self.__identifier = sha256(
+            ".".join([str(e) for e in identifier_results]).encode()
+        ).hexdigest()
+        return self.__identifier
+
+    def invalidate_cache(self):
+        """Drops local cache entries and recomputes the ontology hash on next use."""
+        self.__identifier = None
+        self.__snapshot = None
+        if self.cache is not None:
+            self.cache.clear()
 
     def q_to_df(self, q: str):
         results = list(self.onto.query(q))
@@ -100,25 +167,148 @@ class OntologyManager:
 
     def q_to_df_values(self, q: str) -> pd.DataFrame:
         result_set = self.onto.query(q)
+        return self.__result_to_df_values(result_set)
+
+    def __result_to_df_values(self, result_set) -> pd.DataFrame:
         cols = [str(var) for var in result_set.vars]
-        results = [dict(zip(cols, row)) for row in result_set]
-        results_df = pd.DataFrame(results)
-        results_df = results_df.map(self.to_readable)
-        return results_df
+        rows = list(result_set)
+        if len(rows) == 0:
+            return pd.DataFrame(columns=cols)
+        return pd.DataFrame(
+            {
+                col: self.readable_column(values)
+                for col, values in zip(cols, zip(*rows))
+            }
+        )
+
+    def readable_column(self, values) -> pd.Series:
+        return self.converter.readable_column(values)
+
+    async def aquery(self, q: str, timeout: float | None = None) -> SparqlResult:
+        """
+        Runs a query without blocking the event loop.
+        Uses the pooled async client if there is one, otherwise the graph is queried
+        in a worker thread.
+        """
+        if self.sparql_client is not None:
+            return await self.sparql_client.query(q, timeout=timeout)
+        result_set = await asyncio.to_thread(self.onto.query, q)
+        return SparqlResult(
+            [str(var) for var in result_set.vars], [tuple(r) for r in result_set]
+        )
+
+    async def aq_to_df_values(
+        self, q: str, timeout: float | None = None
+    ) -> pd.DataFrame:
+        result_set = await self.aquery(q, timeout=timeout)
+        return self.__result_to_df_values(result_set)
+
+    async def astream_df_values(
+        self, q: str, chunk_size=1000, timeout: float | None = None
+    ) -> AsyncIterator[pd.DataFrame]:
+        """
+        Yields the readable result of a query in chunks, as the endpoint returns rows.
+        The first chunk may be empty but always carries the columns.
+        """
+        if self.sparql_client is not None:
+            async for chunk in self.sparql_client.stream(
+                q, chunk_size=chunk_size, timeout=timeout
+            ):
+                yield self.__result_to_df_values(chunk)
+            return
+        result_set = await self.aquery(q, timeout=timeout)
+        for i in range(0, max(len(result_set), 1), chunk_size):
+            yield self.__result_to_df_values(
+                SparqlResult(result_set.vars, result_set.rows[i : i + chunk_size])
+            )
 
     def df_to_labels(self, df: pd.DataFrame):
-        labeled_df = df.copy()
-        for i, row in df.iterrows():
-            for j, col in row.items():
-                data = list(
-                    self.onto.query(
-                        f"SELECT ?label WHERE {{ {col} rdfs:label ?label }}"
-                    )
+        """Replaces every cell that is a subject with a label by that label."""
+        values = pd.unique(df.to_numpy(dtype=object).ravel())
+        labels = self.labels_for([v for v in values if isinstance(v, str)])
+        if len(labels) == 0:
+            return df.copy()
+        return df.apply(lambda col: col.map(labels).where(col.isin(labels), col))
+
+    def labels_for(self, refs: list[str], batch_size=256) -> dict[str, Literal]:
+        """
+        Labels of many subjects, with one `VALUES` query per batch.
+        A label in the configured language is preferred, then one without a
+        language, then any other. Subjects without a label are left out.
+        """
+        language = self.config.language
+        labels: dict[str, Literal] = {}
+        terms: dict[str, URIRef] = {}
+        cache_keys: dict[str, str] = {}
+        for ref in dict.fromkeys(refs):
+            label = MISSING
+            if self.cache is not None:
+                cache_keys[ref] = self.cache.key(
+                    self.identifier, "label", ref, language
+                )
+                label = self.cache.get(cache_keys[ref], LABEL_ADAPTER)
+            if label is MISSING:
+                term = self.term_for(ref)
+                if term is not None:
+                    terms[ref] = term
+            elif label is not None:
+                labels[ref] = Literal(label[0], lang=label[1])
+
+        batched_terms = list(terms.items())
+        for i in range(0, len(batched_terms), batch_size):
+            batch = dict(batched_terms[i : i + batch_size])
+            refs_for_term = self.__refs_for_term(batch)
+            try:
+                rows = self.onto.query(
+                    f"""
+                SELECT ?s ?label WHERE {{
+                    VALUES ?s {{ {" ".join(term.n3() for term in refs_for_term)} }}
+                    ?s rdfs:label ?label
+                }}"""
+                )
+            except Exception as e:
+                print(traceback.format_exc(), e)
+                continue
+            best: dict[URIRef, tuple[int, Literal]] = {}
+            for s, label in rows:
+                label_language = getattr(label, "language", None)
+                rank = (
+                    0
+                    if label_language == language
+                    else 1 if label_language is None else 2
                 )
-                labeled_df.at[i, j] = data[0][0] if data else col
-        return labeled_df
+                if s not in best or rank < best[s][0]:
+                    best[s] = (rank, Literal(str(label), lang=label_language))
+            for term, term_refs in refs_for_term.items():
+                label = best[term][1] if term in best else None
+                for ref in term_refs:
+                    if label is not None:
+                        labels[ref] = label
+                    if self.cache is not None:
+                        self.cache.set(
+                            cache_keys[ref],
+                            (str(label), label.language) if label is not None else None,
+                            LABEL_ADAPTER,
+                        )
+        return labels
 
-    def get_root_classes(self, load_properties=False) -> list[Subject]:
+    @property
+    def snapshot(self) -> ClassTreeSnapshot | None:
+        if self.config.snapshot_dir is None:
+            return None
+        if self.__snapshot is None:
+            self.__snapshot = ClassTreeSnapshot.for_ontology(
+                self.config.snapshot_dir, self.identifier
+            )
+        return self.__snapshot
+
+    def get_root_classes(
+        self, load_properties=False, use_snapshot=True
+    ) -> list[Subject]:
+        if use_snapshot and self.snapshot is not None:
+            roots = self.snapshot.roots(load_properties=load_properties)
+            if roots is not None:
+                return roots
         classes = self.q_to_df(self.config.parent_class_query)
         if classes.empty:
             # if no parent classes, return all classes belonging to owl:Thing
@@ -135,31 +325,93 @@ class OntologyManager:
                 """
             )
         classes_list = classes[0].tolist()
-        onto_classes: list[Subject] = [
-            self.enrich_subject(cls, load_properties=load_properties)
-            for cls in tqdm(classes_list, desc="Loading root classes")
-        ]
+        onto_classes: list[Subject] = self.enrich_subjects(
+            classes_list, load_properties=load_properties
+        )
         return onto_classes
 
-    def get_subclasses(self, cls: str, load_properties=False) -> list[Subject]:
+    def get_subclasses(
+        self, cls: str, load_properties=False, use_snapshot=True
+    ) -> list[Subject]:
+        if use_snapshot and self.snapshot is not None:
+            subclasses = self.snapshot.subclasses(cls, load_properties=load_properties)
+            if subclasses is not None:
+                return subclasses
         # query = prepareQuery(
         #     queryString=self.config.sub_class_query,
         #     initNs={
         #         prefix.ttl_prefix: prefix.uri for prefix in self.config.ttl_prefixes
         #     },
         # )
+        onto_classes: list[Subject] = self.enrich_subjects(
+            self.__subclass_ids(cls), load_properties=load_properties
+        )
+        return onto_classes
+
+    async def aget_subclasses(
+        self, cls: str, load_properties=False, use_snapshot=True
+    ) -> list[Subject]:
+        if use_snapshot and self.snapshot is not None:
+            subclasses = self.snapshot.subclasses(cls, load_properties=load_properties)
+            if subclasses is not None:
+                return subclasses
+        classes = await self.aquery(self.config.sub_class_query.replace("?cls", cls))
+        return await self.aenrich_subjects(
+            [c[0] for c in classes], load_properties=load_properties
+        )
+
+    def __subclass_ids(self, cls: str) -> list[URIRef]:
         classes = list(
             self.onto.query(
                 self.config.sub_class_query.replace("?cls", cls),
             )
         )
-        onto_classes: list[Subject] = [
-            self.enrich_subject(cls[0], load_properties=load_properties)
-            for cls in classes
-        ]
-        return onto_classes
+        return [cls[0] for cls in classes]
+
+    def __subclass_batch_query(self, refs_for_term: dict[URIRef, list[str]]) -> str:
+        # the configured query reads the parent from ?cls, which is bound to all
+        # parents at once and projected next to the subclass
+        values = " ".join(term.n3() for term in refs_for_term)
+        query = re.sub(
+            r"SELECT(\s+(DISTINCT|REDUCED))?",
+            lambda match: f"{match.group(0)} ?cls",
+            self.config.sub_class_query,
+            count=1,
+            flags=re.IGNORECASE,
+        )
+        return re.sub(
+            r"WHERE\s*\{",
+            lambda match: f"{match.group(0)} VALUES ?cls {{ {values} }}",
+            query,
+            count=1,
+            flags=re.IGNORECASE,
+        )
+
+    def __subclass_ids_batch(
+        self, refs_for_term: dict[URIRef, list[str]]
+    ) -> dict[str, list[URIRef]]:
+        rows = self.onto.query(self.__subclass_batch_query(refs_for_term))
+        return self.__ids_per_parent(rows, refs_for_term)
+
+    @staticmethod
+    def __ids_per_parent(
+        rows, refs_for_term: dict[URIRef, list[str]], limit: int | None = None
+    ) -> dict[str, list[URIRef]]:
+        ids_per_term: dict[URIRef, list[URIRef]] = defaultdict(list)
+        for parent, child in rows:
+            if limit is None or len(ids_per_term[parent]) < limit:
+                ids_per_term[parent].append(child)
+        return {
+            ref: ids_per_term.get(term, [])
+            for term, refs in refs_for_term.items()
+            for ref in refs
+        }
 
     def get_all_subclasses(self, cls: str) -> list[Subject]:
+        if self.hierarchy is not None:
+            subclasses = self.hierarchy.subclasses(cls)
+            if subclasses is not None:
+                return self.enrich_subjects(subclasses, subject_type="class")
         query = f"""SELECT ?scls
                     WHERE {{
                          ?scls rdf:type owl:Class.
@@ -171,37 +423,82 @@ class OntologyManager:
                 query,
             )
         )
-        onto_classes: list[Subject] = [
-            self.enrich_subject(cls[0], subject_type="class") for cls in classes
-        ]
+        onto_classes: list[Subject] = self.enrich_subjects(
+            [cls[0] for cls in classes], subject_type="class"
+        )
         return onto_classes
 
     def get_named_individuals(self, cls: str, limit=128) -> list[Subject]:
-        query = f"""SELECT ?ind
+        onto_classes: list[Subject] = self.enrich_subjects(
+            self.__named_individual_ids(cls, limit=limit), subject_type="individual"
+        )
+
+        return onto_classes
+
+    async def aget_named_individuals(self, cls: str, limit=128) -> list[Subject]:
+        individuals = await self.aquery(self.__named_individual_query(cls, limit))
+        return await self.aenrich_subjects(
+            [ind[0] for ind in individuals], subject_type="individual"
+        )
+
+    def __named_individual_query(self, cls: str, limit=128) -> str:
+        return f"""SELECT ?ind
                     WHERE {{
                          ?ind rdf:type owl:NamedIndividual.
                          ?ind rdf:type {cls}.
                     }}
                     LIMIT {limit}
                     """
+
+    def __named_individual_ids(self, cls: str, limit=128) -> list[URIRef]:
         individuals = list(
             self.onto.query(
-                query,
+                self.__named_individual_query(cls, limit),
                 # initBindings={"cls": cls},
             )
         )
-        onto_classes: list[Subject] = [
-            self.enrich_subject(ind[0], subject_type="individual")
-            for ind in individuals
-        ]
+        return [ind[0] for ind in individuals]
 
-        return onto_classes
+    def __named_individual_batch_query(
+        self, refs_for_term: dict[URIRef, list[str]], limit=128
+    ) -> str:
+        return f"""SELECT ?cls ?ind
+                    WHERE {{
+                         VALUES ?cls {{ {" ".join(t.n3() for t in refs_for_term)} }}
+                         ?ind rdf:type owl:NamedIndividual.
+                         ?ind rdf:type ?cls.
+                    }}
+                    LIMIT {limit * len(refs_for_term)}
+                    """
+
+    def __named_individual_ids_batch(
+        self, refs_for_term: dict[URIRef, list[str]], limit=128
+    ) -> dict[str, list[URIRef]]:
+        rows = self.__capped_rows(
+            lambda pending: self.__named_individual_batch_query(pending, limit),
+            refs_for_term,
+            limit,
+        )
+        return self.__ids_per_parent(rows, refs_for_term, limit)
 
     def get_instances(self, query: InstanceQuery) -> list[Instance]:
+        individuals = self.q_to_df_values(self.__instances_query(query))
+        return self.__to_instances(individuals)
+
+    async def aget_instances(self, query: InstanceQuery) -> list[Instance]:
+        individuals = await self.aq_to_df_values(self.__instances_query(query))
+        return self.__to_instances(individuals)
+
+    def __to_instances(self, individuals: pd.DataFrame) -> list[Instance]:
+        return [
+            Instance(id=ind["ind"], label=ind["ind_lbl"])
+            for i, ind in individuals.iterrows()
+        ]
+
+    def __instances_query(self, query: InstanceQuery) -> str:
         if query.q is None:
             query.q = ""
-        individuals = self.q_to_df_values(
-            f"""SELECT DISTINCT ?ind ?ind_lbl
+        return f"""SELECT DISTINCT ?ind ?ind_lbl
                     WHERE {{
                         ?ind rdf:type {query.cls}.
                         ?ind rdfs:label ?ind_lbl.
@@ -211,15 +508,9 @@ class OntologyManager:
                     ORDER BY ?ind ?ind_lbl
                     LIMIT {query.limit} OFFSET {query.skip} 
                     """
-        )
-        return [
-            Instance(id=ind["ind"], label=ind["ind_lbl"])
-            for i, ind in individuals.iterrows()
-        ]
 
+    @cached("label_for", Any)
     def label_for(self, subject: str):
-        if subject in self.__label_cache:
-            return self.__label_cache[subject]
         labels = self.outgoing_edges_for(subject, ["rdfs:label"])
         if len(labels) == 0:
             label = subject
@@ -229,36 +520,10 @@ class OntologyManager:
             label = subject
         if isinstance(label, Literal):
             label = label.value
-        self.__label_cache[subject] = label
         return label
 
     def to_readable(self, cls: str | Literal | URIRef):
-        if isinstance(cls, Literal):
-            value = cls.title()
-            if cls.datatype is not None:
-                try:
-                    cls_dtype = str(cls.datatype)
-                    if cls_dtype in INT_COMPATIBLE_TYPES:
-                        value = int(value)
-                    elif (
-                        cls_dtype in FLOAT_COMPATIBLE_TYPES
-                        or "kilogram" in cls.datatype
-                        or "metre" in cls.datatype
-                        or "seconds" in cls.datatype
-                        or "minute" in cls.datatype
-                        or "hour" in cls.datatype
-                        or "day" in cls.datatype
-                    ):
-                        value = float(value)
-                except Exception as e:
-                    print(traceback.format_exc())
-                    print("Failed to convert", value, "to int or float", e)
-            return value
-
-        elif isinstance(cls, URIRef) or hasattr(cls, "n3"):
-            return cls.n3(self.onto.namespace_manager)
-        else:
-            return cls
+        return self.converter.readable(cls)
 
     def to_readable_literals(self, cls: str | Literal | URIRef):
         if isinstance(cls, Literal):
@@ -285,76 +550,94 @@ class OntologyManager:
                     label_candidates[ref_n3].append(label.value)
         return label_candidates
 
+    def __edges_to_properties(
+        self, outgoing_edges: list[tuple[URIRef, Literal, URIRef, Literal]]
+    ) -> dict[str, Property]:
+        outgoing_edge_label_candidates: dict[str, list[str]] = (
+            self.__label_candidates(
+                [(edge, edge_lbl) for edge, edge_lbl, _, _ in outgoing_edges]
+            )
+        )
+
+        outgoing_edges_dict: dict[str, Property] = {}
+        for edge_n3 in outgoing_edge_label_candidates:
+            values_candidates = self.__label_candidates(
+                [
+                    (obj, obj_lbl)
+                    for edge, _, obj, obj_lbl in outgoing_edges
+                    if self.to_readable(edge) == edge_n3
+                ]
+            )
+            values = [
+                PropertyValue(
+                    value=obj,
+                    label=(
+                        values_candidates[obj][0]
+                        if len(values_candidates[obj]) > 0
+                        else None
+                    ),
+                )
+                for obj in values_candidates
+            ]
+            label = (
+                outgoing_edge_label_candidates[edge_n3][0]
+                if len(outgoing_edge_label_candidates[edge_n3]) > 0
+                else None
+            )
+            edge = Property(
+                property=edge_n3,
+                label=label,
+                values=values,
+            )
+            outgoing_edges_dict[edge_n3] = edge
+        return outgoing_edges_dict
+
+    @cached("outgoing_edges_for", dict[str, Property])
     def outgoing_edges_for(self, cls: str, edges: list[str] = [], limit=128):
         if cls.startswith("_"):
             print("Skipping", cls)
             return {}
         try:
             # print("Loading outgoing edges for", cls, edges)
-            if edges and len(edges) > 0:
-                outgoing_edges = list(
-                    self.onto.query(
-                        f"""
+            outgoing_edges = list(
+                self.onto.query(self.__outgoing_edges_query(cls, edges, limit))
+            )
+            return self.__edges_to_properties(outgoing_edges)
+        except Exception as e:
+            print(traceback.format_exc(), e, cls)
+            skip_caching()
+            return {}
+
+    @cached("outgoing_edges_for", dict[str, Property])
+    async def aoutgoing_edges_for(self, cls: str, edges: list[str] = [], limit=128):
+        if cls.startswith("_"):
+            print("Skipping", cls)
+            return {}
+        try:
+            outgoing_edges = await self.aquery(
+                self.__outgoing_edges_query(cls, edges, limit)
+            )
+            return self.__edges_to_properties(list(outgoing_edges))
+        except Exception as e:
+            print(traceback.format_exc(), e, cls)
+            skip_caching()
+            return {}
+
+    def __outgoing_edges_query(self, cls: str, edges: list[str], limit=128) -> str:
+        if edges and len(edges) > 0:
+            return f"""
                     SELECT DISTINCT ?edge ?edge_lbl ?obj ?obj_lbl WHERE {{ {cls} ?edge ?obj. FILTER (?edge in ({", ".join(edges)})) 
 OPTIONAL {{?edge rdfs:label ?edge_label.}}
 OPTIONAL {{?obj rdfs:label ?obj_lbl.}}
                     }}
                     LIMIT {limit}
                     """
-                    )
-                )
-            else:
-                outgoing_edges = list(
-                    self.onto.query(
-                        f"""
+        return f"""
                     SELECT DISTINCT ?edge ?edge_lbl ?obj ?obj_lbl WHERE {{ {cls} ?edge ?obj. 
 OPTIONAL {{?edge rdfs:label ?edge_label.}}
 OPTIONAL {{?obj rdfs:label ?obj_lbl.}}
                     }}
                     LIMIT {limit}"""
-                    )
-                )
-            outgoing_edge_label_candidates: dict[str, list[str]] = (
-                self.__label_candidates(
-                    [(edge, edge_lbl) for edge, edge_lbl, _, _ in outgoing_edges]
-                )
-            )
-
-            outgoing_edges_dict: dict[str, Property] = {}
-            for edge_n3 in outgoing_edge_label_candidates:
-                values_candidates = self.__label_candidates(
-                    [
-                        (obj, obj_lbl)
-                        for edge, _, obj, obj_lbl in outgoing_edges
-                        if self.to_readable(edge) == edge_n3
-                    ]
-                )
-                values = [
-                    PropertyValue(
-                        value=obj,
-                        label=(
-                            values_candidates[obj][0]
-                            if len(values_candidates[obj]) > 0
-                            else None
-                        ),
-                    )
-                    for obj in values_candidates
-                ]
-                label = (
-                    outgoing_edge_label_candidates[edge_n3][0]
-                    if len(outgoing_edge_label_candidates[edge_n3]) > 0
-                    else None
-                )
-                edge = Property(
-                    property=edge_n3,
-                    label=label,
-                    values=values,
-                )
-                outgoing_edges_dict[edge_n3] = edge
-            return outgoing_edges_dict
-        except Exception as e:
-            print(traceback.format_exc(), e, cls)
-            return {}
 
     def refcount(self, cls):
         try:
@@ -369,6 +652,7 @@ OPTIONAL {{?obj rdfs:label ?obj_lbl.}}
             print(traceback.format_exc())
             return 0
 
+    @cached("properties_for", list[Subject])
     def properties_for(
         self, cls: str, property_type: str = "ObjectProperty", n_props=None
     ) -> list[Subject]:
@@ -389,16 +673,66 @@ OPTIONAL {{?obj rdfs:label ?obj_lbl.}}
                 )
             )
             # print("Loaded", len(properties), "properties for", cls)
-            props_mapped: list[Subject] = [
-                self.enrich_subject(prop[0], subject_type="individual")
-                for prop in properties
-            ]
+            props_mapped: list[Subject] = self.enrich_subjects(
+                [prop[0] for prop in properties], subject_type="individual"
+            )
             return props_mapped
         except Exception as e:
             print(traceback.format_exc())
             print("Failed to load properties for", cls)
+            skip_caching()
             return []
 
+    def __properties_batch(
+        self, terms: dict[str, URIRef], n_props=512
+    ) -> dict[str, dict[str, list[Subject]]]:
+        """
+        `properties_for` of every ref, one query per property type for all of them.
+        Property types whose query fails are left out and looked up per subject.
+        """
+        refs_for_term = self.__refs_for_term(terms)
+        prop_ids: dict[str, dict[str, list[URIRef]]] = {}
+        for prop_type in self.config.property_types:
+            try:
+                rows = self.__capped_rows(
+                    lambda pending: f"""
+                SELECT DISTINCT ?cls ?prop WHERE {{
+                VALUES ?cls {{ {" ".join(term.n3() for term in pending)} }}
+                ?prop rdf:type {prop_type}.
+                {{?prop rdfs:domain/(owl:unionOf/rdf:rest*/rdf:first)* ?cls. }}
+                UNION
+                {{?prop rdfs:domain ?cls. }}
+                }} LIMIT {n_props * len(pending)}""",
+                    refs_for_term,
+                    n_props,
+                )
+                prop_ids[prop_type] = self.__ids_per_parent(
+                    rows, refs_for_term, n_props
+                )
+            except Exception as e:
+                print(traceback.format_exc())
+                print("Failed to load properties for", list(terms), e)
+        all_props = [
+            prop
+            for ids in prop_ids.values()
+            for props in ids.values()
+            for prop in props
+        ]
+        enriched = dict(
+            zip(
+                all_props,
+                self.enrich_subjects(all_props, subject_type="individual"),
+            )
+        )
+        return {
+            ref: {
+                prop_type: [enriched[prop] for prop in ids[ref]]
+                for prop_type, ids in prop_ids.items()
+            }
+            for ref in terms
+        }
+
+    @cached("range_of", list[Subject])
     def range_of(self, prop: str, n_ranges: int = None):
         try:
             # print("Loading properties for", cls)
@@ -411,13 +745,14 @@ OPTIONAL {{?obj rdfs:label ?obj_lbl.}}
                 )
             )
             # print("Loaded", len(properties), "properties for", cls)
-            ranges_mapped: list[Subject] = [
-                self.enrich_subject(r[0], subject_type="individual") for r in ranges
-            ]
+            ranges_mapped: list[Subject] = self.enrich_subjects(
+                [r[0] for r in ranges], subject_type="individual"
+            )
             return ranges_mapped
         except Exception as e:
             print(traceback.format_exc())
             print("Failed to load range of", prop, e)
+            skip_caching()
             return []
 
     def open_properties(self):
@@ -433,25 +768,25 @@ OPTIONAL {{?obj rdfs:label ?obj_lbl.}}
         )
         return [prop[0].n3(self.onto.namespace_manager) for prop in open_properties]
 
-    def enrich_subject(
-        self, cls: str | None, subject_type="class", load_properties=False
-    ):
-        if cls is None:
+    def __subject_ref(self, cls: str | URIRef) -> str:
+        return cls.n3(self.onto.namespace_manager) if hasattr(cls, "n3") else cls
+
+    def term_for(self, ref: str) -> URIRef | None:
+        try:
+            term = from_n3(ref, nsm=self.onto.namespace_manager)
+        except Exception:
             return None
-        col_ref = cls.n3(self.onto.namespace_manager) if hasattr(cls, "n3") else cls
+        return term if isinstance(term, URIRef) else None
 
-        # print("Enriching", col_ref)
-        outgoing_edges = self.outgoing_edges_for(
-            col_ref,
-            edges=[
-                "rdfs:label",
-                "rdfs:range",
-                "rdfs:domain",
-                "rdfs:subPropertyOf",
-                "rdfs:subClassOf",
-                "rdf:type",
-            ],
-        )
+    def __build_subject(
+        self,
+        col_ref: str,
+        outgoing_edges: dict[str, Property],
+        instance_count: int,
+        subject_type="class",
+        load_properties=False,
+        properties: dict[str, list[Subject]] | None = None,
+    ) -> Subject:
         label_prop: Property = outgoing_edges.get(
             "rdfs:label",
             Property(values=[PropertyValue(value=col_ref, label=None)]),
@@ -461,63 +796,573 @@ OPTIONAL {{?obj rdfs:label ?obj_lbl.}}
             label=label_prop.first_value(),
             spos=outgoing_edges,
             subject_type=subject_type,
-            instance_count=self.instance_count(col_ref),
+            instance_count=instance_count,
             # refcount=refs,
         )
         if load_properties:
+            properties = properties or {}
             subject.properties = {
-                prop_type: self.properties_for(
-                    col_ref, property_type=prop_type, n_props=512
+                prop_type: (
+                    properties[prop_type]
+                    if prop_type in properties
+                    else self.properties_for(
+                        col_ref, property_type=prop_type, n_props=512
+                    )
                 )
                 for prop_type in self.config.property_types
             }
         return subject
+
+    @staticmethod
+    def __refs_for_term(terms: dict[str, URIRef]) -> dict[URIRef, list[str]]:
+        refs_for_term: dict[URIRef, list[str]] = defaultdict(list)
+        for ref, term in terms.items():
+            refs_for_term[term].append(ref)
+        return refs_for_term
+
+    @staticmethod
+    def __collect_capped(
+        rows_per_term: dict[URIRef, list],
+        rows: list,
+        pending: dict[URIRef, list[str]],
+        limit: int,
+    ) -> dict[URIRef, list[str]]:
+        """
+        Adds the rows of a batch query with `LIMIT limit * len(pending)` (subject
+        first), at most `limit` per subject. If the batch hit its LIMIT, the
+        subjects below their cap may miss rows and are returned to be queried
+        again; at least one subject reached its cap, so this ends.
+        """
+        for term in pending:
+            rows_per_term[term] = []
+        for row in rows:
+            if len(rows_per_term[row[0]]) < limit:
+                rows_per_term[row[0]].append(row)
+        if len(rows) < limit * len(pending):
+            return {}
+        return {
+            term: refs
+            for term, refs in pending.items()
+            if len(rows_per_term[term]) < limit
+        }
+
+    def __capped_rows(
+        self,
+        query: Callable[[dict[URIRef, list[str]]], str],
+        refs_for_term: dict[URIRef, list[str]],
+        limit: int,
+    ) -> list:
+        """
+        Rows of the batch `query`, at most `limit` per subject, so one subject with
+        many rows cannot crowd the others out of the batch LIMIT.
+        """
+        rows_per_term: dict[URIRef, list] = {}
+        pending = refs_for_term
+        while len(pending) > 0:
+            rows = list(self.onto.query(query(pending)))
+            pending = self.__collect_capped(rows_per_term, rows, pending, limit)
+        return [row for rows in rows_per_term.values() for row in rows]
+
+    async def __acapped_rows(
+        self,
+        query: Callable[[dict[URIRef, list[str]]], str],
+        refs_for_term: dict[URIRef, list[str]],
+        limit: int,
+    ) -> list:
+        rows_per_term: dict[URIRef, list] = {}
+        pending = refs_for_term
+        while len(pending) > 0:
+            rows = list(await self.aquery(query(pending)))
+            pending = self.__collect_capped(rows_per_term, rows, pending, limit)
+        return [row for rows in rows_per_term.values() for row in rows]
+
+    def __outgoing_edges_batch_query(
+        self, refs_for_term: dict[URIRef, list[str]], edges: list[str], limit=128
+    ) -> str:
+        return f"""
+                SELECT DISTINCT ?s ?edge ?edge_lbl ?obj ?obj_lbl WHERE {{
+                    VALUES ?s {{ {" ".join(term.n3() for term in refs_for_term)} }}
+                    ?s ?edge ?obj. FILTER (?edge in ({", ".join(edges)}))
+OPTIONAL {{?edge rdfs:label ?edge_label.}}
+OPTIONAL {{?obj rdfs:label ?obj_lbl.}}
+                }}
+                LIMIT {limit * len(refs_for_term)}"""
+
+    def __outgoing_edges_batch_rows(
+        self, rows, refs_for_term: dict[URIRef, list[str]], limit=128
+    ) -> dict[str, dict[str, Property]]:
+        edges_per_term: dict[URIRef, list[tuple]] = defaultdict(list)
+        for s, edge, edge_lbl, obj, obj_lbl in rows:
+            # same per-subject cap as the single-subject query
+            if len(edges_per_term[s]) < limit:
+                edges_per_term[s].append((edge, edge_lbl, obj, obj_lbl))
+        edges_per_ref: dict[str, dict[str, Property]] = {}
+        for term, term_edges in edges_per_term.items():
+            properties = self.__edges_to_properties(term_edges)
+            for ref in refs_for_term.get(term, []):
+                edges_per_ref[ref] = properties
+        return edges_per_ref
+
+    def __outgoing_edges_batch(
+        self, terms: dict[str, URIRef], edges: list[str], limit=128
+    ) -> dict[str, dict[str, Property]]:
+        refs_for_term = self.__refs_for_term(terms)
+        try:
+            outgoing_edges = self.__capped_rows(
+                lambda pending: self.__outgoing_edges_batch_query(
+                    pending, edges, limit
+                ),
+                refs_for_term,
+                limit,
+            )
+        except Exception as e:
+            print(traceback.format_exc(), e, list(terms))
+            skip_caching()
+            return {}
+        return self.__outgoing_edges_batch_rows(outgoing_edges, refs_for_term, limit)
+
+    def __instance_count_batch_query(
+        self, refs_for_term: dict[URIRef, list[str]]
+    ) -> str:
+        return f"""
+            SELECT ?cls (COUNT(?s) as ?count) WHERE {{
+                VALUES ?cls {{ {" ".join(term.n3() for term in refs_for_term)} }}
+                ?s a ?cls
+            }} GROUP BY ?cls"""
+
+    @staticmethod
+    def __instance_count_batch_rows(
+        rows, refs_for_term: dict[URIRef, list[str]]
+    ) -> dict[str, int]:
+        counts_per_ref: dict[str, int] = {}
+        for cls, count in rows:
+            for ref in refs_for_term.get(cls, []):
+                counts_per_ref[ref] = count.value
+        return counts_per_ref
+
+    def __statistics_counts(self, terms: dict[str, URIRef]) -> dict[str, int] | None:
+        if self.statistics is None or not self.statistics.loaded:
+            return None
+        return {
+            ref: self.statistics.instance_count(str(term))
+            for ref, term in terms.items()
+        }
+
+    def __instance_count_batch(self, terms: dict[str, URIRef]) -> dict[str, int]:
+        counts_per_ref = self.__statistics_counts(terms)
+        if counts_per_ref is not None:
+            return counts_per_ref
+        refs_for_term = self.__refs_for_term(terms)
+        try:
+            counts = list(
+                self.onto.query(self.__instance_count_batch_query(refs_for_term))
+            )
+        except Exception as e:
+            print(traceback.format_exc(), e, list(terms))
+            skip_caching()
+            return {}
+        return self.__instance_count_batch_rows(counts, refs_for_term)
+
+    async def __aenrich_batch(
+        self, terms: dict[str, URIRef]
+    ) -> tuple[dict[str, dict[str, Property]], dict[str, int]] | None:
+        refs_for_term = self.__refs_for_term(terms)
+        counts_per_ref = self.__statistics_counts(terms)
+        edges_rows = self.__acapped_rows(
+            lambda pending: self.__outgoing_edges_batch_query(pending, ENRICH_EDGES),
+            refs_for_term,
+            128,
+        )
+        try:
+            if counts_per_ref is not None:
+                outgoing_edges = await edges_rows
+            else:
+                outgoing_edges, counts = await asyncio.gather(
+                    edges_rows,
+                    self.aquery(self.__instance_count_batch_query(refs_for_term)),
+                )
+                counts_per_ref = self.__instance_count_batch_rows(counts, refs_for_term)
+        except Exception as e:
+            print(traceback.format_exc(), e, list(terms))
+            return None
+        return (
+            self.__outgoing_edges_batch_rows(outgoing_edges, refs_for_term),
+            counts_per_ref,
+        )
+
+    def __enrichment_plan(
+        self, subjects: list[str | URIRef | None], subject_type: str, load_properties
+    ) -> tuple[list, dict[str, Subject], dict[str, str], list[str], dict[str, URIRef]]:
+        """Splits the requested subjects into cache hits and refs that need a query."""
+        col_refs = [
+            self.__subject_ref(cls) if cls is not None else None for cls in subjects
+        ]
+        unique_refs = list(dict.fromkeys(ref for ref in col_refs if ref is not None))
+        enriched: dict[str, Subject] = {}
+        cache_keys: dict[str, str] = {}
+        if self.cache is not None:
+            for ref in unique_refs:
+                cache_keys[ref] = self.cache.key(
+                    self.identifier, "enrich_subject", ref, subject_type, load_properties
+                )
+                subject = self.cache.get(cache_keys[ref], SUBJECT_ADAPTER)
+                if subject is not MISSING:
+                    enriched[ref] = subject
+        missing_refs = [ref for ref in unique_refs if ref not in enriched]
+        terms: dict[str, URIRef] = {}
+        for ref in missing_refs:
+            if ref.startswith("_"):
+                continue
+            term = self.term_for(ref)
+            if term is not None:
+                terms[ref] = term
+        return col_refs, enriched, cache_keys, missing_refs, terms
+
+    def enrich_subjects(
+        self,
+        subjects: list[str | URIRef | None],
+        subject_type="class",
+        load_properties=False,
+        batch_size=128,
+    ) -> list[Subject | None]:
+        """
+        Enrich a list of subjects at once.
+        Labels, edges, instance counts and, with `load_properties`, the properties
+        are fetched with `VALUES` queries per batch instead of per subject. The
+        result is aligned with the input.
+        """
+        col_refs, enriched, cache_keys, missing_refs, terms = self.__enrichment_plan(
+            subjects, subject_type, load_properties
+        )
+
+        with caching_scope() as scope:
+            batched_terms = list(terms.items())
+            outgoing_edges: dict[str, dict[str, Property]] = {}
+            instance_counts: dict[str, int] = {}
+            properties: dict[str, dict[str, list[Subject]]] = {}
+            for i in range(0, len(batched_terms), batch_size):
+                batch = dict(batched_terms[i : i + batch_size])
+                outgoing_edges.update(
+                    self.__outgoing_edges_batch(batch, ENRICH_EDGES)
+                )
+                instance_counts.update(self.__instance_count_batch(batch))
+                if load_properties:
+                    properties.update(self.__properties_batch(batch))
+
+            for ref in missing_refs:
+                if ref in terms:
+                    enriched[ref] = self.__build_subject(
+                        ref,
+                        outgoing_edges.get(ref, {}),
+                        instance_counts.get(ref, 0),
+                        subject_type=subject_type,
+                        load_properties=load_properties,
+                        properties=properties.get(ref),
+                    )
+                else:
+                    # blank nodes and unresolvable prefixes take the single-subject path
+                    enriched[ref] = self.__enrich_subject_single(
+                        ref, subject_type=subject_type, load_properties=load_properties
+                    )
+        if self.cache is not None and not scope.skipped:
+            self.__cache_subjects(cache_keys, enriched, missing_refs)
+        return [enriched[ref] if ref is not None else None for ref in col_refs]
+
+    async def aenrich_subjects(
+        self,
+        subjects: list[str | URIRef | None],
+        subject_type="class",
+        load_properties=False,
+        batch_size=128,
+    ) -> list[Subject | None]:
+        """
+        Async variant of `enrich_subjects`, running the batches concurrently.
+        Loading properties needs the synchronous lookups and runs in a worker thread.
+        """
+        if load_properties:
+            return await asyncio.to_thread(
+                self.enrich_subjects,
+                subjects,
+                subject_type=subject_type,
+                load_properties=load_properties,
+                batch_size=batch_size,
+            )
+        # the plan reads the cache and may resolve the identifier, both blocking
+        plan = await asyncio.to_thread(
+            self.__enrichment_plan, subjects, subject_type, load_properties
+        )
+        col_refs, enriched, cache_keys, missing_refs, terms = plan
+
+        batched_terms = list(terms.items())
+        batches = await asyncio.gather(
+            *[
+                self.__aenrich_batch(dict(batched_terms[i : i + batch_size]))
+                for i in range(0, len(batched_terms), batch_size)
+            ]
+        )
+        # batches run as separate tasks, so failures are collected here instead of
+        # through skip_caching
+        failed = any(batch is None for batch in batches)
+        outgoing_edges: dict[str, dict[str, Property]] = {}
+        instance_counts: dict[str, int] = {}
+        for batch in batches:
+            if batch is not None:
+                outgoing_edges.update(batch[0])
+                instance_counts.update(batch[1])
+
+        for ref in missing_refs:
+            if ref in terms:
+                enriched[ref] = self.__build_subject(
+                    ref,
+                    outgoing_edges.get(ref, {}),
+                    instance_counts.get(ref, 0),
+                    subject_type=subject_type,
+                )
+            else:
+                enriched[ref], skipped = await asyncio.to_thread(
+                    self.__enrich_subject_scoped, ref, subject_type
+                )
+                failed = failed or skipped
+        if self.cache is not None and not failed:
+            await asyncio.to_thread(
+                self.__cache_subjects, cache_keys, enriched, missing_refs
+            )
+        return [enriched[ref] if ref is not None else None for ref in col_refs]
+
+    def __cache_subjects(
+        self, cache_keys: dict[str, str], enriched: dict[str, Subject], refs: list[str]
+    ):
+        for ref in refs:
+            self.cache.set(cache_keys[ref], enriched[ref], SUBJECT_ADAPTER)
+
+    def __enrich_subject_single(
+        self, col_ref: str, subject_type="class", load_properties=False
+    ):
+        # print("Enriching", col_ref)
+        outgoing_edges = self.outgoing_edges_for(col_ref, edges=ENRICH_EDGES)
+        return self.__build_subject(
+            col_ref,
+            outgoing_edges,
+            self.instance_count(col_ref),
+            subject_type=subject_type,
+            load_properties=load_properties,
+        )
         # refs = self.refcount(col_ref)
 
-    def load_full_graph(self, depth=10) -> list[Subject]:
-        roots = self.get_root_classes(load_properties=True)
+    def __enrich_subject_scoped(self, col_ref: str, subject_type="class"):
+        # worker threads run in a copy of the caller's context, so the skip is
+        # handed back explicitly
+        with caching_scope() as scope:
+            subject = self.__enrich_subject_single(col_ref, subject_type=subject_type)
+        return subject, scope.skipped
 
-        def enrich_descendants(cls: Subject, d=depth):
-            # print("enriching", cls.subject_id)
-            cls.total_descendants = 1  # self
-            if d <= 0:
-                return []
-            try:
-                subclasses = self.get_subclasses(cls.subject_id, load_properties=True)
-                cls.descendants["subClass"] = [
-                    enrich_descendants(subcls, d=d - 1) for subcls in subclasses
-                ]
-            except Exception as e:
-                print(traceback.format_exc())
+    def enrich_subject(
+        self, cls: str | None, subject_type="class", load_properties=False
+    ):
+        if cls is None:
+            return None
+        return self.enrich_subjects(
+            [cls], subject_type=subject_type, load_properties=load_properties
+        )[0]
+
+    async def aenrich_subject(
+        self, cls: str | None, subject_type="class", load_properties=False
+    ):
+        if cls is None:
+            return None
+        return (
+            await self.aenrich_subjects(
+                [cls], subject_type=subject_type, load_properties=load_properties
+            )
+        )[0]
+
+    def load_full_graph(
+        self, depth=10, max_workers: int | None = None
+    ) -> list[Subject]:
+        """
+        Loads the class tree breadth-first.
+        Every level is expanded with one `VALUES` query for the subclasses and one
+        for the named individuals per batch of classes, and enriched in batches,
+        all spread over a thread pool.
+        `roots_cache` holds the partial tree while it grows.
+        """
+        max_workers = max_workers or self.config.load_workers
+        self.load_progress = GraphLoadProgress(running=True)
+        try:
+            roots = self.get_root_classes(load_properties=True, use_snapshot=False)
+            for root in roots:
+                root.total_descendants = 1  # self
+            self.roots_cache = roots
+            self.load_progress.loaded = len(roots)
+            self.__roots_ready.set()
+
+            level = roots
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                for d in range(depth):
+                    if len(level) == 0:
+                        break
+                    self.load_progress.level = d
+                    self.load_progress.pending = len(level)
+                    level = self.__expand_level(level, pool)
+            self.load_progress.done = True
+            if self.snapshot is not None:
+                try:
+                    self.snapshot.save(roots)
+                except Exception as e:
+                    print(traceback.format_exc())
+                    print("Failed to save class tree snapshot", e)
+            return roots
+        finally:
+            self.load_progress.running = False
+            self.load_progress.pending = 0
+            self.__roots_ready.set()
+
+    def __expand_level(
+        self, level: list[Subject], pool: ThreadPoolExecutor, batch_size=64
+    ) -> list[Subject]:
+        def ids_or_empty(fetch, cls: str) -> list[URIRef]:
             try:
-                named_ind = self.get_named_individuals(cls.subject_id)
-                cls.descendants["namedIndividual"] = [
-                    enrich_descendants(ni, d=d - 1) for ni in named_ind
-                ]
+                return fetch(cls)
             except Exception as e:
                 print(traceback.format_exc())
+                return []
 
-            return cls
+        def ids_batched(fetch_batch, fetch, cls_ids: list[str]):
+            terms: dict[str, URIRef] = {}
+            for ref in cls_ids:
+                term = None if ref.startswith("_") else self.term_for(ref)
+                if term is not None:
+                    terms[ref] = term
+            batched_terms = list(terms.items())
+            batches = [
+                self.__refs_for_term(dict(batched_terms[i : i + batch_size]))
+                for i in range(0, len(batched_terms), batch_size)
+            ]
 
-        roots = [
-            enrich_descendants(cls)
-            for cls in tqdm(roots, desc="Enriching root classes")
-        ]
-        self.roots_cache = roots
-        return roots
+            def fetch_or_single(refs_for_term: dict[URIRef, list[str]]):
+                try:
+                    return fetch_batch(refs_for_term)
+                except Exception as e:
+                    print(traceback.format_exc())
+                    refs = [ref for refs in refs_for_term.values() for ref in refs]
+                    return {ref: ids_or_empty(fetch, ref) for ref in refs}
+
+            ids: dict[str, list[URIRef]] = {}
+            for batch in pool.map(fetch_or_single, batches):
+                ids.update(batch)
+            # blank nodes and unresolvable prefixes are queried one by one
+            single = [ref for ref in cls_ids if ref not in terms]
+            ids.update(zip(single, pool.map(partial(ids_or_empty, fetch), single)))
+            return ids
+
+        cls_ids = list(dict.fromkeys(cls.subject_id for cls in level))
+        subclass_ids = ids_batched(
+            self.__subclass_ids_batch, self.__subclass_ids, cls_ids
+        )
+        individual_ids = ids_batched(
+            self.__named_individual_ids_batch, self.__named_individual_ids, cls_ids
+        )
+
+        def enrich_batched(ids: list[URIRef], **kwargs) -> dict[URIRef, Subject]:
+            ids = list(dict.fromkeys(ids))
+            batches = [ids[i : i + batch_size] for i in range(0, len(ids), batch_size)]
+            enriched = pool.map(
+                lambda batch: self.enrich_subjects(batch, **kwargs), batches
+            )
+            return dict(zip(ids, [s for batch in enriched for s in batch]))
+
+        subclasses = enrich_batched(
+            [i for ids in subclass_ids.values() for i in ids], load_properties=True
+        )
+        individuals = enrich_batched(
+            [i for ids in individual_ids.values() for i in ids],
+            subject_type="individual",
+        )
+
+        used: set[int] = set()
+
+        def occurrence(subject: Subject) -> Subject:
+            # a class reachable over several parents appears once per parent
+            if id(subject) in used:
+                subject = subject.model_copy(deep=True)
+            used.add(id(subject))
+            subject.total_descendants = 1  # self
+            return subject
+
+        next_level: list[Subject] = []
+        with tqdm(
+            total=len(level), desc=f"Loading level {self.load_progress.level}"
+        ) as progress:
+            for cls in level:
+                descendants = {
+                    "subClass": [
+                        occurrence(subclasses[i]) for i in subclass_ids[cls.subject_id]
+                    ],
+                    "namedIndividual": [
+                        occurrence(individuals[i])
+                        for i in individual_ids[cls.subject_id]
+                    ],
+                }
+                for individual in descendants["namedIndividual"]:
+                    individual.descendants = {"subClass": [], "namedIndividual": []}
+                # swap in whole dicts so concurrent readers never see a half-filled node
+                cls.descendants = descendants
+                next_level.extend(descendants["subClass"])
+                self.load_progress.loaded += len(descendants["subClass"]) + len(
+                    descendants["namedIndividual"]
+                )
+                progress.update(1)
+        return next_level
+
+    def start_full_graph_load(self, depth=10):
+        with self.__load_lock:
+            if self.load_progress.done or (
+                self.__load_thread is not None and self.__load_thread.is_alive()
+            ):
+                return
+            self.__roots_ready.clear()
+            self.__load_thread = threading.Thread(
+                target=self.load_full_graph,
+                kwargs={"depth": depth},
+                daemon=True,
+            )
+            self.__load_thread.start()
 
     def get_full_classes(self) -> list[Subject]:
-        if hasattr(self, "roots_cache"):
+        """Returns the class tree, which may still be partial while it is loading."""
+        if self.load_progress.done:
             return self.roots_cache
-        graph = self.load_full_graph()
-        return graph
+        if self.snapshot is not None:
+            roots = self.snapshot.full_tree()
+            if roots is not None:
+                self.roots_cache = roots
+                self.load_progress = GraphLoadProgress(done=True)
+                return roots
+        self.start_full_graph_load()
+        self.__roots_ready.wait()
+        return self.roots_cache if self.roots_cache is not None else []
 
+    def __statistics_count(self, kind: str, cls: str) -> int | None:
+        if self.statistics is None or not self.statistics.loaded:
+            return None
+        term = self.term_for(cls)
+        if term is None:
+            return None
+        return self.statistics.count(kind, str(term))
+
+    @cached("instance_count", int)
     def instance_count(self, cls: str):
+        count = self.__statistics_count("class", cls)
+        if count is not None:
+            return count
         return self.q_to_df(
             f"SELECT DISTINCT (COUNT(?s) as ?count) WHERE {{?s a {cls}}}"
         )[0][0].value
 
     def property_count(self, cls: str):
+        count = self.__statistics_count("property", cls)
+        if count is not None:
+            return count
         return list(
             self.onto.query(
                 f"SELECT DISTINCT (COUNT(?s) as ?count) WHERE {{?s {cls} ?o}}"
@@ -525,6 +1370,10 @@ OPTIONAL {{?obj rdfs:label ?obj_lbl.}}
         )[0][0].value
 
     def get_parents(self, cls: str) -> list[str]:
+        if self.hierarchy is not None:
+            parents = self.hierarchy.parents(cls)
+            if parents is not None:
+                return parents
         parents = self.q_to_df_values(
             f"SELECT DISTINCT ?p WHERE {{ {cls} rdfs:subClassOf* ?p. ?p rdf:type owl:Class }}"
         )
@@ -546,39 +1395,52 @@ OPTIONAL {{?obj rdfs:label ?obj_lbl.}}
         * Find the classes linked by the in/out links
         * Choose the highest class with at least one in/out link
         """
+        ancestors = (
+            self.hierarchy.ancestors(q.cls) if self.hierarchy is not None else None
+        )
+        if ancestors is not None:
+            # most distant first, as the path length ordering below
+            parent_ids = [
+                ancestor
+                for ancestor, depth in sorted(ancestors, key=lambda a: -a[1])
+                if depth > 0
+            ]
+        else:
+            parent_ids = [cls[0] for cls in self.__generic_parents(q.cls)]
+        return self.__most_generic(q, parent_ids)
+
+    def __generic_parents(self, cls: str):
         query = f"""SELECT ?cls (count(?mid) as ?distance)
                      WHERE {{
                         ?cls rdf:type owl:Class.
-                        {q.cls} rdfs:subClassOf* ?mid .
+                        {cls} rdfs:subClassOf* ?mid .
                         ?mid rdfs:subClassOf+ ?cls .
                     }}
                     group by ?cls ?distance 
                     order by  DESC(?distance) 
                     """
-        classes = list(
+        return list(
             self.onto.query(
                 query,
             )
         )
 
+    def __most_generic(self, q: GeneralizationQuery, parent_ids: list):
         class LinkedSubject(Subject):
             out_links: list[SubjectLink] = Field([])
             in_links: list[SubjectLink] = Field([])
 
-        parent_classes: list[LinkedSubject] = [
-            self.enrich_subject(cls[0], subject_type="class") for cls in classes
-        ] + [self.enrich_subject(q.cls, subject_type="class")]
+        parent_classes: list[LinkedSubject] = self.enrich_subjects(
+            parent_ids + [q.cls], subject_type="class"
+        )
         parent_classes = [
             LinkedSubject.model_validate(cls.model_dump()) for cls in parent_classes
         ]
-        out_links = [
-            self.enrich_subject(link, subject_type="link").to_link()
-            for link in q.out_link_ids
-        ]
-        in_links = [
-            self.enrich_subject(link, subject_type="link").to_link()
-            for link in q.in_link_ids
-        ]
+        links = self.enrich_subjects(
+            q.out_link_ids + q.in_link_ids, subject_type="link"
+        )
+        out_links = [link.to_link() for link in links[: len(q.out_link_ids)]]
+        in_links = [link.to_link() for link in links[len(q.out_link_ids) :]]
         for parent_class in parent_classes:
             parent_class.out_links = [
                 link for link in out_links if link.from_id == parent_class.subject_id
@@ -0,0 +1,173 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from hashlib import sha1
+from types import SimpleNamespace
+from typing import Any, Callable
+import asyncio
+import inspect
+import threading
+import traceback
+
+from cachetools import TTLCache
+from pydantic import TypeAdapter
+
+from redis_cache import RedisCache
+
+MISSING = object()
+# a context variable instead of a thread local, so concurrent requests on the event
+# loop do not see each other's skips
+_skip: ContextVar[bool] = ContextVar("ontology_cache_skip", default=False)
+
+
+@contextmanager
+def caching_scope():
+    """
+    Tracks whether anything inside the scope called `skip_caching`.
+    Nested scopes propagate a skip to their parents, so results built on top of
+    a failed query are not cached either.
+    """
+    outer = _skip.get()
+    _skip.set(False)
+    scope = SimpleNamespace(skipped=False)
+    try:
+        yield scope
+    finally:
+        scope.skipped = _skip.get()
+        _skip.set(outer or scope.skipped)
+
+
+def skip_caching():
+    """Marks the result of the current cached call as not cacheable (e.g. after a failed query)."""
+    _skip.set(True)
+
+
+class _BoundedTTLCache(TTLCache):
+    # TTLCache evicts least recently used entries first, so bounding the item count
+    # on top of the byte size keeps it an LRU with two limits
+    def __init__(self, max_items: int, max_bytes: int, ttl: float):
+        super().__init__(maxsize=max_bytes, ttl=ttl, getsizeof=len)
+        self.max_items = max_items
+
+    def __setitem__(self, key, value):
+        while key not in self and len(self) >= self.max_items:
+            self.popitem()
+        super().__setitem__(key, value)
+
+
+class OntologyCache:
+    """
+    Two-tier cache for ontology lookups.
+    Values are kept serialised, so every hit hands out a fresh copy and callers
+    may mutate what they get back. The optional shared tier lets several workers
+    reuse warm entries; keys carry the ontology hash, so a different ontology
+    never sees stale data.
+    """
+
+    def __init__(
+        self,
+        max_items: int = 100_000,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl: float = 24 * 60 * 60,
+        redis_cache: RedisCache | None = None,
+        prefix: str = "onto",
+    ):
+        self.ttl = ttl
+        self.prefix = prefix
+        self.local = _BoundedTTLCache(max_items, max_bytes, ttl)
+        self.shared = redis_cache
+        self.lock = threading.Lock()
+
+    def key(self, identifier: str, kind: str, *parts: Any) -> str:
+        digest = sha1(repr(parts).encode()).hexdigest()
+        return f"{self.prefix}:{identifier}:{kind}:{digest}"
+
+    def get(self, key: str, adapter: TypeAdapter):
+        with self.lock:
+            data = self.local.get(key)
+        if data is None and self.shared is not None:
+            try:
+                data = self.shared.get_raw(key)
+            except Exception as e:
+                print(traceback.format_exc())
+                print("Failed to read shared ontology cache", e)
+            if data is not None:
+                with self.lock:
+                    try:
+                        self.local[key] = data
+                    except ValueError:
+                        # larger than the whole local tier
+                        pass
+        if data is None:
+            return MISSING
+        return adapter.validate_json(data)
+
+    def set(self, key: str, value: Any, adapter: TypeAdapter):
+        data = adapter.dump_json(value)
+        with self.lock:
+            try:
+                self.local[key] = data
+            except ValueError:
+                # larger than the whole local tier
+                pass
+        if self.shared is not None:
+            try:
+                self.shared.set_raw(key, data, ttl=int(self.ttl))
+            except Exception as e:
+                print(traceback.format_exc())
+                print("Failed to write shared ontology cache", e)
+
+    def clear(self):
+        with self.lock:
+            self.local.clear()
+
+
+def cached(kind: str, value_type: Any) -> Callable:
+    """
+    Caches an `OntologyManager` method in `self.cache`, keyed on the ontology
+    identifier and the call arguments. Works for plain and async methods.
+    """
+    adapter = TypeAdapter(value_type)
+
+    def lookup(self, cache: OntologyCache, args, kwargs) -> tuple[str, Any]:
+        key = cache.key(self.identifier, kind, args, sorted(kwargs.items()))
+        return key, cache.get(key, adapter)
+
+    def decorator(fn: Callable):
+        if inspect.iscoroutinefunction(fn):
+
+            @wraps(fn)
+            async def async_wrapper(self, *args, **kwargs):
+                cache: OntologyCache | None = self.cache
+                if cache is None:
+                    return await fn(self, *args, **kwargs)
+                # the identifier and the shared tier may block, so the lookup runs
+                # in a worker thread
+                key, value = await asyncio.to_thread(lookup, self, cache, args, kwargs)
+                if value is not MISSING:
+                    return value
+                with caching_scope() as scope:
+                    value = await fn(self, *args, **kwargs)
+                if not scope.skipped:
+                    await asyncio.to_thread(cache.set, key, value, adapter)
+                return value
+
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            cache: OntologyCache | None = self.cache
+            if cache is None:
+                return fn(self, *args, **kwargs)
+            key, value = lookup(self, cache, args, kwargs)
+            if value is not MISSING:
+                return value
+            with caching_scope() as scope:
+                value = fn(self, *args, **kwargs)
+            if not scope.skipped:
+                cache.set(key, value, adapter)
+            return value
+
+        return wrapper
+
+    return decorator
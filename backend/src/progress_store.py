@@ -0,0 +1,136 @@
+from typing import Generic, TypeVar
+import json
+
+import redis
+from pydantic import BaseModel
+
+try:
+    import zstandard
+except ImportError:
+    # optional, see the "progress" extra
+    zstandard = None
+
+T = TypeVar("T", bound=BaseModel)
+
+# prefixes of the stored values
+PLAIN = b"j"
+ZSTD = b"z"
+
+
+class ProgressStore(Generic[T]):
+    """
+    Progress documents as a hash of their header fields and a list with one entry
+    per step (`steps_field`), so an update writes the header and appends the new
+    step instead of rewriting the whole document. Values of at least
+    `compress_min_bytes` are zstd compressed when zstandard is installed.
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        model: type[T],
+        steps_field: str,
+        prefix: str = "progress",
+        ttl: float = 24 * 60 * 60,
+        compress: bool = True,
+        compress_min_bytes: int = 4096,
+        compression_level: int = 3,
+    ):
+        self.redis = client
+        self.model = model
+        self.steps_field = steps_field
+        self.prefix = prefix
+        self.ttl = ttl
+        self.compress_min_bytes = compress_min_bytes
+        if compress and zstandard is None:
+            print("zstandard is not installed, storing progress uncompressed")
+        self.__compressor = (
+            zstandard.ZstdCompressor(level=compression_level)
+            if compress and zstandard is not None
+            else None
+        )
+
+    def __header_key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def __steps_key(self, key: str) -> str:
+        return f"{self.prefix}:{key}:steps"
+
+    def __encode(self, data: str) -> bytes:
+        data = data.encode()
+        if self.__compressor is not None and len(data) >= self.compress_min_bytes:
+            return ZSTD + self.__compressor.compress(data)
+        return PLAIN + data
+
+    @staticmethod
+    def __decode(value: bytes) -> str:
+        if value[:1] == ZSTD:
+            if zstandard is None:
+                raise RuntimeError("zstandard is needed to read compressed progress")
+            return zstandard.ZstdDecompressor().decompress(value[1:]).decode()
+        return value[1:].decode()
+
+    def set(
+        self,
+        key: str,
+        progress: T,
+        step: BaseModel | None = None,
+        exclude: set[str] | None = None,
+        reset: bool = False,
+    ):
+        """
+        Writes the header fields of `progress` (without the steps and `exclude`)
+        and appends `step`; `reset` drops the stored steps first.
+        """
+        header = {
+            field: self.__encode(json.dumps(value))
+            for field, value in progress.model_dump(
+                mode="json", exclude={self.steps_field} | (exclude or set())
+            ).items()
+        }
+        pipe = self.redis.pipeline()
+        if reset:
+            pipe.delete(self.__steps_key(key))
+        pipe.hset(self.__header_key(key), mapping=header)
+        if step is not None:
+            pipe.rpush(self.__steps_key(key), self.__encode(step.model_dump_json()))
+        pipe.expire(self.__header_key(key), int(self.ttl))
+        pipe.expire(self.__steps_key(key), int(self.ttl))
+        pipe.execute()
+
+    def get_header(self, key: str) -> T | None:
+        """The progress without its steps, a single hash read."""
+        data = self.redis.hgetall(self.__header_key(key))
+        if not data:
+            return None
+        return self.model.model_validate(
+            {
+                field.decode(): json.loads(self.__decode(value))
+                for field, value in data.items()
+            }
+        )
+
+    def get_steps(self, key: str, start: int = 0, end: int = -1) -> list[str]:
+        """JSON of the steps `start` to `end` (inclusive), decoded but not parsed."""
+        return [
+            self.__decode(value)
+            for value in self.redis.lrange(self.__steps_key(key), start, end)
+        ]
+
+    def count_steps(self, key: str) -> int:
+        return self.redis.llen(self.__steps_key(key))
+
+    def get(self, key: str) -> T | None:
+        """The whole progress, header and steps."""
+        pipe = self.redis.pipeline()
+        pipe.hgetall(self.__header_key(key))
+        pipe.lrange(self.__steps_key(key), 0, -1)
+        data, steps = pipe.execute()
+        if not data:
+            return None
+        document = {
+            field.decode(): json.loads(self.__decode(value))
+            for field, value in data.items()
+        }
+        document[self.steps_field] = [json.loads(self.__decode(s)) for s in steps]
+        return self.model.model_validate(document)
@@ -0,0 +1,77 @@
+import traceback
+
+import redis
+import redis.asyncio
+
+
+class ProgressStream:
+    """
+    Redis stream of progress events per query, read by the server-sent events
+    endpoint: header updates, every new `relations_steps` entry once, the LLM
+    tokens and the final status. Stream ids double as SSE event ids, so a client
+    reconnecting with its Last-Event-ID resumes after the last event it got.
+    """
+
+    def __init__(
+        self,
+        redis_url: str = "redis://localhost:6379/0",
+        client: redis.Redis | None = None,
+        aclient: redis.asyncio.Redis | None = None,
+        prefix: str = "llm_events",
+        maxlen: int = 10_000,
+        ttl: float = 24 * 60 * 60,
+    ):
+        self.redis_url = redis_url
+        self.redis = client if client is not None else redis.Redis.from_url(redis_url)
+        self.__aredis = aclient
+        self.prefix = prefix
+        self.maxlen = maxlen
+        self.ttl = ttl
+
+    @property
+    def aredis(self) -> redis.asyncio.Redis:
+        # created on first read, inside the server's event loop
+        if self.__aredis is None:
+            self.__aredis = redis.asyncio.Redis.from_url(self.redis_url)
+        return self.__aredis
+
+    def key(self, stream_id: str) -> str:
+        return f"{self.prefix}:{stream_id}"
+
+    def publish(self, stream_id: str, event: str, data: str) -> str | None:
+        """Appends an event, returns its id. Failures do not stop the query."""
+        key = self.key(stream_id)
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.xadd(
+                key,
+                {"event": event, "data": data},
+                maxlen=self.maxlen,
+                approximate=True,
+            )
+            pipe.expire(key, int(self.ttl))
+            return pipe.execute()[0].decode()
+        except Exception as e:
+            print(traceback.format_exc())
+            print("Failed to publish progress event", e)
+            return None
+
+    async def aread(
+        self, stream_id: str, last_id: str = "0", block_ms: int = 15_000
+    ) -> list[tuple[str, str, str]]:
+        """
+        (id, event, data) of the events after `last_id`, waiting up to `block_ms`
+        for the first one; empty on timeout.
+        """
+        response = await self.aredis.xread(
+            {self.key(stream_id): last_id}, block=block_ms
+        )
+        return [
+            (event_id.decode(), fields[b"event"].decode(), fields[b"data"].decode())
+            for _, events in response
+            for event_id, fields in events
+        ]
+
+    async def aclose(self):
+        if self.__aredis is not None:
+            await self.__aredis.aclose()
@@ -3,10 +3,48 @@ import redis
 from pydantic import BaseModel
 from redis_om import Field, HashModel, Migrator
 import os
+import threading
+import time
+import traceback
 from typing import TypeVar, Generic, List
 
 T = TypeVar("T", bound=BaseModel)
 
+_migrated = False
+_migrate_failed_at: float | None = None
+_migrate_lock = threading.Lock()
+# seconds between migration attempts while Redis is unreachable
+MIGRATE_RETRY_SECONDS = 30.0
+
+
+def _migrate():
+    # runs the redis-om migrations once per process, on first use instead of on
+    # construction, so creating a cache does not connect to Redis
+    global _migrated, _migrate_failed_at
+
+    def waiting() -> bool:
+        return (
+            _migrate_failed_at is not None
+            and time.monotonic() - _migrate_failed_at < MIGRATE_RETRY_SECONDS
+        )
+
+    if _migrated or waiting():
+        return
+    with _migrate_lock:
+        if _migrated or waiting():
+            return
+        try:
+            Migrator().run()
+        except Exception as e:
+            # logged once, retried after MIGRATE_RETRY_SECONDS
+            if _migrate_failed_at is None:
+                print(traceback.format_exc())
+                print("Failed to run redis migrations", e)
+            _migrate_failed_at = time.monotonic()
+            return
+        _migrated = True
+        _migrate_failed_at = None
+
 
 class RedisCache(Generic[T]):
     def __init__(
@@ -15,16 +53,23 @@ class RedisCache(Generic[T]):
         os.environ["REDIS_OM_URL"] = redis_url
         self.model = model
         self.redis = redis.Redis.from_url(redis_url)
-        Migrator().run()
 
     def get(self, key: str) -> T:
-        data = self.redis.get(key)
+        data = self.get_raw(key)
         if data:
             parsed_data = self.model.model_validate_json(data)
             return parsed_data
 
     def set(self, key: str, value: T, ttl=24 * 60 * 60):
-        self.redis.setex(key, ttl, value.model_dump_json())
+        self.set_raw(key, value.model_dump_json(), ttl=ttl)
+
+    def get_raw(self, key: str) -> bytes | None:
+        _migrate()
+        return self.redis.get(key)
+
+    def set_raw(self, key: str, data: bytes | str, ttl=24 * 60 * 60):
+        _migrate()
+        self.redis.setex(key, ttl, data)
 
     def __setitem__(self, key: str, value: T) -> None:
         return self.set(key, value)
@@ -0,0 +1,216 @@
+import asyncio
+import random
+from typing import AsyncIterator
+
+import httpx
+from rdflib import BNode, Literal, URIRef
+from rdflib.namespace import NamespaceManager
+from rdflib.util import from_n3
+import regex as re
+
+PREFIX_DECLARATION = re.compile(r"PREFIX\s+([\w\-]*):", re.IGNORECASE)
+PROLOGUE = re.compile(
+    r"^(?:\s*(?:#[^\n]*|PREFIX\s+[\w\-]*:\s*<[^>]*>|BASE\s*<[^>]*>))*",
+    re.IGNORECASE,
+)
+
+
+class SparqlResult:
+    """Minimal stand-in for an rdflib query result: variable names and rows of terms."""
+
+    def __init__(self, vars: list[str], rows: list[tuple]):
+        self.vars = vars
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def paginate_query(query: str, limit: int | None = None, skip: int | None = None):
+    """
+    Applies LIMIT/OFFSET to a SELECT query by wrapping it as a sub-select, so
+    modifiers of the original query stay intact. The prologue (PREFIX/BASE) is
+    hoisted in front of the wrapper.
+    """
+    if limit is None and not skip:
+        return query
+    prologue = PROLOGUE.match(query).group(0)
+    body = query[len(prologue) :]
+    if not body.lstrip().upper().startswith("SELECT"):
+        return query
+    modifiers = f"LIMIT {limit}" if limit is not None else ""
+    if skip:
+        modifiers += f" OFFSET {skip}"
+    return f"{prologue}\nSELECT * WHERE {{\n{body.strip()}\n}}\n{modifiers}"
+
+
+def parse_term(binding: dict | None):
+    if binding is None:
+        return None
+    value = binding["value"]
+    match binding["type"]:
+        case "uri":
+            return URIRef(value)
+        case "bnode":
+            return BNode(value)
+        case "literal" | "typed-literal":
+            if "xml:lang" in binding:
+                return Literal(value, lang=binding["xml:lang"])
+            if "datatype" in binding:
+                return Literal(value, datatype=URIRef(binding["datatype"]))
+            return Literal(value)
+    return Literal(value)
+
+
+class AsyncSparqlClient:
+    """
+    Asynchronous SPARQL client on a pooled HTTP connection.
+    Prefixes of the namespace manager are injected like rdflib's SPARQLStore does,
+    so the queries written for `Graph.query` work unchanged.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        namespace_manager: NamespaceManager | None = None,
+        params: dict[str, str] | None = None,
+        timeout: float = 300,
+        max_connections: int = 64,
+        max_keepalive_connections: int = 16,
+        retries: int = 3,
+        backoff: float = 0.5,
+    ):
+        self.endpoint = endpoint
+        self.namespace_manager = namespace_manager
+        self.params = params or {}
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self.retries = retries
+        self.backoff = backoff
+        self.__client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self.__client is None:
+            self.__client = httpx.AsyncClient(
+                timeout=self.timeout, limits=self.limits
+            )
+        return self.__client
+
+    async def aclose(self):
+        if self.__client is not None:
+            await self.__client.aclose()
+            self.__client = None
+
+    def with_prefixes(self, query: str) -> str:
+        if self.namespace_manager is None:
+            return query
+        declared = set(PREFIX_DECLARATION.findall(query))
+        prefixes = [
+            f"PREFIX {prefix}: <{namespace}>"
+            for prefix, namespace in self.namespace_manager.namespaces()
+            if prefix not in declared
+        ]
+        return "\n".join(prefixes + ["", query])
+
+    async def request(
+        self, query: str, accept: str, timeout: float | None = None, stream=False
+    ) -> httpx.Response:
+        """
+        Sends the query, retrying transport errors and 5xx responses. Timeouts are
+        not retried, except for connecting: the endpoint may still be working on
+        the query.
+        With `stream`, retries only cover the time until the response headers
+        arrive and the caller has to close the response.
+        """
+        request = self.client.build_request(
+            "POST",
+            self.endpoint,
+            data={**self.params, "query": self.with_prefixes(query)},
+            headers={"Accept": accept},
+            timeout=timeout if timeout is not None else self.timeout,
+        )
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.client.send(request, stream=stream)
+                if response.status_code < 500 or attempt == self.retries:
+                    if response.is_error:
+                        await response.aclose()
+                    response.raise_for_status()
+                    return response
+                await response.aclose()
+            except httpx.ConnectTimeout:
+                if attempt == self.retries:
+                    raise
+            except httpx.TimeoutException:
+                raise
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+            # exponential backoff with jitter
+            await asyncio.sleep(self.backoff * 2**attempt * (1 + random.random()))
+
+    async def query(self, query: str, timeout: float | None = None) -> SparqlResult:
+        response = await self.request(
+            query, "application/sparql-results+json", timeout=timeout
+        )
+        results = response.json()
+        vars = results["head"].get("vars", [])
+        if "boolean" in results:
+            return SparqlResult(vars, [(Literal(results["boolean"]),)])
+        rows = [
+            tuple(parse_term(binding.get(var)) for var in vars)
+            for binding in results["results"]["bindings"]
+        ]
+        return SparqlResult(vars, rows)
+
+    async def stream(
+        self, query: str, chunk_size: int = 1000, timeout: float | None = None
+    ) -> AsyncIterator[SparqlResult]:
+        """
+        Streams the rows of a SELECT query in chunks as the endpoint sends them.
+        Uses the TSV result format, which can be decoded line by line. At least one
+        (possibly empty) chunk is yielded, so the variables are always known.
+        """
+        response = await self.request(
+            query, "text/tab-separated-values", timeout=timeout, stream=True
+        )
+        try:
+            lines = response.aiter_lines()
+            header = await anext(lines, None)
+            if header is None:
+                yield SparqlResult([], [])
+                return
+            vars = [var.lstrip("?$") for var in header.rstrip("\r").split("\t")]
+            # the same IRIs repeat a lot across rows, so parsed terms are memoised
+            terms: dict[str, object] = {}
+            rows: list[tuple] = []
+            yielded = False
+            async for line in lines:
+                fields = line.rstrip("\r").split("\t")
+                row = []
+                for field in fields:
+                    if field == "":
+                        row.append(None)
+                        continue
+                    term = terms.get(field)
+                    if term is None:
+                        term = from_n3(field)
+                        if len(terms) < 100_000:
+                            terms[field] = term
+                    row.append(term)
+                rows.append(tuple(row))
+                if len(rows) >= chunk_size:
+                    yield SparqlResult(vars, rows)
+                    yielded = True
+                    rows = []
+            if len(rows) > 0 or not yielded:
+                yield SparqlResult(vars, rows)
+        finally:
+            await response.aclose()
@@ -0,0 +1,101 @@
+import os
+import random
+import sys
+
+import networkx as nx
+import pytest
+from rdflib import Graph
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from explorative.class_hierarchy import ClassHierarchy  # noqa: E402
+from explorative.exp_model import SubjectClosureDB  # noqa: E402
+from ontology import OntologyConfig, OntologyManager  # noqa: E402
+
+PREFIXES = """
+@prefix bto: <https://w3id.org/brainteaser/ontology/schema/> .
+@prefix owl: <http://www.w3.org/2002/07/owl#> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+"""
+
+
+def random_hierarchy(seed: int, n=30, n_edges=45) -> nx.DiGraph:
+    """Subclass edges (child -> parent), with cycles, self loops and several roots."""
+    rng = random.Random(seed)
+    graph = nx.DiGraph()
+    graph.add_nodes_from(f"bto:C{i}" for i in range(n))
+    for _ in range(n_edges):
+        graph.add_edge(f"bto:C{rng.randrange(n)}", f"bto:C{rng.randrange(n)}")
+    return graph
+
+
+def make_hierarchy(graph: nx.DiGraph, engine) -> ClassHierarchy:
+    ttl = PREFIXES + "".join(f"{cls} a owl:Class .\n" for cls in graph.nodes)
+    ttl += "".join(f"{cls} rdfs:subClassOf {parent} .\n" for cls, parent in graph.edges)
+    onto = Graph().parse(data=ttl, format="turtle")
+    onto.bind("bto", "https://w3id.org/brainteaser/ontology/schema/")
+    oman = OntologyManager(OntologyConfig(), onto)
+    return ClassHierarchy(oman, engine, "onto-a")
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    SubjectClosureDB.__table__.create(engine)
+    return engine
+
+
+def assert_matches(hierarchy: ClassHierarchy, graph: nx.DiGraph):
+    for cls in graph.nodes:
+        ancestors = nx.descendants(graph, cls) | {cls}
+        descendants = nx.ancestors(graph, cls) | {cls}
+        assert set(hierarchy.parents(cls)) == ancestors
+        assert sorted(hierarchy.subclasses(cls)) == sorted(descendants)
+        for other in graph.nodes:
+            assert hierarchy.is_subclass(cls, other) == (other in ancestors)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_closure_matches_reachability(engine, seed):
+    graph = random_hierarchy(seed)
+    hierarchy = make_hierarchy(graph, engine)
+    hierarchy.build()
+    assert_matches(hierarchy, graph)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_loaded_closure_matches_built(engine, seed):
+    graph = random_hierarchy(seed)
+    make_hierarchy(graph, engine).build()
+    loaded = make_hierarchy(graph, engine)
+    assert loaded.load()
+    assert_matches(loaded, graph)
+
+
+def test_ancestors_have_shortest_depth(engine):
+    graph = nx.DiGraph(
+        [
+            ("bto:Patient", "bto:Person"),
+            ("bto:Person", "bto:Thing"),
+            ("bto:Patient", "bto:Thing"),
+            ("bto:Thing", "bto:Patient"),
+        ]
+    )
+    graph.add_node("bto:Place")
+    hierarchy = make_hierarchy(graph, engine)
+    hierarchy.build()
+    assert dict(hierarchy.ancestors("bto:Patient")) == {
+        "bto:Patient": 0,
+        "bto:Person": 1,
+        "bto:Thing": 1,
+    }
+    assert hierarchy.parents("bto:Place") == ["bto:Place"]
+    assert hierarchy.parents("bto:Unknown") is None
+    assert not hierarchy.is_subclass("bto:Unknown", "bto:Thing")
+
+
+def test_load_without_stored_closure(engine):
+    hierarchy = make_hierarchy(random_hierarchy(0), engine)
+    assert not hierarchy.load()
+    assert not hierarchy.loaded
@@ -0,0 +1,127 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from rdflib import Graph
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from ontology import OntologyConfig, OntologyManager  # noqa: E402
+from ontology_cache import OntologyCache  # noqa: E402
+from sparql_client import SparqlResult  # noqa: E402
+
+TTL = """
+@prefix bto: <https://w3id.org/brainteaser/ontology/schema/> .
+@prefix owl: <http://www.w3.org/2002/07/owl#> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+@prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#> .
+@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+bto:Thing a owl:Class ; rdfs:label "thing"@en .
+bto:Person a owl:Class ; rdfs:label "person"@en ; rdfs:subClassOf bto:Thing .
+bto:Patient a owl:Class ; rdfs:label "patient"@en ; rdfs:subClassOf bto:Person .
+bto:Place a owl:Class ; rdfs:label "place"@en ; rdfs:subClassOf bto:Thing .
+bto:livesIn a owl:ObjectProperty ; rdfs:label "lives in"@en ;
+    rdfs:domain bto:Person ; rdfs:range bto:Place .
+bto:age a owl:DatatypeProperty ; rdfs:label "age"@en ;
+    rdfs:domain bto:Person ; rdfs:range xsd:int .
+bto:p1 a bto:Patient, owl:NamedIndividual ; rdfs:label "alice"@en ;
+    bto:age "42"^^xsd:int ; bto:livesIn bto:graz .
+bto:p2 a bto:Patient ; rdfs:label "bob"@en .
+bto:graz a bto:Place, owl:NamedIndividual ; rdfs:label "graz"@en .
+"""
+SUBJECTS = [
+    "bto:Thing",
+    "bto:Person",
+    "bto:Patient",
+    "bto:Place",
+    "bto:p1",
+    "bto:graz",
+]
+
+
+def make_oman(ttl: str = TTL) -> OntologyManager:
+    graph = Graph().parse(data=ttl, format="turtle")
+    graph.bind("bto", "https://w3id.org/brainteaser/ontology/schema/")
+    return OntologyManager(OntologyConfig(), graph, cache=OntologyCache())
+
+
+class GraphClient:
+    """Answers the async queries from the local graph, one at a time."""
+
+    def __init__(self, graph: Graph):
+        self.graph = graph
+
+    async def query(self, q: str, timeout: float | None = None) -> SparqlResult:
+        result_set = self.graph.query(q)
+        return SparqlResult(
+            [str(var) for var in result_set.vars], [tuple(r) for r in result_set]
+        )
+
+
+def single(ttl: str, subject: str, **kwargs):
+    # a fresh manager per subject, so nothing is shared through the cache
+    return make_oman(ttl).enrich_subjects([subject], **kwargs)[0]
+
+
+@pytest.mark.parametrize("load_properties", [False, True])
+def test_batches_match_single_subjects(load_properties):
+    batched = make_oman().enrich_subjects(
+        SUBJECTS, load_properties=load_properties, batch_size=4
+    )
+    assert batched == [
+        single(TTL, subject, load_properties=load_properties) for subject in SUBJECTS
+    ]
+
+
+def test_result_is_aligned_with_input():
+    oman = make_oman()
+    enriched = oman.enrich_subjects(["bto:Place", None, "bto:Person", "bto:Place"])
+    assert enriched[1] is None
+    assert [s.subject_id for s in enriched if s is not None] == [
+        "bto:Place",
+        "bto:Person",
+        "bto:Place",
+    ]
+    assert enriched[0] == enriched[3]
+
+
+def test_loads_edges_counts_and_properties():
+    oman = make_oman()
+    patient, person = oman.enrich_subjects(
+        ["bto:Patient", "bto:Person"], load_properties=True
+    )
+    assert patient.label == "patient"
+    assert patient.instance_count == 2
+    assert [v.value for v in patient.spos["rdfs:subClassOf"].values] == ["bto:Person"]
+    assert {p.subject_id for p in person.properties["owl:ObjectProperty"]} == {
+        "bto:livesIn"
+    }
+    assert {p.subject_id for p in person.properties["owl:DatatypeProperty"]} == {
+        "bto:age"
+    }
+
+
+def test_subject_with_many_edges_does_not_starve_others():
+    # 400 rdf:type rows fill the LIMIT of a batch of three on their own
+    types = "\n".join(f"bto:Big a bto:T{i} ." for i in range(400))
+    ttl = TTL + types
+    subjects = ["bto:Big", "bto:Person", "bto:Patient"]
+    big, person, patient = make_oman(ttl).enrich_subjects(subjects)
+    assert person == single(ttl, "bto:Person")
+    assert patient == single(ttl, "bto:Patient")
+    assert sum(len(p.values) for p in big.spos.values()) == 128
+
+
+def test_async_matches_sync():
+    oman = make_oman()
+    oman.sparql_client = GraphClient(oman.onto)
+    enriched = asyncio.run(oman.aenrich_subjects(SUBJECTS + [None], batch_size=4))
+    assert enriched == make_oman().enrich_subjects(SUBJECTS + [None])
+
+
+def test_cached_subjects_are_served_without_queries():
+    oman = make_oman()
+    first = oman.enrich_subjects(SUBJECTS)
+    oman.onto = Graph()
+    assert oman.enrich_subjects(SUBJECTS) == first
@@ -0,0 +1,114 @@
+import os
+import sys
+
+import fakeredis
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from job_queue import JobLane, JobQueue, JobStatus, JobSuperseded  # noqa: E402
+
+
+@pytest.fixture
+def queue():
+    return JobQueue(fakeredis.FakeRedis(), lease_seconds=60)
+
+
+def expire_leases(queue: JobQueue):
+    queue.redis.zadd("jobs:leases", {job_id: 0 for job_id in leased(queue)})
+
+
+def leased(queue: JobQueue) -> list[bytes]:
+    return queue.redis.zrange("jobs:leases", 0, -1)
+
+
+def test_claims_interactive_before_batch(queue):
+    batch = queue.submit({}, lane=JobLane.BATCH)
+    interactive = queue.submit({}, lane=JobLane.INTERACTIVE)
+    assert queue.claim(timeout=0.1).id == interactive.id
+    assert queue.claim(timeout=0.1).id == batch.id
+    assert queue.claim(timeout=0.1) is None
+
+
+def test_recovers_job_of_worker_stopped_after_pop(queue):
+    job = queue.submit({})
+    # the worker moved the job out of its lane and stopped before starting it
+    queue.redis.lmove("jobs:lane:interactive", "jobs:processing", "RIGHT", "LEFT")
+    assert queue.claim(timeout=0.1) is None
+
+    queue.requeue_expired()
+    assert leased(queue) == [job.id.encode()]
+    expire_leases(queue)
+    queue.requeue_expired()
+
+    assert queue.get(job.id).status == JobStatus.QUEUED
+    assert queue.redis.lrange("jobs:processing", 0, -1) == []
+    claimed = queue.claim(timeout=0.1)
+    assert claimed.id == job.id
+    assert claimed.attempts == 1
+
+
+def test_requeues_running_job_with_expired_lease(queue):
+    job = queue.submit({})
+    assert queue.claim(timeout=0.1).id == job.id
+    expire_leases(queue)
+    queue.requeue_expired()
+
+    assert queue.get(job.id).status == JobStatus.QUEUED
+    assert queue.claim(timeout=0.1).attempts == 2
+    expire_leases(queue)
+    queue.requeue_expired()
+
+    failed = queue.get(job.id)
+    assert failed.status == JobStatus.FAILED
+    assert failed.error == "Worker lease expired"
+    assert queue.redis.lrange("jobs:processing", 0, -1) == []
+
+
+def test_cancelled_while_claimed(queue):
+    job = queue.submit({})
+    queue.redis.lmove("jobs:lane:interactive", "jobs:processing", "RIGHT", "LEFT")
+    assert queue.cancel(job.id).status == JobStatus.CANCELLED
+
+    queue.requeue_expired()
+    expire_leases(queue)
+    queue.requeue_expired()
+
+    assert queue.get(job.id).status == JobStatus.CANCELLED
+    assert queue.redis.lrange("jobs:processing", 0, -1) == []
+    assert queue.claim(timeout=0.1) is None
+
+
+def test_complete_clears_lease_and_processing(queue):
+    job = queue.submit({})
+    queue.claim(timeout=0.1)
+    queue.complete(job.id, 1)
+
+    assert queue.get(job.id).status == JobStatus.DONE
+    assert leased(queue) == []
+    assert queue.redis.lrange("jobs:processing", 0, -1) == []
+    assert queue.requeue_expired() == 0
+
+
+def test_superseded_attempt_can_not_renew_or_finish(queue):
+    job = queue.submit({})
+    queue.claim(timeout=0.1)
+    expire_leases(queue)
+    queue.requeue_expired()
+
+    # the first worker's heartbeat must not bring the dropped lease back
+    queue.renew(job.id, 1)
+    assert leased(queue) == []
+    with pytest.raises(JobSuperseded):
+        queue.checkpoint(job.id, 1)
+
+    assert queue.claim(timeout=0.1).attempts == 2
+    queue.renew(job.id, 1)
+    queue.complete(job.id, 1)
+    assert queue.get(job.id).status == JobStatus.RUNNING
+    assert queue.redis.lrange("jobs:processing", 0, -1) == [job.id.encode()]
+
+    queue.checkpoint(job.id, 2)
+    queue.complete(job.id, 2)
+    assert queue.get(job.id).status == JobStatus.DONE
+    assert leased(queue) == []
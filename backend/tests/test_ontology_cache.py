@@ -0,0 +1,145 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from pydantic import TypeAdapter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from ontology_cache import (  # noqa: E402
+    MISSING,
+    OntologyCache,
+    _BoundedTTLCache,
+    cached,
+    caching_scope,
+    skip_caching,
+)
+
+LIST_ADAPTER = TypeAdapter(list[int])
+
+
+class SharedTier:
+    """In-memory stand-in for the shared tier (`RedisCache`)."""
+
+    def __init__(self, fail=False):
+        self.data: dict[str, bytes] = {}
+        self.fail = fail
+
+    def get_raw(self, key: str) -> bytes | None:
+        if self.fail:
+            raise ConnectionError("shared tier down")
+        return self.data.get(key)
+
+    def set_raw(self, key: str, data: bytes, ttl: int):
+        if self.fail:
+            raise ConnectionError("shared tier down")
+        self.data[key] = data
+
+
+class Lookups:
+    def __init__(self, cache: OntologyCache, identifier="onto-a"):
+        self.cache = cache
+        self.identifier = identifier
+        self.calls = 0
+        self.fail = False
+
+    @cached("numbers", list[int])
+    def numbers(self, n: int) -> list[int]:
+        self.calls += 1
+        if self.fail:
+            skip_caching()
+            return []
+        return list(range(n))
+
+    @cached("numbers", list[int])
+    async def anumbers(self, n: int) -> list[int]:
+        return self.numbers(n)
+
+
+def test_evicts_least_recently_used_by_count():
+    cache = _BoundedTTLCache(max_items=2, max_bytes=1024, ttl=60)
+    cache["a"] = b"1"
+    cache["b"] = b"2"
+    cache["a"]
+    cache["c"] = b"3"
+    assert set(cache) == {"a", "c"}
+
+
+def test_evicts_by_size():
+    cache = _BoundedTTLCache(max_items=10, max_bytes=10, ttl=60)
+    cache["a"] = b"123456"
+    cache["b"] = b"123456"
+    assert set(cache) == {"b"}
+    with pytest.raises(ValueError):
+        cache["c"] = b"12345678901"
+
+
+def test_hands_out_copies():
+    cache = OntologyCache()
+    cache.set("key", [1, 2], LIST_ADAPTER)
+    first = cache.get("key", LIST_ADAPTER)
+    first.append(3)
+    assert cache.get("key", LIST_ADAPTER) == [1, 2]
+
+
+def test_keys_are_scoped_to_the_ontology():
+    cache = OntologyCache()
+    a, b = Lookups(cache, "onto-a"), Lookups(cache, "onto-b")
+    assert a.numbers(3) == b.numbers(3) == [0, 1, 2]
+    assert a.calls == b.calls == 1
+    assert cache.key("onto-a", "numbers", 3) != cache.key("onto-b", "numbers", 3)
+
+
+def test_shared_tier_fills_local_tier():
+    shared = SharedTier()
+    OntologyCache(redis_cache=shared).set("key", [1], LIST_ADAPTER)
+    cache = OntologyCache(redis_cache=shared)
+    assert cache.get("key", LIST_ADAPTER) == [1]
+    assert "key" in cache.local
+
+
+def test_oversized_shared_hit_is_not_kept_locally():
+    shared = SharedTier()
+    OntologyCache(redis_cache=shared).set("key", list(range(100)), LIST_ADAPTER)
+    cache = OntologyCache(max_bytes=16, redis_cache=shared)
+    assert cache.get("key", LIST_ADAPTER) == list(range(100))
+    assert "key" not in cache.local
+
+
+def test_failing_shared_tier_falls_back_to_local():
+    cache = OntologyCache(redis_cache=SharedTier(fail=True))
+    assert cache.get("key", LIST_ADAPTER) is MISSING
+    cache.set("key", [1], LIST_ADAPTER)
+    assert cache.get("key", LIST_ADAPTER) == [1]
+
+
+def test_skip_propagates_to_outer_scopes_only():
+    with caching_scope() as outer:
+        with caching_scope() as inner:
+            skip_caching()
+        with caching_scope() as sibling:
+            pass
+    assert inner.skipped
+    assert not sibling.skipped
+    assert outer.skipped
+    with caching_scope() as after:
+        pass
+    assert not after.skipped
+
+
+def test_skipped_results_are_not_cached():
+    lookups = Lookups(OntologyCache())
+    lookups.fail = True
+    assert lookups.numbers(3) == []
+    lookups.fail = False
+    assert lookups.numbers(3) == [0, 1, 2]
+    assert lookups.numbers(3) == [0, 1, 2]
+    assert lookups.calls == 2
+
+
+def test_async_methods_share_the_cache():
+    lookups = Lookups(OntologyCache())
+    assert asyncio.run(lookups.anumbers(2)) == [0, 1]
+    assert asyncio.run(lookups.anumbers(2)) == [0, 1]
+    assert lookups.calls == 1
@@ -0,0 +1,82 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath("../../backend/src"))
+
+import argparse
+import time
+
+import pandas as pd
+
+from eval_config import EmbeddingBackend
+from explorative.embedding_backend import (
+    PARITY_TEXTS,
+    PARITY_THRESHOLD,
+    load_backend,
+    load_reference,
+    parity,
+)
+
+parser = argparse.ArgumentParser(
+    description="Encode throughput and fp32 parity of the embedding backends"
+)
+parser.add_argument(
+    "--backends",
+    nargs="+",
+    choices=[b.value for b in EmbeddingBackend],
+    default=[b.value for b in EmbeddingBackend],
+)
+parser.add_argument("--texts", type=str, default=None, help="file, one text per line")
+parser.add_argument("--n", type=int, default=512, help="texts to encode")
+parser.add_argument("--batch-size", type=int, default=32)
+parser.add_argument("--threads", type=int, default=None)
+parser.add_argument("--export-dir", type=str, default="../../data/onnx")
+parser.add_argument("--quantization", type=str, default="avx2")
+parser.add_argument("--out", type=str, default="tables/embedding_bench.csv")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.threads is not None:
+        import torch
+
+        torch.set_num_threads(args.threads)
+    if args.texts is not None:
+        with open(args.texts) as f:
+            texts = [line.strip() for line in f if len(line.strip()) > 0]
+    else:
+        texts = PARITY_TEXTS
+    texts = [texts[i % len(texts)] for i in range(args.n)]
+
+    reference = load_reference("cpu")
+    rows = []
+    for backend in map(EmbeddingBackend, args.backends):
+        model = (
+            reference
+            if backend == EmbeddingBackend.TORCH
+            else load_backend(backend, args.export_dir, args.quantization)
+        )
+        # warm up, the first call includes graph setup
+        model.encode(texts[: args.batch_size], batch_size=args.batch_size)
+        start = time.perf_counter()
+        model.encode(texts, batch_size=args.batch_size, prompt_name="s2p_query")
+        seconds = time.perf_counter() - start
+        report = parity(reference, model, backend)
+        rows.append(
+            {
+                "backend": backend.value,
+                "texts": len(texts),
+                "seconds": seconds,
+                "texts_per_second": len(texts) / seconds,
+                "min_cosine": report.min_cosine,
+                "mean_cosine": report.mean_cosine,
+                "parity": report.passed,
+            }
+        )
+        print(rows[-1])
+
+    df = pd.DataFrame(rows)
+    print(df.to_string(index=False))
+    df.to_csv(args.out, index=False)
+    if not df["parity"].all():
+        print("Backends below a cosine of", PARITY_THRESHOLD, "to fp32")
+        sys.exit(1)
@@ -0,0 +1,81 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath("../../backend/src"))
+
+import argparse
+import glob
+
+import pandas as pd
+from rdflib.plugins.stores.sparqlstore import SPARQLStore
+
+from eval_config import ALL_CONFIG_MAP, EmbeddingReduction, EvalConfig
+from explorative.explorative_support import GuidanceManager
+from explorative.llm_query_gen import EnrichedEntitiesRelations
+from ontology import Graph, OntologyConfig, OntologyManager
+
+parser = argparse.ArgumentParser(
+    description="Recall of reduced-dimension embedding search on the eval query sets. "
+    "Rebuilds the reduced vectors of the ontology for every setting and restores "
+    "the configured one at the end."
+)
+parser.add_argument("--dataset", type=str, choices=list(ALL_CONFIG_MAP.keys()))
+parser.add_argument("--cfg_idx", type=int, default=-1)
+parser.add_argument("--dims", type=int, nargs="+", default=[128, 256, 512])
+parser.add_argument(
+    "--reductions",
+    nargs="+",
+    choices=[r.value for r in EmbeddingReduction],
+    default=[r.value for r in EmbeddingReduction],
+)
+parser.add_argument("--rerank", type=int, nargs="+", default=[0, 4])
+parser.add_argument("--k", type=int, default=25)
+parser.add_argument("--n_samples", type=int, default=None)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    setup: EvalConfig = ALL_CONFIG_MAP[args.dataset][args.cfg_idx]
+    setup_base = ALL_CONFIG_MAP[args.dataset][-1]
+
+    store = SPARQLStore(
+        setup.sparql_endpoint,
+        method="POST_FORM",
+        params={"infer": False, "sameAs": False},
+    )
+    ontology_manager = OntologyManager(OntologyConfig(), Graph(store=store))
+    guidance = GuidanceManager(
+        ontology_manager, conn_str=setup.conn_str, search_config=setup
+    )
+
+    # the questions and the entity types and relations the search has to find
+    csvs = glob.glob(f"examples/examples_{setup_base.name}*.csv")
+    examples = pd.concat([pd.read_csv(csv, index_col=0) for csv in csvs])
+    if args.n_samples is not None:
+        examples = examples.sample(args.n_samples, random_state=42)
+    queries = set(examples["response"])
+    for erl in examples["erl"]:
+        erl = EnrichedEntitiesRelations.model_validate_json(erl)
+        queries.update(entity.type for entity in erl.entities)
+        queries.update(relation.relation for relation in erl.relations)
+    queries = sorted(queries)
+    print("Evaluating", len(queries), "queries")
+
+    rows = []
+    for reduction in map(EmbeddingReduction, args.reductions):
+        for dims in args.dims:
+            guidance.projection.config = setup.model_copy(
+                update={"embedding_dims": dims, "embedding_reduction": reduction}
+            )
+            guidance.projection.build()
+            for rerank in args.rerank:
+                guidance.projection.config.embedding_rerank = rerank or None
+                for report in guidance.projection_report(queries, k=args.k):
+                    rows.append(report.model_dump())
+                    print(rows[-1])
+
+    guidance.projection.config = setup
+    guidance.projection.build()
+
+    df = pd.DataFrame(rows)
+    print(df.to_string(index=False))
+    df.to_csv(f"tables/embedding_dims_{setup_base.name}.csv", index=False)